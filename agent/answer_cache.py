@@ -0,0 +1,283 @@
+"""
+Persistent semantic answer cache for the agent.
+
+Repeat questions ("penalty for smog check violations") used to cost an
+embedding call, a vector query and an llm.invoke every time. The cache answers
+them from data/answer_cache.sqlite instead:
+
+1. Exact match on the normalized question (lowercase, punctuation and extra
+   whitespace stripped). No API calls at all.
+2. Near-duplicate match: cosine similarity between query embeddings above
+   ANSWER_CACHE_THRESHOLD. Questions naming different sections never match,
+   however similar their wording.
+
+Entries expire after ANSWER_CACHE_TTL_DAYS, the least recently used ones are
+evicted past ANSWER_CACHE_SIZE, and refresh.py invalidates every answer that
+cited a section it changed (by Westlaw document GUID).
+
+Usage:
+    python agent/answer_cache.py stats
+    python agent/answer_cache.py clear
+"""
+import json
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from crawler.html_store import document_guid
+from indexer.keyword_index import citation_keys_from_query
+
+ANSWER_CACHE_FILE = "data/answer_cache.sqlite"
+DEFAULT_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+DEFAULT_TTL = float(os.getenv("ANSWER_CACHE_TTL_DAYS", "7")) * 86400
+DEFAULT_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_SIZE", "5000"))
+
+NORMALIZE_RE = re.compile(r"[^\w§.]+")
+
+
+def normalize_query(query):
+    return " ".join(NORMALIZE_RE.sub(" ", query.lower()).replace(". ", " ").split()).rstrip(".")
+
+
+def _unit(vector):
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class AnswerCache:
+    def __init__(self, path=ANSWER_CACHE_FILE, embedding=None, model="",
+                 threshold=DEFAULT_THRESHOLD, ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.embedding = embedding
+        self.model = model
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # The agent server calls in from worker threads; self.lock guards the connection and the matrix
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.RLock()
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS answers (
+                key TEXT PRIMARY KEY, query TEXT, answer TEXT, model TEXT, vector BLOB,
+                citations TEXT, created_at REAL, last_used REAL, hits INTEGER DEFAULT 0, sources TEXT
+            );
+            CREATE TABLE IF NOT EXISTS answer_sources (guid TEXT, key TEXT, PRIMARY KEY (guid, key)) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, value INTEGER) WITHOUT ROWID;
+        """)
+        # Caches written before answers kept their source list; those entries come back with no sources
+        if "sources" not in {row[1] for row in self.conn.execute("PRAGMA table_info(answers)")}:
+            self.conn.execute("ALTER TABLE answers ADD COLUMN sources TEXT")
+            self.conn.commit()
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self._pending_vectors = {}  # query -> embedding computed by get(), reused by put()
+
+        # Near-duplicate search runs over an in-memory matrix of this model's entries
+        self._keys, self._citations, vectors = [], [], []
+        for key, blob, citations in self.conn.execute(
+            "SELECT key, vector, citations FROM answers WHERE model = ? AND vector IS NOT NULL", (model,)
+        ):
+            self._keys.append(key)
+            self._citations.append(citations)
+            vectors.append(np.frombuffer(blob, dtype=np.float32))
+        self._matrix = np.vstack(vectors) if vectors else None
+
+    # --- LOOKUPS ---
+    def get(self, query):
+        """
+        Returns {"answer", "match", "similarity", "sources"} or None, where
+        sources is the [{"citation", "url"}] list stored by put(). Never raises on an
+        embedding error; the caller just answers the question normally.
+        """
+        now = time.time()
+        key = normalize_query(query)
+        with self.lock:
+            row = self.conn.execute("SELECT answer, created_at, sources FROM answers WHERE key = ?", (key,)).fetchone()
+            if row and now - row[1] <= self.ttl:
+                self._touch(key, now, "exact_hits")
+                self.exact_hits += 1
+                return {"answer": row[0], "match": "exact", "similarity": 1.0, "sources": json.loads(row[2] or "[]")}
+
+        match = self._nearest(query, now)
+        with self.lock:
+            if match:
+                self.semantic_hits += 1
+                return match
+            self.misses += 1
+            self._count("misses")
+        return None
+
+    def _nearest(self, query, now):
+        if self.embedding is None or not self.threshold or self._matrix is None:
+            return None
+        try:
+            vector = _unit(self.embedding.embed_query(query))
+        except Exception as e:
+            print(f"\n⚠️ Answer cache skipped similarity check: {e}")
+            return None
+        citations = json.dumps(sorted(citation_keys_from_query(query)))
+
+        with self.lock:
+            if len(self._pending_vectors) > 256:
+                self._pending_vectors.clear()  # Lookups that never got an answer stored
+            self._pending_vectors[query] = vector
+            if self._matrix is None:
+                return None
+            similarities = self._matrix @ vector
+            for i in np.argsort(-similarities):
+                if similarities[i] < self.threshold:
+                    break
+                if self._citations[i] != citations:
+                    continue  # "§ 2030" and "§ 2031" questions embed almost identically
+                key = self._keys[i]
+                row = self.conn.execute("SELECT answer, created_at, sources FROM answers WHERE key = ?",
+                                        (key,)).fetchone()
+                if row and now - row[1] <= self.ttl:
+                    self._touch(key, now, "semantic_hits")
+                    return {"answer": row[0], "match": "semantic", "similarity": float(similarities[i]),
+                            "sources": json.loads(row[2] or "[]")}
+        return None
+
+    def _touch(self, key, now, counter):
+        self.conn.execute("UPDATE answers SET last_used = ?, hits = hits + 1 WHERE key = ?", (now, key))
+        self._count(counter)
+
+    def _count(self, name):
+        self.conn.execute(
+            "INSERT INTO stats (name, value) VALUES (?, 1) ON CONFLICT(name) DO UPDATE SET value = value + 1", (name,)
+        )
+        self.conn.commit()
+
+    # --- WRITES ---
+    def put(self, query, answer, sources):
+        """
+        sources: the passages the answer was generated from, as source_list()'s
+        [{"citation", "url"}] (or bare URLs). Their GUIDs drive invalidation, and
+        get() hands the list back so a cached answer keeps its citations.
+        """
+        key = normalize_query(query)
+        now = time.time()
+        with self.lock:
+            vector = self._pending_vectors.pop(query, None)
+        if vector is None and self.embedding is not None:
+            try:
+                vector = _unit(self.embedding.embed_query(query))
+            except Exception:
+                vector = None  # Still cached for exact matches
+        citations = json.dumps(sorted(citation_keys_from_query(query)))
+
+        with self.lock:
+            self._store(key, query, answer, sources, vector, citations, now)
+
+    def _store(self, key, query, answer, sources, vector, citations, now):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO answers (key, query, answer, model, vector, citations, created_at, last_used, hits, "
+            "sources) VALUES (?, ?, ?, ?, ?, ?, ?, ?, 0, ?)",
+            (key, query, answer, self.model, vector.tobytes() if vector is not None else None, citations, now, now,
+             json.dumps(sources))
+        )
+        self.conn.execute("DELETE FROM answer_sources WHERE key = ?", (key,))
+        urls = [source["url"] if isinstance(source, dict) else source for source in sources]
+        self.conn.executemany(
+            "INSERT OR IGNORE INTO answer_sources (guid, key) VALUES (?, ?)",
+            [(document_guid(url), key) for url in urls if url]
+        )
+        self._evict(now)
+        self.conn.commit()
+        self._forget([key])
+        if vector is not None:
+            self._keys.append(key)
+            self._citations.append(citations)
+            self._matrix = vector[None, :] if self._matrix is None else np.vstack([self._matrix, vector])
+
+    def _evict(self, now):
+        expired = [k for (k,) in self.conn.execute("SELECT key FROM answers WHERE created_at < ?", (now - self.ttl,))]
+        count = self.conn.execute("SELECT COUNT(*) FROM answers").fetchone()[0] - len(expired)
+        if count > self.max_entries:
+            expired += [k for (k,) in self.conn.execute(
+                "SELECT key FROM answers WHERE created_at >= ? ORDER BY last_used LIMIT ?",
+                (now - self.ttl, count - self.max_entries)
+            )]
+        self._delete(expired)
+
+    def invalidate(self, guids):
+        """Drops every answer that cited one of these document GUIDs. Returns how many."""
+        keys = set()
+        with self.lock:
+            for guid in guids:
+                keys.update(k for (k,) in self.conn.execute("SELECT key FROM answer_sources WHERE guid = ?", (guid,)))
+            self._delete(keys)
+            self.conn.commit()
+        return len(keys)
+
+    def clear(self):
+        with self.lock:
+            self.conn.execute("DELETE FROM answers")
+            self.conn.execute("DELETE FROM answer_sources")
+            self.conn.commit()
+            self._keys, self._citations, self._matrix = [], [], None
+
+    def _delete(self, keys):
+        keys = list(keys)
+        if not keys:
+            return
+        self.conn.executemany("DELETE FROM answers WHERE key = ?", [(k,) for k in keys])
+        self.conn.executemany("DELETE FROM answer_sources WHERE key = ?", [(k,) for k in keys])
+        self._forget(keys)
+
+    def _forget(self, keys):
+        drop = set(keys)
+        keep = [i for i, k in enumerate(self._keys) if k not in drop]
+        if len(keep) == len(self._keys):
+            return
+        self._keys = [self._keys[i] for i in keep]
+        self._citations = [self._citations[i] for i in keep]
+        self._matrix = self._matrix[keep] if keep else None
+
+    # --- REPORTING ---
+    def hit_rate(self):
+        total = self.exact_hits + self.semantic_hits + self.misses
+        return (self.exact_hits + self.semantic_hits) / total if total else 0.0
+
+    def summary(self):
+        return (f"{self.hit_rate():.0%} hit rate ({self.exact_hits} exact, "
+                f"{self.semantic_hits} similar, {self.misses} misses)")
+
+    def close(self):
+        self.conn.close()
+
+
+def main():
+    if len(sys.argv) < 2 or sys.argv[1] not in ("stats", "clear"):
+        print(__doc__)
+        return
+
+    cache = AnswerCache()
+    if sys.argv[1] == "clear":
+        cache.clear()
+        print("🗑️  Answer cache cleared.")
+        return
+
+    entries = cache.conn.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+    stats = dict(cache.conn.execute("SELECT name, value FROM stats"))
+    exact, semantic, misses = (stats.get(n, 0) for n in ("exact_hits", "semantic_hits", "misses"))
+    total = exact + semantic + misses
+    print(f"💾 {entries} cached answers")
+    print(f"   Lifetime: {total} lookups, {(exact + semantic) / total if total else 0:.1%} hit rate "
+          f"({exact} exact, {semantic} similar, {misses} misses)")
+    for query, hits in cache.conn.execute("SELECT query, hits FROM answers ORDER BY hits DESC LIMIT 5"):
+        print(f"   {hits:>5} x {query}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,220 @@
+"""
+Batch question mode: answer a JSONL list of questions without the REPL.
+
+Each input line needs a question ("question", else "body", else "title") and
+ideally an id ("id" or "request_id"; the line number otherwise). Questions are
+read in batches of --batch-size; each batch is embedded in ONE API call (the
+vectors land in the embedding cache, so the vector searches that follow are
+cache hits), then retrieval and generation run concurrently, --concurrency
+questions at a time. Gemini and embedding calls share the process-wide quota
+limiter (common/rate_limit.py); --rpm overrides GEMINI_RPM for this run.
+
+Every answer is appended to the output as soon as it is ready:
+    {"id", "question", "answer", "citations": [{"citation", "url"}],
+     "cached", "context": {"tokens_full", "tokens_used", "tokens_saved", ...},
+     "timings": {"embed_ms", "retrieve_ms", "generate_ms", "total_ms"}}
+Failures are written with an "error" field instead. Re-running with the same
+output skips ids that already have an answer, so an interrupted run resumes.
+
+Usage:
+    python agent/batch_answer.py questions.jsonl [--output data/batch_answers.jsonl]
+"""
+import argparse
+import asyncio
+import contextvars
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from agent.pipeline import (TOP_K, build_prompt, check_keys, chunk_text, is_cacheable, load_answer_cache, load_llm,
+                            load_retriever, load_vectorstore, source_list)
+from common.jsonl_reader import JsonlReader
+from common.rate_limit import QUOTAS, configure_quota, get_limiter
+from common.tracing import span
+
+# --- CONFIGURATION ---
+OUTPUT_FILE = "data/batch_answers.jsonl"
+BATCH_SIZE = 16   # Questions embedded per API call
+CONCURRENCY = 8   # Questions in retrieval/generation at once
+LLM_RPM = QUOTAS["gemini"][0]
+
+
+def question_of(record):
+    return str(record.get("question") or record.get("body") or record.get("title") or "").strip()
+
+
+def load_answered(output_file):
+    # Only successful answers count; errored ids are retried on the next run
+    answered = set()
+    if os.path.exists(output_file):
+        for record in JsonlReader(output_file, required_keys=("id",)):
+            if "error" not in record:
+                answered.add(str(record["id"]))
+    return answered
+
+
+class BatchAnswerer:
+    def __init__(self, retriever, embeddings, llm, answer_cache, out, concurrency):
+        self.retriever = retriever
+        self.embeddings = embeddings
+        self.llm = llm
+        self.answer_cache = answer_cache
+        self.out = out
+        self.executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="retrieval")
+        self.slots = asyncio.Semaphore(concurrency)
+        self.answered = 0
+        self.failed = 0
+        self.cached = 0
+        self.tokens_saved = 0
+
+    async def run_blocking(self, fn, *args):
+        ctx = contextvars.copy_context()  # Spans on the worker thread nest under the caller's
+        return await asyncio.get_running_loop().run_in_executor(self.executor, ctx.run, fn, *args)
+
+    async def embed_batch(self, batch):
+        # One API call for the whole batch; the cache then serves each search's query vector
+        started = time.perf_counter()
+        questions = [item["question"] for item in batch]
+        try:
+            with span("batch.embed", questions=len(questions)):
+                await self.run_blocking(self.embeddings.embed_queries, questions)
+        except Exception as e:
+            # Not fatal: each search embeds its own query instead
+            print(f"   ⚠️ Batch embedding failed ({e}); falling back to one call per question")
+            return None
+        return round((time.perf_counter() - started) * 1000)
+
+    async def answer(self, item, embed_ms):
+        started = time.perf_counter()
+        result = {"id": item["id"], "question": item["question"]}
+        with span("batch.answer", id=item["id"]) as root:
+            try:
+                timings = {"embed_ms": embed_ms}
+                cached = None
+                if self.answer_cache:
+                    cached = await self.run_blocking(self.answer_cache.get, item["question"])
+                if cached:
+                    self.cached += 1
+                    result.update(answer=cached["answer"], citations=cached["sources"], cached=cached["match"])
+                else:
+                    t0 = time.perf_counter()
+                    with span("retrieve") as s:
+                        search_results = await self.run_blocking(self.retriever.search, item["question"], TOP_K)
+                        s.set(results=len(search_results))
+                    timings["retrieve_ms"] = round((time.perf_counter() - t0) * 1000)
+
+                    if not search_results:
+                        result.update(answer="I couldn't find any relevant documents.", citations=[], cached=None)
+                    else:
+                        t0 = time.perf_counter()
+                        with span("build_prompt"):
+                            prompt, context = build_prompt(search_results, item["question"])
+                        self.tokens_saved += context["tokens_saved"]
+                        with span("llm.generate"):
+                            response = await self.llm.ainvoke(prompt)
+                        timings["generate_ms"] = round((time.perf_counter() - t0) * 1000)
+                        answer_text = chunk_text(response.content).strip()
+                        result.update(answer=answer_text, citations=source_list(search_results), cached=None,
+                                      context=context)
+
+                        if self.answer_cache and is_cacheable(answer_text):
+                            await self.run_blocking(self.answer_cache.put, item["question"], answer_text,
+                                                    result["citations"])
+
+                timings["total_ms"] = round((time.perf_counter() - started) * 1000)
+                result["timings"] = timings
+                self.answered += 1
+            except Exception as e:
+                result["error"] = str(e)
+                root.set(error=type(e).__name__)
+                self.failed += 1
+                print(f"   ⚠️ {item['id']}: {e}")
+            finally:
+                self.slots.release()
+
+        # Single event loop thread: one write per line, flushed so a crash loses nothing
+        self.out.write(json.dumps(result) + "\n")
+        self.out.flush()
+        done = self.answered + self.failed
+        if done % 25 == 0:
+            print(f"   Processed {done} ({self.failed} failed, {self.cached} from cache)...")
+
+    async def run(self, batches):
+        tasks = []
+        for batch in batches:
+            embed_ms = await self.embed_batch(batch)
+            for item in batch:
+                # Blocks while --concurrency questions are in flight, so the
+                # next batch is embedded while this one is still generating
+                await self.slots.acquire()
+                tasks.append(asyncio.create_task(self.answer(item, embed_ms)))
+        await asyncio.gather(*tasks)
+        self.executor.shutdown(wait=False)
+
+
+def iter_batches(input_file, answered, batch_size):
+    reader = JsonlReader(input_file)
+    batch = []
+    for record in reader:
+        question = question_of(record)
+        item_id = str(record.get("id") or record.get("request_id") or f"line-{reader.records}")
+        if not question or item_id in answered:
+            continue
+        batch.append({"id": item_id, "question": question})
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+    print(f"📑 Input: {reader.summary()}")
+
+
+async def answer_file(args):
+    check_keys()
+    configure_quota("gemini", rpm=args.rpm)
+    answered = load_answered(args.output)
+    print(f"🔄 Resuming... {len(answered)} questions already answered in {args.output}.")
+
+    vectorstore, embeddings, model = load_vectorstore(pool_threads=args.concurrency)
+    retriever = load_retriever(vectorstore)
+    answer_cache = None if args.no_answer_cache else load_answer_cache(embeddings, model)
+
+    print(f"🚀 Answering {args.input} (batches of {args.batch_size}, {args.concurrency} concurrent, "
+          f"{args.rpm:g} Gemini req/min)...")
+    started = time.perf_counter()
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "a", encoding="utf-8") as out:
+        answerer = BatchAnswerer(retriever, embeddings, load_llm(), answer_cache, out, args.concurrency)
+        await answerer.run(iter_batches(args.input, answered, args.batch_size))
+
+    elapsed = time.perf_counter() - started
+    total = answerer.answered + answerer.failed
+    print(f"✅ Batch Complete! {answerer.answered} answered ({answerer.cached} from cache), "
+          f"{answerer.failed} failed in {elapsed:.0f}s ({total / elapsed * 60 if elapsed else 0:.1f} questions/min)")
+    print(f"✂️  Context budget saved {answerer.tokens_saved:,} prompt tokens.")
+    print(f"⏱️  Quotas: {get_limiter('gemini').summary()}; {get_limiter('embedding').summary()}")
+    if answerer.failed:
+        print("👉 Re-run the same command to retry the failed questions.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Answer a JSONL file of questions.")
+    parser.add_argument("input", help="JSONL with question (or body/title) and id (or request_id) fields")
+    parser.add_argument("--output", default=OUTPUT_FILE)
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="Questions embedded per API call")
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY, help="Questions in flight at once")
+    parser.add_argument("--rpm", type=float, default=LLM_RPM, help="Gemini requests per minute (GEMINI_RPM)")
+    parser.add_argument("--no-answer-cache", action="store_true", help="Always regenerate answers")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.input):
+        print(f"❌ Error: {args.input} not found.")
+        return
+    asyncio.run(answer_file(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""
+Token-budgeted context assembly for the agent prompt.
+
+Retrieved passages can be whole sections (index_data.py stores up to 20,000
+characters each), so pasting them in verbatim makes prompts slow, expensive
+and heavy on the TPM quota. Instead every passage is split into paragraphs,
+paragraphs are scored against the question (BM25 over the retrieved
+paragraphs plus a bonus for the passage's retrieval rank), and the best ones
+are taken greedily until CONTEXT_TOKEN_BUDGET is spent:
+
+- near-duplicates are skipped (overlapping chunks repeat lead-in lines, and
+  the same section can come back from both BM25 and the vector search)
+- kept paragraphs go back under their section's citation header in document
+  order, with "[...]" where text was left out
+- the stats say how many tokens the full passages would have cost and how
+  many were saved
+"""
+import math
+import os
+import sys
+from collections import Counter
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from agent.hybrid_retriever import passage_key
+from common.rate_limit import CHARS_PER_TOKEN, estimate_tokens
+from indexer.chunking import BOILERPLATE_RE
+from indexer.keyword_index import tokenize
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1500"))
+RANK_WEIGHT = 1.0        # Score bonus for the top-ranked passage; 1/2 for the next, ...
+DUPLICATE_OVERLAP = 0.8  # Share of a paragraph's shingles already in the context
+SHINGLE_SIZE = 4
+BM25_K1 = 1.2
+BM25_B = 0.75
+ELISION = "[...]"
+
+
+def split_passage(text):
+    return [p.strip() for p in text.split("\n\n") if p.strip() and not BOILERPLATE_RE.match(p.strip())]
+
+
+def shingles(tokens):
+    if len(tokens) < SHINGLE_SIZE:
+        return {tuple(tokens)} if tokens else set()
+    return {tuple(tokens[i:i + SHINGLE_SIZE]) for i in range(len(tokens) - SHINGLE_SIZE + 1)}
+
+
+def citation_header(doc):
+    citation = doc.metadata.get("citation") or passage_key(doc)[0]
+    heading = doc.metadata.get("heading") or ""
+    if heading and heading not in citation:
+        return f"{citation} ({heading}):"
+    return f"{citation}:"
+
+
+def score_paragraphs(paragraphs, question):
+    # BM25 with the retrieved paragraphs as the corpus, so idf reflects this query's candidates
+    query_terms = set(tokenize(question))
+    counts = [Counter(p["tokens"]) for p in paragraphs]
+    avg_len = sum(len(p["tokens"]) for p in paragraphs) / len(paragraphs) or 1.0
+    df = Counter(term for c in counts for term in query_terms if term in c)
+    n = len(paragraphs)
+    for p, tf in zip(paragraphs, counts):
+        score = 0.0
+        for term in query_terms:
+            if term in tf:
+                idf = math.log(1 + (n - df[term] + 0.5) / (df[term] + 0.5))
+                norm = tf[term] + BM25_K1 * (1 - BM25_B + BM25_B * len(p["tokens"]) / avg_len)
+                score += idf * tf[term] * (BM25_K1 + 1) / norm
+        p["score"] = score + RANK_WEIGHT / (p["rank"] + 1)
+
+
+def truncate_to(text, tokens):
+    limit = max(0, tokens) * CHARS_PER_TOKEN
+    if len(text) <= limit:
+        return text
+    cut = text.rfind(" ", 0, limit)
+    return text[:cut if cut > 0 else limit].rstrip() + " " + ELISION
+
+
+def build_context(search_results, question, budget=CONTEXT_TOKEN_BUDGET):
+    """
+    Returns (context, stats); stats has tokens_full, tokens_used,
+    tokens_saved, paragraphs_kept and paragraphs_total.
+    """
+    full = "\n\n".join(f"{citation_header(doc)}\n{doc.page_content}" for doc in search_results)
+    tokens_full = estimate_tokens(full) if search_results else 0
+
+    paragraphs = []
+    for rank, doc in enumerate(search_results):
+        for position, text in enumerate(split_passage(doc.page_content)):
+            paragraphs.append({"rank": rank, "position": position, "text": text,
+                               "tokens": tokenize(text), "cost": estimate_tokens(text)})
+    if not paragraphs:
+        return "", {"tokens_full": tokens_full, "tokens_used": 0, "tokens_saved": tokens_full,
+                    "paragraphs_kept": 0, "paragraphs_total": 0}
+    score_paragraphs(paragraphs, question)
+
+    # --- GREEDY SELECTION ---
+    headers = {rank: citation_header(doc) for rank, doc in enumerate(search_results)}
+    seen_text = set()
+    seen_shingles = set()
+    selected = []
+    spent = 0
+    for p in sorted(paragraphs, key=lambda p: (-p["score"], p["rank"], p["position"])):
+        key = " ".join(p["tokens"])
+        own = shingles(p["tokens"])
+        if key in seen_text or (own and len(own & seen_shingles) / len(own) >= DUPLICATE_OVERLAP):
+            continue
+        # A section's header is paid for once, with its first kept paragraph
+        header_cost = 0 if any(s["rank"] == p["rank"] for s in selected) else estimate_tokens(headers[p["rank"]])
+        cost = p["cost"] + header_cost
+        if spent + cost > budget:
+            if selected:
+                continue
+            # Nothing fits yet: keep the best paragraph, cut down to the budget
+            p = dict(p, text=truncate_to(p["text"], budget - estimate_tokens(headers[p["rank"]])))
+            cost = budget
+        selected.append(p)
+        seen_text.add(key)
+        seen_shingles |= own
+        spent += cost
+
+    # --- ASSEMBLY (retrieval order, then document order) ---
+    blocks = []
+    for rank in sorted({p["rank"] for p in selected}):
+        kept = sorted((p for p in selected if p["rank"] == rank), key=lambda p: p["position"])
+        parts = []
+        expected = 0
+        for p in kept:
+            if p["position"] > expected:
+                parts.append(ELISION)
+            parts.append(p["text"])
+            expected = p["position"] + 1
+        blocks.append(headers[rank] + "\n" + "\n\n".join(parts))
+
+    context = "\n\n".join(blocks)
+    tokens_used = estimate_tokens(context)
+    return context, {
+        "tokens_full": tokens_full,
+        "tokens_used": tokens_used,
+        "tokens_saved": max(0, tokens_full - tokens_used),
+        "paragraphs_kept": len(selected),
+        "paragraphs_total": len(paragraphs),
+    }
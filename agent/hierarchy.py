@@ -0,0 +1,115 @@
+"""
+Query-side hierarchy hints: which part of the code a question is about.
+
+"Title 13", "13 CCR", "Division 3", "Chapter 1" and "Article 2" in a question,
+or an agency named in the agency map ("DMV", "Air Resources Board", ...), become
+a Pinecone-style metadata filter on the exact-match fields written by
+indexer/chunking.py (title_number, division_number, chapter_number,
+article_number). The filter goes to the vector store (a Pinecone pre-filter, or
+a partition scan of the local index) and to the BM25 index.
+
+The agency map can be replaced with a JSON file at AGENCY_MAP_FILE:
+    {"air resources board": {"title_number": ["13", "17"], "division_number": ["3"]}, ...}
+Keys are matched as whole words, case-insensitively; explicit hints in the
+question override the agency's fields.
+
+Usage:
+    python agent/hierarchy.py "What does CARB require for Division 3 smog checks?"
+"""
+import json
+import os
+import re
+import sys
+
+AGENCY_MAP_FILE = os.getenv("AGENCY_MAP_FILE", "data/agency_map.json")
+HIERARCHY_FIELDS = ("title_number", "division_number", "chapter_number", "article_number")
+
+DEFAULT_AGENCY_MAP = {
+    "department of motor vehicles": {"title_number": ["13"], "division_number": ["1"]},
+    "dmv": {"title_number": ["13"], "division_number": ["1"]},
+    "california highway patrol": {"title_number": ["13"], "division_number": ["2"]},
+    "chp": {"title_number": ["13"], "division_number": ["2"]},
+    "air resources board": {"title_number": ["13", "17"], "division_number": ["3"]},
+    "carb": {"title_number": ["13", "17"], "division_number": ["3"]},
+    "cal/osha": {"title_number": ["8"]},
+    "department of industrial relations": {"title_number": ["8"]},
+    "department of food and agriculture": {"title_number": ["3"]},
+    "department of insurance": {"title_number": ["10"]},
+    "department of public health": {"title_number": ["17"]},
+    "department of toxic substances control": {"title_number": ["22"]},
+    "dtsc": {"title_number": ["22"]},
+    "state water resources control board": {"title_number": ["23"]},
+    "building standards commission": {"title_number": ["24"]},
+}
+
+NUMBER = r"(\d+(?:\.\d+)?[a-z]?)"
+HINT_PATTERNS = {
+    "title_number": [re.compile(rf"\btitle\s+{NUMBER}\b", re.IGNORECASE),
+                     re.compile(rf"\b{NUMBER}\s+(?:CCR|Cal\.?\s*Code\s*Regs?\.?)", re.IGNORECASE),
+                     re.compile(rf"\btit\.\s*{NUMBER}\b", re.IGNORECASE)],
+    "division_number": [re.compile(rf"\bdiv(?:ision|\.)\s*{NUMBER}\b", re.IGNORECASE)],
+    "chapter_number": [re.compile(rf"\b(?:chapter|ch\.)\s*{NUMBER}\b", re.IGNORECASE)],
+    "article_number": [re.compile(rf"\b(?:article|art\.)\s*{NUMBER}\b", re.IGNORECASE)],
+}
+
+
+def load_agency_map(path=AGENCY_MAP_FILE):
+    if path and os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            agency_map = json.load(f)
+    else:
+        agency_map = DEFAULT_AGENCY_MAP
+    # Longest names first, so "air resources board" wins over anything it contains
+    return [
+        (re.compile(rf"(?<![\w/]){re.escape(name.lower())}(?![\w/])", re.IGNORECASE), fields)
+        for name, fields in sorted(agency_map.items(), key=lambda item: -len(item[0]))
+    ]
+
+
+_agency_patterns = None
+
+
+def detect_scope(query):
+    """{"title_number": ["13"], ...} for every hierarchy hint in the query; {} if none."""
+    global _agency_patterns
+    if _agency_patterns is None:
+        _agency_patterns = load_agency_map()
+
+    explicit = {}
+    for field, patterns in HINT_PATTERNS.items():
+        values = [v.lower() for p in patterns for v in p.findall(query)]
+        if values:
+            explicit[field] = list(dict.fromkeys(values))
+
+    scope = {}
+    for pattern, fields in _agency_patterns:
+        if pattern.search(query):
+            agency = {field: [str(v) for v in values] for field, values in fields.items() if field in HIERARCHY_FIELDS}
+            # An explicit title outside the agency's titles means the agency hint doesn't apply
+            titles = agency.get("title_number")
+            if not (titles and explicit.get("title_number") and not set(explicit["title_number"]) & set(titles)):
+                scope = agency
+            break
+    scope.update(explicit)
+    return scope
+
+
+def scope_filter(scope):
+    """Pinecone metadata filter for a scope (None when there is nothing to filter on)."""
+    if not scope:
+        return None
+    return {field: {"$eq": values[0]} if len(values) == 1 else {"$in": values}
+            for field, values in scope.items()}
+
+
+def describe_scope(scope):
+    names = {"title_number": "Title", "division_number": "Division",
+             "chapter_number": "Chapter", "article_number": "Article"}
+    return ", ".join(f"{names[field]} {'/'.join(values)}" for field, values in scope.items())
+
+
+if __name__ == "__main__":
+    query = " ".join(sys.argv[1:]) or input("Question: ")
+    scope = detect_scope(query)
+    print(f"🗂️  Scope: {describe_scope(scope) or 'whole corpus'}")
+    print(f"   Filter: {json.dumps(scope_filter(scope))}")
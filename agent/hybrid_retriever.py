@@ -0,0 +1,121 @@
+"""
+Hybrid retrieval: exact citation lookup, then BM25 + dense vectors fused with
+reciprocal-rank fusion (RRF).
+
+Queries that name a section ("13 CCR § 2030", "Title 13 Section 2030") are
+answered from the keyword index's citation table and never touch the
+embedding API. Everything else runs BM25 and the vector store and merges the
+two rankings with score = sum(1 / (RRF_K + rank)).
+
+Hierarchy hints in the query ("Title 13", "Division 3", an agency name; see
+agent/hierarchy.py) become a metadata filter on both searches. If the scoped
+search finds nothing (e.g. an index built before the hierarchy fields existed)
+the query is run again over the whole corpus.
+
+Vectors indexed with --text-in-store carry no text; with a corpus store the
+matches are hydrated from it (the whole section, or the chunk re-cut from it).
+"""
+from agent.hierarchy import detect_scope, scope_filter
+from common.tracing import span
+from indexer.chunking import chunk_record
+
+RRF_K = 60
+FETCH_MULTIPLIER = 4
+
+
+def passage_key(doc):
+    # Pinecone (index_data.py) stores "url", reset_db.py stores "source";
+    # whole-section vectors have no chunk_index and count as chunk 0
+    url = doc.metadata.get("url") or doc.metadata.get("source") or doc.id
+    return url, int(doc.metadata.get("chunk_index") or 0)
+
+
+class HybridRetriever:
+    def __init__(self, vectorstore, keyword_index=None, rrf_k=RRF_K, use_scopes=True, corpus=None):
+        self.vectorstore = vectorstore
+        self.keyword_index = keyword_index
+        self.corpus = corpus
+        self.rrf_k = rrf_k
+        self.use_scopes = use_scopes
+        self.last_route = None
+        self.last_scope = {}
+
+    def _keyword_document(self, doc_number):
+        from langchain_core.documents import Document
+        entry = dict(self.keyword_index.docs[doc_number])
+        text = entry.pop("text")
+        return Document(id=entry.pop("id"), page_content=text, metadata=entry)
+
+    def citation_lookup(self, query, k):
+        doc_numbers = self.keyword_index.lookup_citation(query)
+        if not doc_numbers:
+            return []
+        # Rank the cited section's passages by the rest of the question
+        scores = self.keyword_index.scores(query)
+        doc_numbers.sort(key=lambda d: -scores[d])
+        return [self._keyword_document(d) for d in doc_numbers[:k]]
+
+    def fuse(self, rankings, k):
+        fused = {}
+        docs = {}
+        for ranking in rankings:
+            for rank, doc in enumerate(ranking):
+                key = passage_key(doc)
+                fused[key] = fused.get(key, 0.0) + 1.0 / (self.rrf_k + rank + 1)
+                docs.setdefault(key, doc)
+        best = sorted(fused, key=fused.get, reverse=True)[:k]
+        return [docs[key] for key in best]
+
+    def hydrate(self, docs):
+        if self.corpus is None:
+            return docs
+        with span("retrieve.hydrate", docs=len(docs)):
+            return self._hydrate(docs)
+
+    def _hydrate(self, docs):
+        for doc in docs:
+            if doc.page_content:
+                continue
+            url, chunk_index = passage_key(doc)
+            record = self.corpus.get(url)
+            if record is None:
+                continue
+            if doc.id and "#chunk-" not in doc.id:
+                doc.page_content = record.get("content_markdown") or ""
+            else:
+                chunks = chunk_record(record)
+                doc.page_content = chunks[chunk_index]["text"] if chunk_index < len(chunks) else ""
+        return docs
+
+    def _ranked(self, query, k, metadata_filter):
+        scoped = metadata_filter is not None
+        if self.keyword_index is None:
+            with span("retrieve.vector", k=k, scoped=scoped):
+                vector_hits = self.vectorstore.similarity_search(query, k=k, filter=metadata_filter)
+            return self.hydrate(vector_hits)
+        fetch_k = k * FETCH_MULTIPLIER
+        with span("retrieve.keyword", k=fetch_k, scoped=scoped):
+            keyword_hits = [self._keyword_document(d)
+                            for d, _ in self.keyword_index.search(query, k=fetch_k, filter=metadata_filter)]
+        with span("retrieve.vector", k=fetch_k, scoped=scoped):
+            vector_hits = self.vectorstore.similarity_search(query, k=fetch_k, filter=metadata_filter)
+        return self.hydrate(self.fuse([vector_hits, keyword_hits], k))
+
+    def search(self, query, k=3):
+        self.last_scope = {}
+        if self.keyword_index is not None:
+            with span("retrieve.citation") as s:
+                cited = self.citation_lookup(query, k)
+                s.set(hit=bool(cited))
+            if cited:
+                self.last_route = "citation"
+                return cited
+
+        self.last_route = "vector" if self.keyword_index is None else "hybrid"
+        scope = detect_scope(query) if self.use_scopes else {}
+        if scope:
+            results = self._ranked(query, k, scope_filter(scope))
+            if results:
+                self.last_scope = scope
+                return results
+        return self._ranked(query, k, None)
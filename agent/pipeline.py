@@ -0,0 +1,140 @@
+"""
+Shared retrieval-augmented generation pieces for the agent entry points
+(agent/server.py for interactive sessions, agent/batch_answer.py for question
+lists): client setup, prompt assembly and answer cleanup. Every Google call
+(query embeddings and Gemini) goes through the shared quota limiter in
+common/rate_limit.py, which also owns retries.
+
+The Google and Pinecone SDKs are imported inside the loaders that need them
+(they dominate import time), and index state comes from the warm bundle when
+one has been built (common/warm_bundle.py).
+"""
+import os
+import sys
+from dotenv import load_dotenv
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common import warm_bundle
+from common.rate_limit import RateLimitedChat
+from common.corpus_store import CorpusStore
+from indexer.embedders import GOOGLE_MODEL, get_embeddings
+from indexer.embedding_cache import EMBEDDING_CACHE_FILE, CachedEmbeddings, EmbeddingCache
+from indexer.keyword_index import KEYWORD_INDEX_DIR, KeywordIndex
+from indexer.local_index import LOCAL_INDEX_DIR, LocalVectorStore
+from agent.answer_cache import ANSWER_CACHE_FILE, AnswerCache
+from agent.context_builder import build_context
+from agent.hybrid_retriever import HybridRetriever, passage_key
+
+# 1. Load Secrets (FORCE RE-READ)
+load_dotenv(override=True)
+
+GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
+PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
+
+INDEX_NAME = "ccr-regulations"
+# "pinecone" (default) or "local" for the memory-mapped index built with --backend local
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "pinecone").lower()
+LLM_MODEL = "models/gemini-flash-latest"
+TOP_K = int(os.getenv("AGENT_TOP_K", "3"))  # Passages per answer; bench/eval_retrieval.py compares values
+
+PROMPT_TEMPLATE = """
+You are a Legal Compliance Assistant.
+
+- If the user greets you (hi/hello), reply politely.
+- Otherwise, use the context below to answer the question.
+- If the answer is not in the context, say "I don't know."
+
+CONTEXT:
+{context}
+
+QUESTION:
+{question}
+"""
+
+
+def check_keys():
+    # --- DEBUG CHECK ---
+    if GOOGLE_API_KEY:
+        print(f"🔑 DEBUG: Using API Key ending in: ...{GOOGLE_API_KEY[-4:]}")
+    else:
+        print("❌ Error: Keys are missing from .env file!")
+        sys.exit(1)
+    os.environ["GOOGLE_API_KEY"] = GOOGLE_API_KEY
+    if PINECONE_API_KEY:
+        os.environ["PINECONE_API_KEY"] = PINECONE_API_KEY
+
+
+def load_vectorstore(pool_threads=1):
+    """
+    Returns (vectorstore, query embeddings, model name). Query vectors go
+    through the embedding cache, so the answer cache's similarity check and
+    the vector search share one embedding call.
+    """
+    if VECTOR_BACKEND == "local":
+        # Embeds queries with whichever model built the index (see manifest.json)
+        index = warm_bundle.open_local_index(LOCAL_INDEX_DIR)
+        vectorstore = LocalVectorStore(index, get_embeddings(index.model))
+        model = index.model
+        vectorstore.embedding = CachedEmbeddings(vectorstore.embedding, model, EmbeddingCache(EMBEDDING_CACHE_FILE))
+        return vectorstore, vectorstore.embedding, model
+
+    # MUST match the model used in reset_db.py (768 dimensions)
+    embeddings = CachedEmbeddings(get_embeddings(GOOGLE_MODEL), GOOGLE_MODEL, EmbeddingCache(EMBEDDING_CACHE_FILE))
+    # One index client with a connection pool sized for the caller's threads
+    from pinecone import Pinecone
+    from langchain_pinecone import PineconeVectorStore
+    index = Pinecone(api_key=PINECONE_API_KEY).Index(INDEX_NAME, pool_threads=pool_threads)
+    vectorstore = PineconeVectorStore(index=index, embedding=embeddings)
+    return vectorstore, embeddings, GOOGLE_MODEL
+
+
+def load_answer_cache(embeddings, model):
+    # Repeat questions are answered from data/answer_cache.sqlite; ANSWER_CACHE=off disables it
+    if os.getenv("ANSWER_CACHE", "on").lower() == "off":
+        return None
+    return AnswerCache(ANSWER_CACHE_FILE, embedding=embeddings, model=model)
+
+
+def load_retriever(vectorstore):
+    # BM25 + citation lookup kick in once `python indexer/keyword_index.py` has been run;
+    # HIERARCHY_FILTERS=off stops "Title 13" / agency hints from scoping the search
+    use_scopes = os.getenv("HIERARCHY_FILTERS", "on").lower() != "off"
+    # Section text for vectors indexed with --text-in-store comes from data/corpus
+    corpus = CorpusStore() if CorpusStore.exists() else None
+    if os.getenv("HYBRID_SEARCH", "on").lower() != "off" and KeywordIndex.exists(KEYWORD_INDEX_DIR):
+        print("🔎 Hybrid search enabled (BM25 + vectors, exact citation lookup).")
+        keyword_index = warm_bundle.open_keyword_index(KEYWORD_INDEX_DIR)
+        return HybridRetriever(vectorstore, keyword_index, use_scopes=use_scopes, corpus=corpus)
+    return HybridRetriever(vectorstore, use_scopes=use_scopes, corpus=corpus)
+
+
+def load_llm():
+    # Using the 'latest' alias is usually safer for Rate Limits on free tiers.
+    # The SDK's own retries are off (max_retries=1 is a single attempt); the shared limiter paces and retries.
+    from langchain_google_genai import ChatGoogleGenerativeAI
+    return RateLimitedChat(ChatGoogleGenerativeAI(model=LLM_MODEL, temperature=0.3, max_retries=1))
+
+
+def build_prompt(search_results, question):
+    """
+    Returns (prompt, context stats). The context holds the passages' most
+    relevant paragraphs under CONTEXT_TOKEN_BUDGET (see agent/context_builder.py).
+    """
+    context, stats = build_context(search_results, question)
+    return PROMPT_TEMPLATE.format(context=context, question=question), stats
+
+
+def source_list(search_results):
+    return [{"citation": doc.metadata.get("citation", ""), "url": passage_key(doc)[0]} for doc in search_results]
+
+
+def chunk_text(content):
+    # If Google sends a list of parts instead of a string, keep only the text
+    if isinstance(content, list):
+        return "".join(part.get("text", "") if isinstance(part, dict) else str(part) for part in content)
+    return content or ""
+
+
+def is_cacheable(answer_text):
+    # Don't pin a retrieval miss; those should be retried after the next refresh
+    return bool(answer_text) and answer_text != "I don't know."
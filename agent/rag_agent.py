@@ -1,53 +1,58 @@
+"""
+Command-line client for the agent server (python agent/server.py).
+
+Retrieval, the answer cache and Gemini all live in the server process; this
+just sends each question and prints the answer as it streams in. Set
+AGENT_SERVER_URL to use a server on another host. Nothing heavier than the
+standard library is imported, so the prompt is up immediately; a server still
+warming up holds the first question until its indexes are loaded.
+"""
+import json
 import os
-import sys
-import time
+import urllib.error
+import urllib.request
 from dotenv import load_dotenv
 
-# --- IMPORTS ---
-from langchain_google_genai import ChatGoogleGenerativeAI, GoogleGenerativeAIEmbeddings
-from langchain_pinecone import PineconeVectorStore
-from langchain_core.documents import Document 
-
-# 1. Load Secrets (FORCE RE-READ)
 load_dotenv(override=True)
-
-GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
-PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
-
-# --- DEBUG CHECK ---
-if GOOGLE_API_KEY:
-    print(f"🔑 DEBUG: Using API Key ending in: ...{GOOGLE_API_KEY[-4:]}")
-else:
-    print("❌ Error: Keys are missing from .env file!")
-    sys.exit(1)
-# -------------------
-
-INDEX_NAME = "ccr-regulations"
-os.environ["PINECONE_API_KEY"] = PINECONE_API_KEY
-os.environ["GOOGLE_API_KEY"] = GOOGLE_API_KEY
+SERVER_URL = os.getenv("AGENT_SERVER_URL", "http://127.0.0.1:8080").rstrip("/")
+TIMEOUT = 300  # Seconds; covers a full retry cycle on the server
+
+def iter_events(response):
+    # Minimal Server-Sent Events parser: "event:" / "data:" lines, blank line ends an event
+    event, data = None, []
+    for raw in response:
+        line = raw.decode("utf-8").rstrip("\r\n")
+        if line.startswith("event:"):
+            event = line[6:].strip()
+        elif line.startswith("data:"):
+            data.append(line[5:].strip())
+        elif not line and event:
+            yield event, json.loads("\n".join(data))
+            event, data = None, []
+
+def ask(question):
+    request = urllib.request.Request(
+        f"{SERVER_URL}/ask",
+        data=json.dumps({"question": question}).encode("utf-8"),
+        headers={"Content-Type": "application/json", "Accept": "text/event-stream"},
+        method="POST"
+    )
+    with urllib.request.urlopen(request, timeout=TIMEOUT) as response:
+        yield from iter_events(response)
 
 def main():
-    print("🤖 Initializing AI Agent (Gemini Flash Latest + Text-Embedding-004)...")
-
-    # 2. Connect to Database (Pinecone)
-    # MUST match the model used in reset_database.py (768 dimensions)
-    embeddings = GoogleGenerativeAIEmbeddings(model="models/text-embedding-004")
-    
+    print(f"🤖 Connecting to agent server at {SERVER_URL}...")
     try:
-        vectorstore = PineconeVectorStore.from_existing_index(
-            index_name=INDEX_NAME,
-            embedding=embeddings
-        )
-    except Exception as e:
+        with urllib.request.urlopen(f"{SERVER_URL}/health", timeout=5) as response:
+            status = json.load(response).get("status")
+    except (urllib.error.URLError, OSError) as e:
         print(f"⚠️ Connection Error: {e}")
+        print("👉 Start the server first: python agent/server.py")
         return
-
-    # 3. Connect to Brain (Gemini Flash Latest)
-    # Using the 'latest' alias is usually safer for Rate Limits on free tiers
-    llm = ChatGoogleGenerativeAI(
-        model="models/gemini-flash-latest", 
-        temperature=0.3
-    )
+    if status == "warming":
+        print("⏳ Server is still loading its indexes; the first answer will wait for it.")
+    elif status == "error":
+        print("⚠️ Server failed to load its indexes or clients; check its log.")
 
     print("\n💬 Agent is Ready! (Type 'exit' to quit)")
     print("------------------------------------------------")
@@ -56,62 +61,29 @@ def main():
         query = input("\nUser: ")
         if query.lower() in ["exit", "quit"]:
             break
-            
+        if not query.strip():
+            continue
+
         try:
             print("Thinking...", end="", flush=True)
-            
-            # --- RETRY LOGIC ---
-            retries = 3
-            search_results = None
-            
-            for attempt in range(retries):
-                try:
-                    search_results = vectorstore.similarity_search(query, k=3)
-                    break 
-                except Exception as e:
-                    # Catch Rate Limits
-                    if "429" in str(e) or "RESOURCE_EXHAUSTED" in str(e):
-                        print(f"\n⏳ Rate limit hit. Waiting 10 seconds (Attempt {attempt+1}/{retries})...")
-                        time.sleep(10)
-                    else:
-                        raise e 
-            
-            if not search_results:
-                print("\n🤖 AI: I couldn't find any relevant documents.")
-                continue
-
-            context_text = "\n\n".join([doc.page_content for doc in search_results])
-
-            # --- PROMPT ---
-            final_prompt = f"""
-            You are a Legal Compliance Assistant.
-            
-            - If the user greets you (hi/hello), reply politely.
-            - Otherwise, use the context below to answer the question.
-            - If the answer is not in the context, say "I don't know."
-
-            CONTEXT:
-            {context_text}
-
-            QUESTION: 
-            {query}
-            """
-
-            response = llm.invoke(final_prompt)
-            
-            # --- CLEANER: Remove weird JSON/List artifacts ---
-            answer_text = response.content
-            
-            # If Google sends a list/box, extract the text inside
-            if isinstance(answer_text, list) and len(answer_text) > 0:
-                if 'text' in answer_text[0]:
-                    answer_text = answer_text[0]['text']
-            
-            # Print the clean answer
-            print(f"\n\n🤖 AI: {str(answer_text).strip()}")
-            
-        except Exception as e:
-            print(f"\n❌ Error: {e}")
+            answering = False
+            for event, data in ask(query):
+                if event == "token":
+                    if not answering:
+                        print("\n\n🤖 AI: ", end="")
+                        answering = True
+                    print(data["text"], end="", flush=True)
+                elif event == "done":
+                    print()
+                    if data.get("cached"):
+                        print(f"   ⚡ Cached answer ({data['cached']} match, similarity {data['similarity']:.2f})")
+                elif event == "error":
+                    print(f"\n❌ Error: {data['message']}")
+
+        except urllib.error.HTTPError as e:
+            print(f"\n❌ Error: {e.code} {e.read().decode('utf-8', 'replace')}")
+        except (urllib.error.URLError, OSError) as e:
+            print(f"\n❌ Error: lost connection to {SERVER_URL} ({e})")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,273 @@
+"""
+Async HTTP query service for the compliance agent.
+
+One process holds one embedding client, one vector store connection (Pinecone
+with a pooled index client) and one Gemini client, shared by every session.
+Blocking SDK calls (query embedding, vector search, cache lookups) run on a
+bounded thread pool; answers stream back as Server-Sent Events token by token
+via llm.astream(), so users see text as soon as Gemini produces it. Quota
+pacing and 429 retries for both happen in the shared limiter
+(common/rate_limit.py), not per session.
+
+The port opens before any of that is loaded: indexes, the query encoder and
+the SDK clients load on a background thread (from the warm bundle when one
+is built; see common/warm_bundle.py), /health reports "warming" meanwhile,
+and questions that arrive early wait for it instead of failing.
+
+Endpoints:
+    POST /ask     {"question": "..."} -> text/event-stream with events
+                  sources, token ({"text"}), done (timings) and error
+    GET  /health  -> {"status": "warming" | "ok" | "error", "in_flight": n, "served": n,
+                      "context_tokens_saved": n}
+    GET  /metrics -> span latencies, retries and token counts in the Prometheus text format
+                     (spans also go to data/traces.jsonl; see common/tracing.py)
+
+Usage:
+    python agent/server.py [--host 127.0.0.1] [--port 8080]
+    python agent/rag_agent.py          # thin CLI client
+    curl -N localhost:8080/ask -d '{"question": "penalty for smog check violations?"}'
+"""
+import argparse
+import asyncio
+import contextvars
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from aiohttp import web
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from agent.pipeline import (TOP_K, build_prompt, check_keys, chunk_text, is_cacheable, load_answer_cache, load_llm,
+                            load_retriever, load_vectorstore, source_list)
+from common.rate_limit import get_limiter
+from common.tracing import prometheus_text, span
+
+# --- CONFIGURATION ---
+HOST = os.getenv("AGENT_HOST", "127.0.0.1")
+PORT = int(os.getenv("AGENT_PORT", "8080"))
+RETRIEVAL_WORKERS = int(os.getenv("AGENT_RETRIEVAL_WORKERS", "16"))  # Threads for blocking SDK calls
+MAX_CONCURRENT_LLM = int(os.getenv("AGENT_MAX_LLM_STREAMS", "16"))   # Open Gemini streams; the rest queue
+
+
+def sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n".encode("utf-8")
+
+
+class AgentService:
+    """
+    Shared clients plus the per-question pipeline. answer() is an async
+    generator of (event, data) pairs, so one slow Gemini stream never holds up
+    another session.
+    """
+
+    def __init__(self, retriever=None, llm=None, answer_cache=None,
+                 workers=RETRIEVAL_WORKERS, max_llm_streams=MAX_CONCURRENT_LLM):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="retrieval")
+        self.llm_slots = asyncio.Semaphore(max_llm_streams)
+        self.ready = asyncio.Event()  # Set once the clients are attached (or loading failed)
+        self.load_error = None
+        self.in_flight = 0
+        self.served = 0
+        self.tokens_saved = 0
+        self.retriever = self.llm = self.answer_cache = None
+        if retriever is not None:
+            self.attach(retriever, llm, answer_cache)
+
+    def attach(self, retriever, llm, answer_cache=None):
+        self.retriever = retriever
+        self.llm = llm
+        self.answer_cache = answer_cache
+        self.ready.set()
+
+    @property
+    def status(self):
+        if not self.ready.is_set():
+            return "warming"
+        return "error" if self.load_error else "ok"
+
+    async def warm_up(self, loader):
+        """Runs loader() -> (retriever, llm, answer_cache) off the event loop, then starts answering."""
+        started = time.perf_counter()
+        try:
+            with span("agent.warm_up"):
+                retriever, llm, answer_cache = await self.run_blocking(loader)
+        except Exception as e:
+            print(f"⚠️ Connection Error: {e}")
+            self.load_error = e
+            self.ready.set()
+            return
+        self.attach(retriever, llm, answer_cache)
+        print(f"✅ Agent warm in {time.perf_counter() - started:.1f}s")
+
+    async def run_blocking(self, fn, *args):
+        # copy_context keeps the current span as the parent of spans opened on the worker thread
+        ctx = contextvars.copy_context()
+        return await asyncio.get_running_loop().run_in_executor(self.executor, ctx.run, fn, *args)
+
+    async def answer(self, question):
+        started = time.perf_counter()
+
+        def timings(first_token):
+            return {
+                "first_token_ms": round((first_token - started) * 1000) if first_token else None,
+                "total_ms": round((time.perf_counter() - started) * 1000)
+            }
+
+        with span("agent.answer") as root:
+            if not self.ready.is_set():
+                with span("agent.warm_wait"):
+                    await self.ready.wait()
+            if self.load_error:
+                raise RuntimeError(f"Agent failed to start: {self.load_error}")
+
+            # --- ANSWER CACHE (no LLM call, usually no embedding call either) ---
+            if self.answer_cache:
+                with span("answer_cache.get") as s:
+                    cached = await self.run_blocking(self.answer_cache.get, question)
+                    s.set(hit=bool(cached))
+                if cached:
+                    root.set(cached=cached["match"])
+                    if cached["sources"]:
+                        yield "sources", {"sources": cached["sources"]}
+                    yield "token", {"text": cached["answer"]}
+                    yield "done", {"cached": cached["match"], "similarity": cached["similarity"],
+                                   **timings(time.perf_counter())}
+                    return
+
+            with span("retrieve") as s:
+                search_results = await self.run_blocking(self.retriever.search, question, TOP_K)
+                s.set(results=len(search_results))
+            if not search_results:
+                yield "token", {"text": "I couldn't find any relevant documents."}
+                yield "done", timings(time.perf_counter())
+                return
+            yield "sources", {"sources": source_list(search_results)}
+
+            with span("build_prompt") as s:
+                prompt, context = build_prompt(search_results, question)
+                s.set(tokens_used=context["tokens_used"], tokens_saved=context["tokens_saved"])
+            self.tokens_saved += context["tokens_saved"]
+            parts = []
+            first_token = None
+            with span("llm.slot_wait"):
+                await self.llm_slots.acquire()
+            try:
+                async for chunk in self.llm.astream(prompt):
+                    text = chunk_text(chunk.content)
+                    if not text:
+                        continue
+                    if first_token is None:
+                        first_token = time.perf_counter()
+                    parts.append(text)
+                    yield "token", {"text": text}
+            finally:
+                self.llm_slots.release()
+
+            answer_text = "".join(parts).strip()
+            if self.answer_cache and is_cacheable(answer_text):
+                with span("answer_cache.put"):
+                    await self.run_blocking(self.answer_cache.put, question, answer_text, source_list(search_results))
+            done = timings(first_token)
+            root.set(first_token_ms=done["first_token_ms"], answer_chars=len(answer_text))
+            yield "done", {"context": context, **done}
+
+
+async def handle_ask(request):
+    service = request.app["service"]
+    try:
+        question = str((await request.json()).get("question") or "").strip()
+    except (ValueError, AttributeError):
+        return web.json_response({"error": 'Expected a JSON body like {"question": "..."}'}, status=400)
+    if not question:
+        return web.json_response({"error": "Empty question"}, status=400)
+
+    response = web.StreamResponse(headers={"Content-Type": "text/event-stream", "Cache-Control": "no-cache"})
+    await response.prepare(request)
+
+    service.in_flight += 1
+    try:
+        async for event, data in service.answer(question):
+            await response.write(sse(event, data))
+            if event == "done":
+                service.served += 1
+                context = f", context {data['context']['tokens_used']} tokens" if data.get("context") else ""
+                print(f"💬 [{service.in_flight} in flight] first token {data['first_token_ms']} ms, "
+                      f"total {data['total_ms']} ms{context}{' (cached)' if data.get('cached') else ''}")
+        await response.write_eof()
+    except ConnectionResetError:
+        pass  # Client went away mid-answer
+    except Exception as e:
+        print(f"❌ Error: {e}")
+        try:
+            await response.write(sse("error", {"message": str(e)}))
+            await response.write_eof()
+        except ConnectionResetError:
+            pass
+    finally:
+        service.in_flight -= 1
+    return response
+
+
+async def handle_health(request):
+    service = request.app["service"]
+    return web.json_response({"status": service.status, "in_flight": service.in_flight, "served": service.served,
+                              "context_tokens_saved": service.tokens_saved})
+
+
+async def handle_metrics(request):
+    return web.Response(text=prometheus_text(), content_type="text/plain", charset="utf-8")
+
+
+def create_app(service, loader=None):
+    """loader: optional blocking () -> (retriever, llm, answer_cache), run in the background at startup."""
+    app = web.Application()
+    app["service"] = service
+    app.router.add_post("/ask", handle_ask)
+    app.router.add_get("/health", handle_health)
+    app.router.add_get("/metrics", handle_metrics)
+
+    async def startup(app):
+        app["warm_up"] = asyncio.create_task(service.warm_up(loader))
+
+    async def shutdown(app):
+        if "warm_up" in app:
+            app["warm_up"].cancel()
+        service.executor.shutdown(wait=False)
+        print(f"⏱️  Quotas: {get_limiter('gemini').summary()}; {get_limiter('embedding').summary()}")
+        if service.answer_cache:
+            print(f"💾 Answer cache: {service.answer_cache.summary()}")
+
+    if loader is not None:
+        app.on_startup.append(startup)
+    app.on_cleanup.append(shutdown)
+    return app
+
+
+def load_clients():
+    # Connect once; every session shares these clients
+    vectorstore, embeddings, model = load_vectorstore(pool_threads=RETRIEVAL_WORKERS)
+    retriever = load_retriever(vectorstore)
+    answer_cache = load_answer_cache(embeddings, model)
+    # A local query encoder loads on first use; touch it here so the first question doesn't pay for it
+    getattr(embeddings.embeddings, "model", None)
+    return retriever, load_llm(), answer_cache
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the compliance agent over HTTP with streamed answers.")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    args = parser.parse_args()
+
+    check_keys()
+    print("🤖 Initializing AI Agent (Gemini Flash Latest + Text-Embedding-004)...")
+
+    service = AgentService()
+    print(f"💬 Agent server listening on http://{args.host}:{args.port} "
+          f"({RETRIEVAL_WORKERS} retrieval threads, {MAX_CONCURRENT_LLM} concurrent Gemini streams); warming up...")
+    web.run_app(create_app(service, loader=load_clients), host=args.host, port=args.port, print=None)
+
+
+if __name__ == "__main__":
+    main()
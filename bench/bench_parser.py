@@ -0,0 +1,121 @@
+"""
+Parser microbenchmark: pages/sec per HTML backend, plus an output parity check.
+
+Runs crawler/parsing.parse_page over debug_page.html, up to --snapshots pages
+from data/html_snapshots/ and any extra --pages files. Every backend's records
+must equal the html.parser reference; a mismatch or a throughput drop beyond
+--tolerance against the saved baseline exits non-zero.
+
+Usage:
+    python bench/bench_parser.py                       # measure + parity check
+    python bench/bench_parser.py --save-baseline       # record this box's numbers
+    python bench/bench_parser.py --require-baseline    # CI: fail when no baseline is recorded
+    python bench/bench_parser.py --pages 'saved/*.html' --repeat 20
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from crawler.html_store import HtmlStore
+from crawler.parsing import available_backends, parse_page
+
+DEFAULT_PAGES = ["debug_page.html"]
+BASELINE_FILE = os.path.abspath(os.path.join(os.path.dirname(__file__), "parser_baseline.json"))
+FIXED_TIMESTAMP = "1970-01-01T00:00:00"
+
+
+def load_pages(extra_globs, max_snapshots):
+    pages = []
+    for pattern in DEFAULT_PAGES + list(extra_globs):
+        for path in sorted(glob.glob(pattern)):
+            with open(path, "r", encoding="utf-8") as f:
+                pages.append((path, f.read()))
+
+    if max_snapshots:
+        store = HtmlStore()
+        for entry in list(store)[:max_snapshots]:
+            pages.append((entry["url"], store.get(entry["guid"])))
+    return pages
+
+
+def run_backend(backend, pages, repeat):
+    records = [parse_page(html, name, FIXED_TIMESTAMP, backend=backend) for name, html in pages]
+    # Best pass, not the mean: scheduler noise only ever makes a pass slower
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for name, html in pages:
+            parse_page(html, name, FIXED_TIMESTAMP, backend=backend)
+        best = min(best, time.perf_counter() - started)
+    return records, len(pages) / best if best else float("inf")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the section page parser backends.")
+    parser.add_argument("--pages", nargs="*", default=[], help="Extra HTML files/globs to include")
+    parser.add_argument("--snapshots", type=int, default=200, help="Stored snapshots to include (0 to skip)")
+    parser.add_argument("--repeat", type=int, default=10, help="Passes over the page set per backend")
+    parser.add_argument("--baseline", default=BASELINE_FILE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.5,
+                        help="Allowed slowdown vs. baseline before failing (0.5 = 50%%; shared boxes are noisy)")
+    parser.add_argument("--require-baseline", action="store_true",
+                        help="Fail instead of warning when there is no baseline to compare against")
+    args = parser.parse_args()
+
+    pages = load_pages(args.pages, args.snapshots)
+    if not pages:
+        print("❌ No pages to parse (debug_page.html missing and no snapshots).")
+        sys.exit(1)
+    print(f"📄 {len(pages)} pages x {args.repeat} passes")
+
+    baseline = {}
+    failures = []
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    elif not args.save_baseline:
+        print(f"⚠️  NO BASELINE at {args.baseline}: throughput is NOT checked for regressions, only parity.")
+        print("   Record this machine's numbers with: python bench/bench_parser.py --save-baseline")
+        if args.require_baseline:
+            failures.append(f"no baseline at {args.baseline}")
+
+    results = {}
+    reference = None
+    for backend in available_backends():  # html.parser first: it is the reference
+        records, pages_per_sec = run_backend(backend, pages, args.repeat)
+        if reference is None:
+            reference = records
+        mismatches = [name for (name, _), a, b in zip(pages, reference, records) if a != b]
+        results[backend] = pages_per_sec
+
+        line = f"   {backend:<12} {pages_per_sec:9.1f} pages/sec  {1000 / pages_per_sec:7.2f} ms/page"
+        if mismatches:
+            line += f"  ❌ {len(mismatches)} records differ from html.parser (first: {mismatches[0]})"
+            failures.append(f"{backend}: output differs")
+        if backend in baseline:
+            change = pages_per_sec / baseline[backend] - 1
+            line += f"  ({change:+.0%} vs baseline)"
+            if change < -args.tolerance:
+                failures.append(f"{backend}: {pages_per_sec:.1f} pages/sec vs baseline {baseline[backend]:.1f}")
+        print(line)
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.baseline) or ".", exist_ok=True)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"💾 Baseline saved to {args.baseline}")
+
+    if failures:
+        print("❌ Parser benchmark failed: " + "; ".join(failures))
+        sys.exit(1)
+    print("✅ Parser benchmark passed." if baseline or args.save_baseline
+          else "✅ Parser benchmark passed (parity only; no baseline, so speed was not checked).")
+
+
+if __name__ == "__main__":
+    main()
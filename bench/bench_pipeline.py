@@ -0,0 +1,278 @@
+"""
+End-to-end pipeline benchmark against local stand-ins (bench/fixtures.py).
+
+Runs the real pipeline code with the network services swapped out:
+    discover  crawler/discover_all_urls.discover_urls()  -> fixture HTTP server
+    extract   crawler/extract_sections.extract_content() -> fixture HTTP server
+    index     indexer/index_data.index_records()         -> fake embedder, in-memory index
+    query     agent/server.AgentService.answer()         -> hybrid retrieval, fake Gemini
+(agent/rag_agent.py is only an HTTP client for AgentService, so the query stage
+drives the service directly.) Everything runs in a scratch directory, so
+nothing under data/ is touched; stage output goes to bench.log there.
+
+Reports folders/sec and pages/sec crawled, docs/sec embedded and query
+p50/p99 latency, checks every synthetic section made it through each stage,
+and exits non-zero on a miss or a regression beyond --tolerance against the
+saved baseline. Spans from the run (common/tracing.py) break each stage's
+time down by step; with --keep they stay in the scratch data/traces.jsonl.
+
+Usage:
+    python bench/bench_pipeline.py                      # measure + compare
+    python bench/bench_pipeline.py --save-baseline      # record this box's numbers
+    python bench/bench_pipeline.py --require-baseline   # CI: fail when no baseline is recorded
+    python bench/bench_pipeline.py --titles 8 --page-latency 0.05 --llm-latency 0.5 --keep
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bench.fixtures import FakeChat, FakeEmbeddings, FixtureServer, HttpCrawler, MemoryIndex, SyntheticSite
+from common.jsonl_reader import JsonlReader
+from common.state_store import DISCOVER, EXTRACT, StateStore, index_stage
+from common.tracing import TRACE_FILE, configure, export, load_spans, summarize
+
+BASELINE_FILE = os.path.abspath(os.path.join(os.path.dirname(__file__), "pipeline_baseline.json"))
+DATA_FILE = "data/extracted_data.jsonl"
+KEYWORD_DIR = "data/keyword_index"
+CHUNKING = "structure"
+
+# metric -> True when higher is better
+METRICS = {
+    "discover_folders_per_sec": True,
+    "extract_pages_per_sec": True,
+    "index_docs_per_sec": True,
+    "query_p50_ms": False,
+    "query_p99_ms": False,
+}
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, round(q / 100 * (len(ordered) - 1)))]
+
+
+def run_crawl(args, server, log):
+    from crawler.discover_all_urls import discover_urls
+    from crawler.extract_sections import extract_content
+
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(log):
+        asyncio.run(discover_urls(args.concurrency, rate=args.rate, burst=args.concurrency,
+                                  start_url=server.start_url, crawler=HttpCrawler()))
+    discover_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(log):
+        asyncio.run(extract_content(args.concurrency, args.concurrency * 2, rate=args.rate, crawler=HttpCrawler()))
+    extract_seconds = time.perf_counter() - started
+
+    state = StateStore(migrate=False)
+    counts = state.counts()
+    state.close()
+    folders = counts.get(DISCOVER, {}).get("done", 0)
+    extracted = counts.get(EXTRACT, {}).get("done", 0)
+    return {"folders": folders, "extracted": extracted,
+            "discover_folders_per_sec": folders / discover_seconds,
+            "extract_pages_per_sec": extracted / extract_seconds}
+
+
+def run_index(args, embedder, index, log):
+    from indexer.index_data import Uploader, index_records
+
+    state = StateStore(migrate=False)
+    reader = JsonlReader(DATA_FILE, required_keys=("source_url",))
+    uploader = Uploader(index, state, index_stage("memory", CHUNKING))
+    uploader.start()
+    started = time.perf_counter()
+    try:
+        with contextlib.redirect_stdout(log):
+            stats = index_records(reader, embedder, uploader, CHUNKING, args.batch_size)
+    finally:
+        uploader.close()
+        state.close()
+    seconds = time.perf_counter() - started
+    return {"docs": stats["docs"], "chunks": stats["chunks"], "failed_batches": uploader.failed,
+            "index_docs_per_sec": stats["docs"] / seconds}
+
+
+def questions_for(site, n):
+    # Heading + a phrase from the text, as a user would paraphrase a section
+    questions = []
+    for i in range(n):
+        _, section = site.sections[(i * 7919) % len(site.sections)]
+        words = section["text"].split()[3:9]
+        questions.append(f"What are the {section['heading'].lower()} rules in Title {section['title_number']} "
+                         f"about {' '.join(words)}?")
+    return questions
+
+
+async def ask_all(service, questions, concurrency):
+    slots = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def ask(question):
+        async with slots:
+            started = time.perf_counter()
+            async for event, _ in service.answer(question):
+                if event == "error":
+                    raise RuntimeError(f"query failed: {question}")
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    await asyncio.gather(*(ask(q) for q in questions))
+    return latencies
+
+
+def run_queries(args, site, embedder, index, log):
+    from agent.hybrid_retriever import HybridRetriever
+    from agent.server import AgentService
+    from indexer.keyword_index import KeywordIndex, build as build_keyword_index
+    from indexer.local_index import LocalVectorStore
+
+    with contextlib.redirect_stdout(log):
+        build_keyword_index(DATA_FILE, KEYWORD_DIR, strategy=CHUNKING)
+    retriever = HybridRetriever(LocalVectorStore(index, embedder), KeywordIndex(KEYWORD_DIR))
+    llm = FakeChat(first_token_latency=args.llm_latency, token_latency=args.token_latency, tokens=args.llm_tokens)
+    questions = questions_for(site, args.queries)
+
+    async def run():
+        # The service's semaphore and thread pool belong to the loop that runs the queries
+        service = AgentService(retriever, llm, answer_cache=None)
+        try:
+            return await ask_all(service, questions, args.query_concurrency)
+        finally:
+            service.executor.shutdown(wait=True)
+
+    latencies = asyncio.run(run())
+    return {"queries": len(latencies),
+            "query_p50_ms": percentile(latencies, 50),
+            "query_p99_ms": percentile(latencies, 99)}
+
+
+def print_hot_paths():
+    # Where each stage's time went, from the spans the run just wrote
+    if not os.path.exists(TRACE_FILE):
+        return
+    _, breakdown = summarize(load_spans(TRACE_FILE))
+    for root, parts in sorted(breakdown.items()):
+        if parts:
+            print(f"   🔥 {root}: " + ", ".join(f"{child} {share:.0%}" for child, _, share in parts[:4]))
+
+
+def compare(results, baseline, tolerance):
+    failures = []
+    for metric, higher_is_better in METRICS.items():
+        value = results[metric]
+        line = f"   {metric:<26} {value:10.1f}"
+        if metric in baseline and baseline[metric]:
+            change = value / baseline[metric] - 1
+            line += f"  ({change:+.0%} vs baseline {baseline[metric]:.1f})"
+            regressed = change < -tolerance if higher_is_better else change > tolerance
+            if regressed:
+                line += "  ❌"
+                failures.append(f"{metric}: {value:.1f} vs baseline {baseline[metric]:.1f}")
+        print(line)
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark discover -> extract -> index -> query on local fixtures.")
+    parser.add_argument("--titles", type=int, default=4, help="Synthetic titles (x chapters x sections pages)")
+    parser.add_argument("--chapters", type=int, default=5)
+    parser.add_argument("--sections", type=int, default=20, help="Sections per chapter")
+    parser.add_argument("--page-latency", type=float, default=0.0, help="Seconds the fixture server waits per page")
+    parser.add_argument("--concurrency", type=int, default=8, help="Crawler pages in flight")
+    parser.add_argument("--rate", type=float, default=1000.0, help="Per-host requests/sec (the fixture host)")
+    parser.add_argument("--batch-size", type=int, default=256, help="Chunks per encode call")
+    parser.add_argument("--embed-latency", type=float, default=0.0, help="Seconds per fake embedding call")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--query-concurrency", type=int, default=16)
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="Fake Gemini seconds to first token")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="Fake Gemini seconds per further token")
+    parser.add_argument("--llm-tokens", type=int, default=60)
+    parser.add_argument("--baseline", default=BASELINE_FILE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.5,
+                        help="Allowed change vs. baseline before failing (0.5 = 50%%; shared boxes are noisy)")
+    parser.add_argument("--require-baseline", action="store_true",
+                        help="Fail instead of warning when there is no baseline to compare against")
+    parser.add_argument("--keep", action="store_true", help="Keep the scratch directory (printed at the end)")
+    args = parser.parse_args()
+
+    baseline = {}
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    elif not args.save_baseline:
+        print(f"⚠️  NO BASELINE at {args.baseline}: throughput and latency are NOT checked for regressions.")
+        print("   Record this machine's numbers with: python bench/bench_pipeline.py --save-baseline")
+        if args.require_baseline:
+            print(f"❌ Pipeline benchmark failed: no baseline at {args.baseline}")
+            sys.exit(1)
+
+    site = SyntheticSite(args.titles, args.chapters, args.sections)
+    print(f"🧪 Synthetic site: {site.folders} folders, {len(site.sections)} sections "
+          f"(page latency {args.page_latency * 1000:.0f} ms, LLM first token {args.llm_latency * 1000:.0f} ms)")
+
+    workdir = tempfile.mkdtemp(prefix="ccr-bench-")
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    os.makedirs("data")
+    configure(trace_file=os.path.abspath(TRACE_FILE), metrics_dir=os.path.abspath("data/metrics"))
+    failures = []
+    try:
+        with open("bench.log", "w", encoding="utf-8") as log, \
+             FixtureServer(site, latency=args.page_latency) as server:
+            results = run_crawl(args, server, log)
+            print(f"🕷️  Crawl: {results['folders']} folders, {results['extracted']} sections extracted")
+
+            embedder = FakeEmbeddings(latency=args.embed_latency)
+            index = MemoryIndex(dimension=embedder.dimension)
+            results.update(run_index(args, embedder, index, log))
+            print(f"🧮 Index: {results['docs']} docs, {results['chunks']} chunks")
+
+            results.update(run_queries(args, site, embedder, index, log))
+            print(f"💬 Query: {results['queries']} questions, {args.query_concurrency} at a time")
+
+        if results["folders"] != site.folders:
+            failures.append(f"discovered {results['folders']} of {site.folders} folders")
+        if results["extracted"] != len(site.sections):
+            failures.append(f"extracted {results['extracted']} of {len(site.sections)} sections")
+        if results["docs"] != len(site.sections) or results["failed_batches"]:
+            failures.append(f"indexed {results['docs']} of {len(site.sections)} sections "
+                            f"({results['failed_batches']} failed batches)")
+        export()
+        print_hot_paths()
+    finally:
+        configure(enabled=False)  # Nothing more goes to the scratch directory
+        os.chdir(cwd)
+        if args.keep:
+            print(f"📁 Scratch directory kept: {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    print("📊 Results:")
+    failures += compare(results, baseline, args.tolerance)
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({metric: results[metric] for metric in METRICS}, f, indent=2)
+        print(f"💾 Baseline saved to {args.baseline}")
+
+    if failures:
+        print("❌ Pipeline benchmark failed: " + "; ".join(failures))
+        sys.exit(1)
+    print("✅ Pipeline benchmark passed." if baseline or args.save_baseline
+          else "✅ Pipeline benchmark passed (correctness only; no baseline, so speed was not checked).")
+
+
+if __name__ == "__main__":
+    main()
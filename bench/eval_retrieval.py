@@ -0,0 +1,380 @@
+"""
+Retrieval evaluation: recall@k, MRR and query latency for each retriever configuration.
+
+A golden set is a JSONL file of questions and the sections that answer them:
+    {"id": "q1", "question": "...", "expected": ["13 CCR § 2030", "https://govt.westlaw.com/calregs/Document/I..."]}
+Expected entries are citations or section source URLs, one per relevant
+section; a retrieved passage counts when its section matches one. `generate`
+writes a starter set from the section headings in extracted_data.jsonl (one
+question per unambiguous heading, expected = that section). Those questions
+reuse the heading's words, so they are easier than real user questions; add
+hand-written ones for a decision that matters.
+
+A configuration is model x chunking x quantization x mode x k:
+    model     minilm (all-MiniLM-L6-v2, 384-d, indexer/index_data.py)
+              google (text-embedding-004, 768-d, reset_db.py; every query is an API call)
+              hash   (bench/fixtures.py feature hashing: no download or API, a lexical floor)
+    chunking  structure | section (indexer/chunking.py)
+    quant     none | int8 | binary first-pass scan (indexer/local_index.py), rescored exactly
+    mode      dense (vectors only) | hybrid (BM25 + vectors with RRF, citation lookup)
+    k         passages handed to the prompt (agent/pipeline.py TOP_K, AGENT_TOP_K)
+
+Each (model, chunking) pair gets its own local index under data/eval/, built once
+from the corpus through the shared embedding cache and reused until the corpus
+changes (--rebuild forces it). Searches go through agent/hybrid_retriever.py, so
+scopes, fusion and citation lookup behave exactly as in the agent. Query
+latency is one search() call, query embedding included (uncached).
+
+With --min-recall, the cheapest configuration that reaches it is picked:
+no per-query API call first, then the smallest k (fewer prompt tokens per
+answer), then the smallest scan (MB read per query), then the lowest p50.
+
+Usage:
+    python bench/eval_retrieval.py generate [--count 200]
+    python bench/eval_retrieval.py run [--models minilm google] [--chunking structure section]
+                                       [--modes dense hybrid] [--k 3 5 10] [--min-recall 0.9]
+    python bench/eval_retrieval.py run --golden my_questions.jsonl --models hash --limit 50
+"""
+import argparse
+import json
+import os
+import random
+import re
+import shutil
+import sys
+import time
+from collections import Counter
+from datetime import datetime
+
+from dotenv import load_dotenv
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from agent.hybrid_retriever import HybridRetriever, passage_key
+from common.jsonl_reader import JsonlReader
+from indexer.chunking import STRATEGIES, chunk_record, embedding_text
+from indexer.embedders import GOOGLE_MODEL, MINILM_MODEL, MODEL_DIMENSIONS, get_embeddings
+from indexer.embedding_cache import CachedEmbeddings, EmbeddingCache
+from indexer.keyword_index import KeywordIndex, build as build_keyword_index, citation_key, citation_keys_from_query
+from indexer.local_index import QUANTIZATIONS, LocalVectorIndex, LocalVectorStore, code_width
+
+# --- CONFIGURATION ---
+load_dotenv()  # GOOGLE_API_KEY for --models google
+
+INPUT_FILE = "data/extracted_data.jsonl"
+EVAL_DIR = "data/eval"
+GOLDEN_FILE = os.path.join(EVAL_DIR, "golden.jsonl")
+RESULTS_FILE = os.path.join(EVAL_DIR, "results.jsonl")
+ENCODE_BATCH = 256
+SOURCE_STAMP = "source.json"
+
+MODELS = {
+    # name -> (model id, calls an API per query)
+    "minilm": (MINILM_MODEL, False),
+    "google": (GOOGLE_MODEL, True),
+    "hash": ("hash", False),
+}
+MODES = ("dense", "hybrid")
+
+QUESTION_TEMPLATES = [
+    "What are the requirements for {topic}?",
+    "What do the regulations say about {topic}?",
+    "Which rules apply to {topic}?",
+    "How does California regulate {topic}?",
+]
+
+
+# --- GOLDEN SET ---
+def heading_topic(heading):
+    topic = re.sub(r"^§+\s*[\d.]+[a-z]?\.?\s*", "", heading or "").strip().rstrip(".")
+    return topic[0].lower() + topic[1:] if topic else ""
+
+
+def generate(input_file, output_file, count, seed=0):
+    headings = Counter()
+    candidates = []
+    for record in JsonlReader(input_file, required_keys=("source_url",)):
+        topic = heading_topic(record.get("section_heading"))
+        if not record.get("content_markdown") or len(topic.split()) < 2:
+            continue
+        headings[topic.lower()] += 1
+        candidates.append((topic, record))
+
+    # A heading shared by several sections ("Definitions.") has no single right answer
+    candidates = [(topic, record) for topic, record in candidates if headings[topic.lower()] == 1]
+    rng = random.Random(seed)
+    rng.shuffle(candidates)
+
+    os.makedirs(os.path.dirname(output_file) or ".", exist_ok=True)
+    with open(output_file, "w", encoding="utf-8") as f:
+        for n, (topic, record) in enumerate(candidates[:count]):
+            f.write(json.dumps({
+                "id": f"gen-{n + 1}",
+                "question": QUESTION_TEMPLATES[n % len(QUESTION_TEMPLATES)].format(topic=topic),
+                "expected": [record["source_url"]],
+                "citation": record.get("citation", ""),
+                "generated": True,
+            }) + "\n")
+    written = min(count, len(candidates))
+    print(f"📝 Wrote {written} questions to {output_file} ({len(candidates)} unambiguous headings available)")
+    return written
+
+
+def load_golden(path, limit=None):
+    questions = []
+    for item in JsonlReader(path, required_keys=("question", "expected")):
+        expected = item["expected"] if isinstance(item["expected"], list) else [item["expected"]]
+        urls = {e for e in expected if str(e).startswith("http")}
+        citations = set()
+        for e in expected:
+            if not str(e).startswith("http"):
+                citations.update(citation_keys_from_query(str(e)))
+        questions.append({"id": item.get("id", len(questions) + 1), "question": item["question"],
+                          "urls": urls, "citations": citations, "targets": len(expected)})
+        if limit and len(questions) >= limit:
+            break
+    return questions
+
+
+def relevant_target(doc, question):
+    """The expected entry this passage satisfies (its URL or citation key), or None."""
+    url, _ = passage_key(doc)
+    if url in question["urls"]:
+        return url
+    key = citation_key(doc.metadata.get("title_number"), doc.metadata.get("section_number"))
+    return key if key in question["citations"] else None
+
+
+# --- INDEXES ---
+def source_stamp(input_file, **extra):
+    stat = os.stat(input_file)
+    return {"input": os.path.abspath(input_file), "size": stat.st_size, "mtime": stat.st_mtime, **extra}
+
+
+def is_current(path, stamp):
+    try:
+        with open(os.path.join(path, SOURCE_STAMP), "r", encoding="utf-8") as f:
+            return json.load(f) == stamp
+    except (OSError, ValueError):
+        return False
+
+
+def write_stamp(path, stamp):
+    with open(os.path.join(path, SOURCE_STAMP), "w", encoding="utf-8") as f:
+        json.dump(stamp, f)
+
+
+def load_embedder(model):
+    model_id, _ = MODELS[model]
+    if model == "hash":
+        from bench.fixtures import FakeEmbeddings
+        return FakeEmbeddings()
+    return get_embeddings(model_id)
+
+
+def build_vector_index(path, input_file, embedder, model, chunking, use_cache):
+    model_id, _ = MODELS[model]
+    dimension = MODEL_DIMENSIONS.get(model_id) or embedder.dimension
+    index = LocalVectorIndex.create(path, dimension=dimension, model=model_id, overwrite=True)
+    if use_cache and model != "hash":
+        embedder = CachedEmbeddings(embedder, model_id, EmbeddingCache())
+
+    from indexer.index_data import chunk_metadata
+    pending = []  # (record, chunk)
+
+    def flush():
+        vectors = embedder.embed_documents([embedding_text(chunk) for _, chunk in pending])
+        index.upsert(vectors=[
+            {"id": chunk["id"], "values": values, "metadata": chunk_metadata(record, chunk)}
+            for (record, chunk), values in zip(pending, vectors)
+        ])
+        pending.clear()
+
+    for record in JsonlReader(input_file, required_keys=("source_url",)):
+        if not record.get("content_markdown"):
+            continue
+        pending.extend((record, chunk) for chunk in chunk_record(record, strategy=chunking))
+        if len(pending) >= ENCODE_BATCH:
+            flush()
+    if pending:
+        flush()
+    return LocalVectorIndex(path)
+
+
+def open_indexes(args, model, chunking, embedder):
+    vector_path = os.path.join(EVAL_DIR, f"{model}-{chunking}")
+    stamp = source_stamp(args.input, model=MODELS[model][0], chunking=chunking)
+    if args.rebuild or not is_current(vector_path, stamp):
+        print(f"🧮 Building {vector_path} ({model}, {chunking} chunking)...")
+        started = time.perf_counter()
+        index = build_vector_index(vector_path, args.input, embedder, model, chunking, not args.no_cache)
+        write_stamp(vector_path, stamp)
+        print(f"   {len(index)} vectors in {time.perf_counter() - started:.1f}s")
+    else:
+        index = LocalVectorIndex(vector_path)
+
+    keyword_path = os.path.join(EVAL_DIR, f"keyword-{chunking}")
+    stamp = source_stamp(args.input, chunking=chunking)
+    if "hybrid" in args.modes and (args.rebuild or not is_current(keyword_path, stamp)):
+        print(f"📑 Building {keyword_path}...")
+        build_keyword_index(args.input, keyword_path, strategy=chunking)
+        write_stamp(keyword_path, stamp)
+    keyword_index = KeywordIndex(keyword_path) if "hybrid" in args.modes else None
+    return index, keyword_index
+
+
+def quantized_copy(args, index, quantization):
+    """The base index, or a quantized copy of it beside it (rebuilt when the base changes)."""
+    if quantization == "none":
+        return index
+    path = f"{index.path}-{quantization}"
+    with open(os.path.join(index.path, SOURCE_STAMP), "r", encoding="utf-8") as f:
+        stamp = {**json.load(f), "quantization": quantization}
+    if args.rebuild or not is_current(path, stamp):
+        print(f"🗜️  Quantizing a copy of {index.path} to {quantization}...")
+        shutil.rmtree(path, ignore_errors=True)
+        shutil.copytree(index.path, path)
+        LocalVectorIndex(path).quantize(quantization)
+        write_stamp(path, stamp)
+    return LocalVectorIndex(path, oversample=args.oversample)
+
+
+def scan_mb(index):
+    """Bytes the first-pass scan reads: the codes when quantized, else the float vectors."""
+    if index.quantization == "none":
+        return len(index) * index.dimension * index.dtype.itemsize / 1e6
+    per_row = code_width(index.quantization, index.dimension) + (4 if index.quantization == "int8" else 0)
+    return len(index) * per_row / 1e6
+
+
+# --- EVALUATION ---
+def percentile(values, q):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, round(q / 100 * (len(ordered) - 1)))]
+
+
+def evaluate(retriever, questions, k):
+    recalls, reciprocal_ranks, latencies = [], [], []
+    for question in questions:
+        started = time.perf_counter()
+        docs = retriever.search(question["question"], k)
+        latencies.append((time.perf_counter() - started) * 1000)
+
+        found = set()
+        first_rank = None
+        for rank, doc in enumerate(docs[:k], start=1):
+            target = relevant_target(doc, question)
+            if target:
+                found.add(target)
+                first_rank = first_rank or rank
+        recalls.append(len(found) / max(1, question["targets"]))
+        reciprocal_ranks.append(1.0 / first_rank if first_rank else 0.0)
+
+    n = max(1, len(questions))
+    return {"recall": sum(recalls) / n, "mrr": sum(reciprocal_ranks) / n,
+            "p50_ms": percentile(latencies, 50), "p99_ms": percentile(latencies, 99)}
+
+
+def cheapest(results, min_recall):
+    passing = [r for r in results if r["recall"] >= min_recall]
+    if not passing:
+        return None
+    return min(passing, key=lambda r: (r["api_per_query"], r["k"], r["index_mb"], r["p50_ms"]))
+
+
+def print_table(results, best=None):
+    print(f"\n{'model':<8} {'chunking':<10} {'quant':<7} {'mode':<7} {'k':>3} {'recall@k':>9} {'MRR':>6} "
+          f"{'p50 ms':>8} {'p99 ms':>8} {'vectors':>8} {'scan MB':>8}")
+    for r in results:
+        marker = "  ⭐" if r is best else ""
+        print(f"{r['model']:<8} {r['chunking']:<10} {r['quantization']:<7} {r['mode']:<7} {r['k']:>3} "
+              f"{r['recall']:>9.3f} {r['mrr']:>6.3f} {r['p50_ms']:>8.1f} {r['p99_ms']:>8.1f} {r['vectors']:>8} "
+              f"{r['index_mb']:>8.1f}{marker}")
+
+
+def run(args):
+    if not os.path.exists(args.golden):
+        print(f"❌ No golden set at {args.golden}. Write one, or run: python bench/eval_retrieval.py generate")
+        return
+    questions = load_golden(args.golden, args.limit)
+    if not questions:
+        print(f"❌ {args.golden} has no usable questions.")
+        return
+    generated = sum(1 for line in JsonlReader(args.golden, required_keys=("question",)) if line.get("generated"))
+    print(f"🎯 {len(questions)} golden questions from {args.golden}"
+          f"{f' ({generated} generated from headings)' if generated else ''}")
+
+    results = []
+    for model in args.models:
+        embedder = load_embedder(model)
+        for chunking in args.chunking:
+            base_index, keyword_index = open_indexes(args, model, chunking, embedder)
+            for quantization in args.quantization:
+                index = quantized_copy(args, base_index, quantization)
+                # Query embeddings bypass the cache so latency includes the real embedding call
+                store = LocalVectorStore(index, embedder)
+                for mode in args.modes:
+                    retriever = HybridRetriever(store, keyword_index if mode == "hybrid" else None,
+                                                use_scopes=not args.no_scopes)
+                    for k in args.k:
+                        print(f"🔎 {model} / {chunking} / {quantization} / {mode} / k={k}...")
+                        scores = evaluate(retriever, questions, k)
+                        results.append({"model": model, "chunking": chunking, "quantization": quantization,
+                                        "mode": mode, "k": k, **scores, "vectors": len(index),
+                                        "index_mb": scan_mb(index), "api_per_query": MODELS[model][1]})
+
+    best = cheapest(results, args.min_recall) if args.min_recall is not None else None
+    print_table(results, best)
+    if args.min_recall is not None:
+        if best:
+            print(f"\n⭐ Cheapest configuration with recall@k >= {args.min_recall}: "
+                  f"{best['model']} / {best['chunking']} / {best['quantization']} / {best['mode']} / k={best['k']}")
+        else:
+            print(f"\n⚠️ No configuration reached recall@k >= {args.min_recall}.")
+
+    os.makedirs(EVAL_DIR, exist_ok=True)
+    with open(RESULTS_FILE, "a", encoding="utf-8") as f:
+        evaluated_at = datetime.now().isoformat(timespec="seconds")
+        for r in results:
+            f.write(json.dumps({"evaluated_at": evaluated_at, "golden": args.golden,
+                                "questions": len(questions), **r}) + "\n")
+    print(f"💾 Results appended to {RESULTS_FILE}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure recall@k, MRR and latency per retriever configuration.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    gen = sub.add_parser("generate", help="Write a golden set from section headings")
+    gen.add_argument("--input", default=INPUT_FILE)
+    gen.add_argument("--output", default=GOLDEN_FILE)
+    gen.add_argument("--count", type=int, default=200)
+    gen.add_argument("--seed", type=int, default=0)
+
+    ev = sub.add_parser("run", help="Evaluate every configuration against a golden set")
+    ev.add_argument("--golden", default=GOLDEN_FILE)
+    ev.add_argument("--input", default=INPUT_FILE, help="Corpus the evaluation indexes are built from")
+    ev.add_argument("--models", nargs="+", choices=sorted(MODELS), default=["minilm"])
+    ev.add_argument("--chunking", nargs="+", choices=STRATEGIES, default=list(STRATEGIES))
+    ev.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+    ev.add_argument("--k", nargs="+", type=int, default=[3, 5, 10])
+    ev.add_argument("--quantization", nargs="+", choices=QUANTIZATIONS, default=["none"],
+                    help="Local index storage to compare (int8 / binary are rescored with full precision)")
+    ev.add_argument("--oversample", type=int, default=None,
+                    help="Candidates rescored per result for quantized indexes (default: per quantization)")
+    ev.add_argument("--limit", type=int, default=None, help="Only the first N golden questions")
+    ev.add_argument("--min-recall", type=float, default=None, help="Accuracy bar for picking the cheapest config")
+    ev.add_argument("--no-scopes", action="store_true", help="Disable hierarchy-scoped search")
+    ev.add_argument("--no-cache", action="store_true", help="Re-embed the corpus instead of using the embedding cache")
+    ev.add_argument("--rebuild", action="store_true", help="Rebuild the evaluation indexes")
+    args = parser.parse_args()
+
+    if args.command == "generate":
+        generate(args.input, args.output, args.count, args.seed)
+    else:
+        run(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,358 @@
+"""
+Local stand-ins for the pipeline's external services, used by bench/bench_pipeline.py.
+
+    SyntheticSite  -> a deterministic CCR browse tree: home -> titles -> chapters
+                      -> section documents, with document pages shaped like
+                      debug_page.html (co_document, prelim hierarchy lines, § title)
+    FixtureServer  -> serves a SyntheticSite over HTTP on 127.0.0.1 (stdlib
+                      ThreadingHTTPServer) with an optional per-request delay
+    HttpCrawler    -> the part of crawl4ai's AsyncWebCrawler the crawlers use
+                      (arun() -> result.success / .html / .url), over plain HTTP
+    MemoryIndex    -> Pinecone-style upsert / delete / query(filter=...) held in a
+                      NumPy matrix; wraps in LocalVectorStore like the local index
+    FakeEmbeddings -> deterministic feature-hashing embedder (shared words give
+                      similar vectors), with optional per-call latency
+    FakeChat       -> invoke / ainvoke / astream with configurable first-token and
+                      per-token latency, like RateLimitedChat
+
+Nothing here talks to Westlaw, Pinecone or Google, so runs are repeatable and
+free. Usage on its own:
+    python bench/fixtures.py serve [--port 8765]   # browse the synthetic site
+"""
+import argparse
+import asyncio
+import hashlib
+import html
+import os
+import random
+import re
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from indexer.local_index import matches_filter
+
+BROWSE_PATH = "/calregs/Browse/Home/California/CaliforniaCodeofRegulations"
+HOME_QUERY = "transitionType=Default&contextData=%28sc.Default%29"
+
+TITLE_NAMES = ["General Provisions", "Administration", "Food and Agriculture", "Business Regulations",
+               "Education", "Harbors and Navigation", "Industrial Relations", "Insurance", "Motor Vehicles",
+               "Natural Resources", "Public Health", "Social Security", "Water", "Building Standards"]
+TOPICS = ["emission standards", "license renewal", "inspection procedures", "fee schedule", "recordkeeping",
+          "permit applications", "penalty assessment", "safety equipment", "hazardous materials",
+          "reporting requirements", "certification", "appeals", "exemptions", "testing methods",
+          "labeling", "training requirements", "enforcement", "definitions", "storage tanks", "variances"]
+WORDS = ("operator shall maintain records vehicle permit department applicant inspection facility "
+         "standard requirement notice hearing violation fee annual written approved equipment "
+         "emission test report license owner board within days pursuant section subdivision "
+         "except provided person agency filed certificate renewal penalty compliance").split()
+
+
+def _guid(seed):
+    return "I" + hashlib.md5(seed.encode("utf-8")).hexdigest().upper()
+
+
+class SyntheticSite:
+    """Pages keyed by path+query; sections lists (url, record-like dict) for checks and golden sets."""
+
+    def __init__(self, titles=4, chapters=5, sections=20, seed=0):
+        rng = random.Random(seed)
+        self.pages = {}
+        self.sections = []
+        home = f"{BROWSE_PATH}?{HOME_QUERY}"
+        title_links = []
+        for t in range(1, titles + 1):
+            title_number = str(t * 3 + 1)
+            title_name = TITLE_NAMES[t % len(TITLE_NAMES)]
+            title_path = f"{BROWSE_PATH}?guid={_guid(f'title-{t}')}"
+            title_links.append((title_path, f"Title {title_number}. {title_name}"))
+            chapter_links = []
+            for c in range(1, chapters + 1):
+                chapter_name = f"{rng.choice(TOPICS).title()} Program"
+                chapter_path = f"{BROWSE_PATH}?guid={_guid(f'chapter-{t}-{c}')}"
+                chapter_links.append((chapter_path, f"Chapter {c}. {chapter_name}"))
+                section_links = []
+                for s in range(1, sections + 1):
+                    number = f"{t * 1000 + c * 100 + s}"
+                    heading = rng.choice(TOPICS).capitalize()
+                    path = f"/calregs/Document/{_guid(f'section-{t}-{c}-{s}')}?viewType=FullText"
+                    paragraphs = [self._paragraph(rng, marker, heading) for marker in "abcd"[:rng.randint(2, 4)]]
+                    self.pages[path] = self._document(title_number, title_name, c, chapter_name,
+                                                      number, heading, paragraphs)
+                    self.sections.append((path, {"title_number": title_number, "section_number": number,
+                                                 "chapter": f"{c}. {chapter_name}", "heading": heading,
+                                                 "text": "\n".join(paragraphs)}))
+                    section_links.append((path, f"§ {number}. {heading}"))
+                self.pages[chapter_path] = self._folder(f"Chapter {c}. {chapter_name}", section_links)
+            self.pages[title_path] = self._folder(f"Title {title_number}. {title_name}", chapter_links)
+        self.pages[home] = self._folder("California Code of Regulations", title_links)
+        self.home = home
+        self.folders = 1 + titles + titles * chapters
+
+    @staticmethod
+    def _paragraph(rng, marker, heading):
+        words = [rng.choice(WORDS) for _ in range(rng.randint(30, 80))]
+        return f"({marker}) The {heading.lower()} " + " ".join(words) + "."
+
+    @staticmethod
+    def _nav():
+        # Links that are neither folders nor documents, like the real page chrome
+        return ('<a href="/calregs/Index" class="applinknavigation">Home</a> '
+                '<a href="/calregs/Search" class="applinknavigation">Search</a> '
+                '<a href="#" class="co_skipToLink">Skip to Main Content</a>')
+
+    def _folder(self, heading, links):
+        items = "".join(f'<li><a href="{html.escape(path)}">{html.escape(text)}</a></li>' for path, text in links)
+        return (f'<!DOCTYPE html><html lang="en"><head><meta charset="utf-8"><title>{html.escape(heading)}'
+                f' | California Code of Regulations</title></head><body class="standardTemplate">'
+                f'<header id="co_headerWrapper">{self._nav()}</header><div id="co_contentWrapper">'
+                f'<h1>{html.escape(heading)}</h1><ul class="co_genericWhiteBox">{items}</ul></div></body></html>')
+
+    def _document(self, title_number, title_name, chapter, chapter_name, number, heading, paragraphs):
+        body = "".join(f'<div class="co_paragraph"><div class="co_paragraphText">{html.escape(p)}</div></div>'
+                       for p in paragraphs)
+        return (
+            f'<!DOCTYPE html><html lang="en"><head><meta charset="utf-8">'
+            f'<title>§ {number}. {html.escape(heading)} | California Code of Regulations</title></head>'
+            f'<body class="standardTemplate"><div id="co_pageContainer"><div id="co_mainContainer">'
+            f'<header id="co_headerWrapper">{self._nav()}</header><div id="co_contentWrapper">'
+            f'<div id="co_document" class="co_document co_codesStateAdminCodes"><div class="co_documentHead">'
+            f'<div class="co_contentBlock co_prelimBlock co_headtext">Barclays California Code of Regulations '
+            f'<div id="co_prelimContainer"><div class="co_contentBlock co_prelimHead co_headtext">'
+            f'Title&nbsp;{title_number}. {html.escape(title_name)}'
+            f'<div class="co_contentBlock co_prelimHead co_headtext"> Chapter {chapter}. {html.escape(chapter_name)}'
+            f'</div></div></div></div><div class="co_cites">{title_number} CCR § {number}</div>'
+            f'<div class="co_title"><div class="co_headtext"><strong>§ {number}. {html.escape(heading)}</strong>'
+            f'</div></div></div><div class="co_contentBlock co_section">{body}'
+            f'<div class="co_printHeading"><h2>Credits</h2></div>'
+            f'<div class="co_paragraph"><div class="co_paragraphText">History</div></div>'
+            f'<div class="co_paragraph"><div class="co_paragraphText">1. New section filed 1-8-82; '
+            f'operative 2-7-82 (Register 82, No. 2).</div></div>'
+            f'<div class="co_contentBlock co_includeCurrencyBlock">This database is current through 1/9/26 '
+            f'Register 2026, No. 2.</div></div><div class="co_contentBlock co_cmdExpandedcite">'
+            f'Cal. Admin. Code tit. {title_number}, § {number}, {title_number} CA ADC § {number}</div>'
+            f'</div></div></div></div></body></html>'
+        )
+
+
+class FixtureServer:
+    """Serves a SyntheticSite from a background thread; use as a context manager."""
+
+    def __init__(self, site, latency=0.0, port=0):
+        pages = site.pages
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if latency:
+                    time.sleep(latency)
+                page = pages.get(self.path)
+                if page is None:
+                    self.send_error(404)
+                    return
+                body = page.encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.site = site
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self.httpd.daemon_threads = True
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.httpd.server_address[1]}"
+
+    @property
+    def start_url(self):
+        return self.base_url + self.site.home
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class HttpCrawler:
+    """AsyncWebCrawler.arun() over urllib; the browser options (js_code, wait_for, ...) are ignored."""
+
+    def __init__(self, timeout=30):
+        self.timeout = timeout
+        self.requests = 0
+
+    def _get(self, url):
+        with urllib.request.urlopen(url, timeout=self.timeout) as response:
+            return response.read().decode("utf-8")
+
+    async def arun(self, url, **kwargs):
+        self.requests += 1
+        try:
+            page = await asyncio.to_thread(self._get, url)
+        except (urllib.error.URLError, OSError) as e:
+            return SimpleNamespace(success=False, html="", url=url, status_code=None, error_message=str(e))
+        return SimpleNamespace(success=True, html=page, url=url, status_code=200, error_message=None)
+
+
+class MemoryIndex:
+    """In-memory stand-in for a Pinecone index (and LocalVectorIndex.query for LocalVectorStore)."""
+
+    def __init__(self, dimension=384, model="fake"):
+        self.dimension = dimension
+        self.model = model
+        self.vectors = {}
+        self.metadata = {}
+        self._ids = None
+        self._matrix = None
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.vectors)
+
+    def upsert(self, vectors):
+        with self.lock:
+            for item in vectors:
+                values = np.asarray(item["values"], dtype=np.float32)
+                norm = np.linalg.norm(values)
+                self.vectors[item["id"]] = values / norm if norm else values
+                self.metadata[item["id"]] = item.get("metadata", {})
+            self._matrix = None
+
+    def delete(self, ids):
+        with self.lock:
+            removed = [vid for vid in ids if self.vectors.pop(vid, None) is not None]
+            for vid in removed:
+                del self.metadata[vid]
+            self._matrix = None
+        return len(removed)
+
+    def query(self, vector, top_k=3, filter=None):
+        with self.lock:
+            if self._matrix is None:
+                self._ids = list(self.vectors)
+                self._matrix = (np.stack([self.vectors[vid] for vid in self._ids])
+                                if self._ids else np.zeros((0, self.dimension), dtype=np.float32))
+            ids, matrix = self._ids, self._matrix
+        query = np.asarray(vector, dtype=np.float32)
+        scores = matrix @ (query / (np.linalg.norm(query) or 1.0))
+        order = np.argsort(-scores)
+        matches = []
+        for row in order:
+            metadata = self.metadata[ids[row]]
+            if filter and not matches_filter(metadata, filter):
+                continue
+            matches.append({"id": ids[row], "score": float(scores[row]), "metadata": metadata})
+            if len(matches) >= top_k:
+                break
+        return matches
+
+
+class FakeEmbeddings:
+    """Feature hashing over lower-cased words: deterministic, and texts sharing words score as similar."""
+
+    TOKEN_RE = re.compile(r"\w+")
+
+    def __init__(self, dimension=384, latency=0.0, per_text_latency=0.0):
+        self.dimension = dimension
+        self.latency = latency
+        self.per_text_latency = per_text_latency
+        self.calls = 0
+        self._buckets = {}
+
+    def _bucket(self, token):
+        bucket = self._buckets.get(token)
+        if bucket is None:
+            digest = int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "little")
+            bucket = self._buckets[token] = (digest % self.dimension, 1.0 if digest >> 63 else -1.0)
+        return bucket
+
+    def _vector(self, text):
+        vector = np.zeros(self.dimension, dtype=np.float32)
+        for token in self.TOKEN_RE.findall(text.lower()):
+            index, sign = self._bucket(token)
+            vector[index] += sign
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts):
+        self.calls += 1
+        if self.latency or self.per_text_latency:
+            time.sleep(self.latency + self.per_text_latency * len(texts))
+        return [self._vector(t) for t in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+    def embed_queries(self, texts):
+        return self.embed_documents(texts)
+
+
+class FakeChat:
+    """Streams a canned answer with first_token_latency, then token_latency per token (seconds)."""
+
+    def __init__(self, first_token_latency=0.3, token_latency=0.01, tokens=60):
+        self.first_token_latency = first_token_latency
+        self.token_latency = token_latency
+        self.tokens = tokens
+        self.calls = 0
+
+    def _words(self, prompt):
+        # Echo the question back so answers differ per prompt, padded to `tokens`
+        question = prompt.rsplit("QUESTION:", 1)[-1].split()
+        words = (["Based", "on", "the", "context,"] + question + WORDS * (self.tokens // len(WORDS) + 1))
+        return words[:self.tokens]
+
+    def _message(self, text):
+        return SimpleNamespace(content=text, usage_metadata={"input_tokens": 0, "output_tokens": self.tokens})
+
+    def invoke(self, prompt):
+        self.calls += 1
+        time.sleep(self.first_token_latency + self.token_latency * self.tokens)
+        return self._message(" ".join(self._words(prompt)))
+
+    async def ainvoke(self, prompt):
+        self.calls += 1
+        await asyncio.sleep(self.first_token_latency + self.token_latency * self.tokens)
+        return self._message(" ".join(self._words(prompt)))
+
+    async def astream(self, prompt):
+        self.calls += 1
+        await asyncio.sleep(self.first_token_latency)
+        for i, word in enumerate(self._words(prompt)):
+            if i and self.token_latency:
+                await asyncio.sleep(self.token_latency)
+            yield SimpleNamespace(content=word + " ")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the synthetic CCR site used by the pipeline benchmark.")
+    parser.add_argument("command", choices=["serve"])
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every response")
+    args = parser.parse_args()
+
+    site = SyntheticSite()
+    with FixtureServer(site, latency=args.latency, port=args.port) as server:
+        print(f"🧪 Synthetic CCR site ({site.folders} folders, {len(site.sections)} sections) at {server.start_url}")
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    sys.exit(main())
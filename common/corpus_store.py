@@ -0,0 +1,323 @@
+"""
+Random-access store for the extracted sections.
+
+data/extracted_data.jsonl stays the extractor's output, but anything that needs
+one section (the agent hydrating a passage, the extractor checking what is
+already done) reads this store instead of scanning and parsing the JSONL.
+
+Layout of data/corpus/:
+    blocks.bin     -> zlib-compressed blocks of up to BLOCK_RECORDS JSON lines
+    index.jsonl    -> {"guid", "url", "citation", "title_number", "section_number",
+                       "offset", "length", "slot"} per record; last line per guid wins
+    manifest.json  -> committed sizes of both files, record count, and how far
+                      into the source JSONL the store has ingested
+
+Appends are atomic: blocks and index lines are written past the committed
+sizes and fsync'd, and only count once manifest.json (write-then-rename) moves
+the committed sizes over them. Whatever a crash leaves beyond them is ignored
+on open and truncated by the next append. A lookup by GUID, URL or citation is
+a dict hit plus one pread and one block decompress.
+
+sync() keeps the store in step with the JSONL: lines appended since the last
+sync are ingested; if the file was replaced (--reparse, refresh.py) the store
+is rebuilt next to the old one and swapped in.
+
+Usage:
+    python common/corpus_store.py convert [data/extracted_data.jsonl]
+    python common/corpus_store.py stats
+    python common/corpus_store.py get <guid | url | citation>
+"""
+import hashlib
+import json
+import os
+import shutil
+import sys
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.jsonl_reader import JsonlReader
+from crawler.html_store import document_guid
+
+CORPUS_DIR = "data/corpus"
+SOURCE_FILE = "data/extracted_data.jsonl"
+BLOCKS_FILE = "blocks.bin"
+INDEX_FILE = "index.jsonl"
+MANIFEST_FILE = "manifest.json"
+
+BLOCK_RECORDS = 32      # Records per compressed block (one lookup decompresses one block)
+COMMIT_RECORDS = 2048   # Records per atomic commit during sync
+CACHED_BLOCKS = 64      # Decompressed blocks kept for repeat lookups
+COMPRESS_LEVEL = 6
+HEAD_BYTES = 4096       # Prefix hashed to tell an appended source file from a replaced one
+
+
+def _head_hash(path, length):
+    with open(path, "rb") as f:
+        return hashlib.sha1(f.read(length)).hexdigest()
+
+
+class CorpusStore:
+    def __init__(self, path=CORPUS_DIR):
+        self.path = path
+        self.lock = threading.RLock()
+        self._fd = None
+        self._load()
+
+    @staticmethod
+    def exists(path=CORPUS_DIR):
+        return os.path.exists(os.path.join(path, MANIFEST_FILE))
+
+    def _load(self):
+        manifest_path = os.path.join(self.path, MANIFEST_FILE)
+        if os.path.exists(manifest_path):
+            with open(manifest_path, "r", encoding="utf-8") as f:
+                self.manifest = json.load(f)
+        else:
+            self.manifest = {"blocks_size": 0, "index_size": 0, "records": 0, "source": None}
+
+        self.entries = {}       # guid -> latest index entry
+        self.by_url = {}
+        self.by_citation = {}
+        self._blocks = OrderedDict()
+        index_path = os.path.join(self.path, INDEX_FILE)
+        if os.path.exists(index_path):
+            with open(index_path, "rb") as f:
+                committed = f.read(self.manifest["index_size"])
+            for line in committed.splitlines():
+                if line.strip():
+                    self._add_entry(json.loads(line))
+
+    def _add_entry(self, entry):
+        self.entries[entry["guid"]] = entry
+        self.by_url[entry["url"]] = entry["guid"]
+        if entry["citation"]:
+            self.by_citation[entry["citation"]] = entry["guid"]
+
+    def _write_manifest(self):
+        tmp_path = os.path.join(self.path, MANIFEST_FILE + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.manifest, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, os.path.join(self.path, MANIFEST_FILE))
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return self._guid(key) is not None
+
+    # --- WRITES ---
+    def append(self, records, source=None):
+        """
+        Adds records (new sections, or newer versions of stored ones) in one
+        atomic commit. `source` records how much of the source JSONL this covers.
+        """
+        records = [r for r in records if r.get("source_url")]
+        if not records and source is None:
+            return 0
+        os.makedirs(self.path, exist_ok=True)
+        blocks_path = os.path.join(self.path, BLOCKS_FILE)
+        index_path = os.path.join(self.path, INDEX_FILE)
+
+        with self.lock:
+            for path in (blocks_path, index_path):
+                if not os.path.exists(path):
+                    open(path, "wb").close()
+            new_entries = []
+            with open(blocks_path, "r+b") as bf, open(index_path, "r+b") as xf:
+                # Drop anything an interrupted append left past the committed sizes
+                offset = self.manifest["blocks_size"]
+                bf.truncate(offset)
+                bf.seek(offset)
+                xf.truncate(self.manifest["index_size"])
+                xf.seek(self.manifest["index_size"])
+
+                for start in range(0, len(records), BLOCK_RECORDS):
+                    group = records[start:start + BLOCK_RECORDS]
+                    block = zlib.compress(b"\n".join(json.dumps(r).encode("utf-8") for r in group), COMPRESS_LEVEL)
+                    bf.write(block)
+                    for slot, record in enumerate(group):
+                        new_entries.append({
+                            "guid": document_guid(record["source_url"]),
+                            "url": record["source_url"],
+                            "citation": str(record.get("citation") or ""),
+                            "title_number": str(record.get("title_number") or ""),
+                            "section_number": str(record.get("section_number") or ""),
+                            "offset": offset,
+                            "length": len(block),
+                            "slot": slot
+                        })
+                    offset += len(block)
+                index_bytes = b"".join(json.dumps(e).encode("utf-8") + b"\n" for e in new_entries)
+                xf.write(index_bytes)
+                bf.flush()
+                os.fsync(bf.fileno())
+                xf.flush()
+                os.fsync(xf.fileno())
+
+            for entry in new_entries:
+                self._add_entry(entry)
+            self.manifest["blocks_size"] = offset
+            self.manifest["index_size"] += len(index_bytes)
+            self.manifest["records"] = len(self.entries)
+            if source is not None:
+                self.manifest["source"] = source
+            self._write_manifest()
+        return len(new_entries)
+
+    def sync(self, source=SOURCE_FILE):
+        """
+        Brings the store up to date with the source JSONL and returns how many
+        records were ingested. Appended lines are read from where the last sync
+        stopped; a replaced file triggers a rebuild.
+        """
+        if not os.path.exists(source):
+            return 0
+        known = self.manifest.get("source")
+        stat = os.stat(source)
+        if known is None and not self.entries:
+            start = 0
+        elif (known and known["path"] == source and known["inode"] == stat.st_ino
+              and stat.st_size >= known["offset"]
+              and _head_hash(source, known["head_length"]) == known["head"]):
+            start = known["offset"]
+        else:
+            return self.rebuild(source)
+        if known and start == stat.st_size:
+            return 0
+
+        reader = JsonlReader(source, start_offset=start, required_keys=("source_url",))
+        head_length = min(HEAD_BYTES, stat.st_size)
+
+        def checkpoint():
+            return {"path": source, "inode": stat.st_ino, "offset": reader.offset,
+                    "head": _head_hash(source, head_length), "head_length": head_length}
+
+        added = 0
+        batch = []
+        for record in reader:
+            batch.append(record)
+            if len(batch) >= COMMIT_RECORDS:
+                added += self.append(batch, source=checkpoint())
+                batch = []
+        added += self.append(batch, source=checkpoint())
+        if reader.errors:
+            print(f"   ⚠️ {source}: {reader.summary()}")
+        return added
+
+    def rebuild(self, source=SOURCE_FILE):
+        """Re-ingests the whole source into a fresh store, then swaps it in."""
+        tmp_path = self.path.rstrip("/") + ".tmp"
+        old_path = self.path.rstrip("/") + ".old"
+        for path in (tmp_path, old_path):
+            if os.path.exists(path):
+                shutil.rmtree(path)
+
+        fresh = CorpusStore(tmp_path)
+        added = fresh.sync(source)
+        fresh.close()
+
+        with self.lock:
+            self.close()
+            if os.path.exists(self.path):
+                os.rename(self.path, old_path)
+            os.rename(tmp_path, self.path)
+            shutil.rmtree(old_path, ignore_errors=True)
+            self._load()
+        return added
+
+    # --- READS ---
+    def _guid(self, key):
+        if key in self.entries:
+            return key
+        guid = self.by_url.get(key) or self.by_citation.get(key)
+        if guid is None and "/" in key:
+            guid = document_guid(key)  # Same document under another URL form
+        return guid if guid in self.entries else None
+
+    def _read_block(self, offset, length):
+        if self._fd is None:
+            self._fd = os.open(os.path.join(self.path, BLOCKS_FILE), os.O_RDONLY)
+        # pread: no shared file position, so server threads can read concurrently
+        return zlib.decompress(os.pread(self._fd, length, offset)).split(b"\n")
+
+    def _block(self, offset, length):
+        with self.lock:
+            lines = self._blocks.get(offset)
+            if lines is not None:
+                self._blocks.move_to_end(offset)
+                return lines
+        lines = self._read_block(offset, length)
+        with self.lock:
+            self._blocks[offset] = lines
+            if len(self._blocks) > CACHED_BLOCKS:
+                self._blocks.popitem(last=False)
+        return lines
+
+    def get(self, key):
+        """The latest record for a GUID, source URL or citation (None if unknown)."""
+        guid = self._guid(key)
+        if guid is None:
+            return None
+        entry = self.entries[guid]
+        return json.loads(self._block(entry["offset"], entry["length"])[entry["slot"]])
+
+    def urls(self):
+        return {entry["url"] for entry in self.entries.values()}
+
+    def __iter__(self):
+        """Every live record in storage order; each block is decompressed once."""
+        live = sorted(self.entries.values(), key=lambda e: (e["offset"], e["slot"]))
+        current, lines = None, None
+        for entry in live:
+            if entry["offset"] != current:
+                current = entry["offset"]
+                lines = self._read_block(entry["offset"], entry["length"])
+            yield json.loads(lines[entry["slot"]])
+
+
+def main():
+    if len(sys.argv) < 2 or sys.argv[1] not in ("convert", "stats", "get"):
+        print(__doc__)
+        return
+
+    store = CorpusStore()
+    if sys.argv[1] == "convert":
+        source = sys.argv[2] if len(sys.argv) > 2 else SOURCE_FILE
+        if not os.path.exists(source):
+            print(f"❌ Error: {source} not found.")
+            return
+        print(f"📦 Converting {source} into {CORPUS_DIR}...")
+        started = time.perf_counter()
+        added = store.rebuild(source)
+        print(f"✅ {added} records stored in {time.perf_counter() - started:.1f}s "
+              f"({len(store)} sections after de-duplication).")
+        sys.argv[1] = "stats"
+
+    if sys.argv[1] == "stats":
+        source = (store.manifest.get("source") or {}).get("path") or SOURCE_FILE
+        size = store.manifest["blocks_size"]
+        print(f"📦 {len(store)} sections, {size / 1e6:.1f} MB compressed", end="")
+        if os.path.exists(source):
+            print(f" ({os.path.getsize(source) / 1e6:.1f} MB as JSONL)", end="")
+        print()
+        return
+
+    record = store.get(sys.argv[2])
+    if record is None:
+        print(f"❌ No record for {sys.argv[2]}")
+        return
+    print(json.dumps(record, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
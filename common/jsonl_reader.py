@@ -0,0 +1,74 @@
+"""
+Streaming JSONL reader shared by the pipeline stages.
+
+Yields one record at a time instead of readlines()/list comprehensions, so
+memory stays flat no matter how large data/extracted_data.jsonl grows.
+Malformed lines are counted (with a few samples for the log) instead of being
+swallowed by a bare except, and reading can resume from a byte offset.
+
+    reader = JsonlReader("data/extracted_data.jsonl", start_offset=0)
+    for record in reader:
+        ...
+    print(reader.summary())       # "5300 records, 2 malformed lines"
+    resume_at = reader.offset     # byte offset just past the last record yielded
+"""
+import json
+
+MAX_ERROR_SAMPLES = 5
+
+
+class JsonlReader:
+    def __init__(self, path, start_offset=0, required_keys=()):
+        self.path = path
+        self.start_offset = start_offset
+        self.required_keys = tuple(required_keys)
+        self.offset = start_offset
+        self.records = 0
+        self.errors = 0
+        self.error_samples = []  # (byte offset, reason)
+
+    def _error(self, offset, reason):
+        self.errors += 1
+        if len(self.error_samples) < MAX_ERROR_SAMPLES:
+            self.error_samples.append((offset, reason))
+
+    def __iter__(self):
+        # Binary mode so offsets are real byte positions that seek() accepts
+        with open(self.path, "rb") as f:
+            f.seek(self.start_offset)
+            offset = self.start_offset
+            for raw in f:
+                line_offset = offset
+                offset += len(raw)
+                if not raw.strip():
+                    self.offset = offset
+                    continue
+                try:
+                    record = json.loads(raw)
+                except ValueError as e:
+                    if not raw.endswith(b"\n"):
+                        # Half-written last line from a writer that is still running;
+                        # leave the offset before it so a resume picks it up complete
+                        self._error(line_offset, "truncated last line")
+                        break
+                    self.offset = offset
+                    self._error(line_offset, f"invalid JSON: {e}")
+                    continue
+                if not isinstance(record, dict) or any(k not in record for k in self.required_keys):
+                    self.offset = offset
+                    self._error(line_offset, f"missing one of {self.required_keys}")
+                    continue
+
+                self.offset = offset
+                self.records += 1
+                yield record
+
+    def summary(self):
+        text = f"{self.records} records, {self.errors} malformed lines"
+        if self.error_samples:
+            text += " (first at byte " + ", ".join(str(o) for o, _ in self.error_samples) + ")"
+        return text
+
+
+def iter_jsonl(path, start_offset=0, required_keys=()):
+    return iter(JsonlReader(path, start_offset=start_offset, required_keys=required_keys))
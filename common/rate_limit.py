@@ -0,0 +1,305 @@
+"""
+Client-side quota limiter and retry layer shared by every Google API call
+(Gemini generation and text-embedding-004).
+
+Each quota gets one process-wide QuotaLimiter holding two token buckets:
+requests per minute and tokens per minute. Callers reserve before sending, so
+any number of threads or asyncio tasks together stay at the quota ceiling
+instead of bursting into 429s. A reservation may push a bucket into debt; the
+caller then sleeps exactly until its share has refilled, which keeps callers
+in FIFO order and works the same from threads (acquire) and asyncio
+(acquire_async).
+
+If a 429 still gets through, call() / acall() back off exponentially with full
+jitter, honour a retry-after hint in the error ("Please retry in 19s",
+retryDelay, Retry-After header), pause every other caller of the same quota for
+that long and scale the quota down, recovering a little on each success.
+
+Quotas (per minute, from the environment):
+    GEMINI_RPM / GEMINI_TPM         default 15 / 1,000,000
+    EMBEDDING_RPM / EMBEDDING_TPM   default 1500 / 1,000,000
+"""
+import asyncio
+import os
+import random
+import re
+import threading
+import time
+
+from common.tracing import count, current_span, record_usage, span, start_span
+
+QUOTAS = {
+    "gemini": (float(os.getenv("GEMINI_RPM", "15")), float(os.getenv("GEMINI_TPM", "1000000"))),
+    "embedding": (float(os.getenv("EMBEDDING_RPM", "1500")), float(os.getenv("EMBEDDING_TPM", "1000000"))),
+}
+BURST_SECONDS = 2.0         # Bucket capacity, in seconds of quota
+MAX_RETRIES = 6
+BASE_DELAY = 1.0            # Seconds; doubles per attempt (full jitter)
+MAX_DELAY = 60.0
+MIN_SCALE = 0.1             # Never slow below 10% of the configured quota
+RECOVERY_FACTOR = 1.05
+CHARS_PER_TOKEN = 4
+OUTPUT_TOKEN_ESTIMATE = 512  # Reserved per generation, settled against usage_metadata afterwards
+
+RATE_LIMIT_MARKERS = ("429", "RESOURCE_EXHAUSTED", "Too Many Requests")
+TRANSIENT_MARKERS = ("500", "502", "503", "504", "UNAVAILABLE", "INTERNAL", "DEADLINE_EXCEEDED", "timed out",
+                     "Connection reset", "Connection aborted")
+RETRY_AFTER_RE = re.compile(r"(?:retry[-_ ]?(?:after|delay)|retry in)\D{0,20}?(\d+(?:\.\d+)?)", re.IGNORECASE)
+
+
+def estimate_tokens(text):
+    return max(1, len(text) // CHARS_PER_TOKEN)
+
+
+def is_rate_limit(error):
+    message = str(error)
+    return any(marker in message for marker in RATE_LIMIT_MARKERS)
+
+
+def is_retryable(error):
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    message = str(error)
+    return is_rate_limit(error) or any(marker in message for marker in TRANSIENT_MARKERS)
+
+
+def retry_after(error):
+    """Seconds the server asked us to wait, if it said."""
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    if headers is not None and hasattr(headers, "get") and headers.get("Retry-After"):
+        try:
+            return float(headers.get("Retry-After"))
+        except ValueError:
+            pass
+    m = RETRY_AFTER_RE.search(str(error))
+    return float(m.group(1)) if m else None
+
+
+class QuotaLimiter:
+    def __init__(self, name, rpm, tpm=None):
+        self.name = name
+        self.rpm = rpm
+        self.tpm = tpm
+        self.scale = 1.0
+        self.lock = threading.Lock()
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.request_tokens = self._capacity(rpm)
+        self.token_tokens = self._capacity(tpm) if tpm else 0.0
+        self.rate_limited = 0
+        self.retries = 0
+
+    @staticmethod
+    def _capacity(per_minute):
+        return max(1.0, per_minute / 60.0 * BURST_SECONDS)
+
+    def _refill(self, now):
+        elapsed = now - self.updated
+        self.updated = now
+        self.request_tokens = min(self._capacity(self.rpm),
+                                  self.request_tokens + elapsed * self.rpm * self.scale / 60.0)
+        if self.tpm:
+            self.token_tokens = min(self._capacity(self.tpm),
+                                    self.token_tokens + elapsed * self.tpm * self.scale / 60.0)
+
+    def _reserve(self, requests, tokens):
+        # Take the tokens now (possibly into debt) and return how long to sleep
+        with self.lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.request_tokens -= requests
+            wait = -self.request_tokens / (self.rpm * self.scale / 60.0)
+            if self.tpm and tokens:
+                self.token_tokens -= tokens
+                wait = max(wait, -self.token_tokens / (self.tpm * self.scale / 60.0))
+            return max(0.0, wait, self.paused_until - now)
+
+    def acquire(self, requests=1, tokens=0):
+        """Waits for quota; returns the seconds spent waiting."""
+        wait = self._reserve(requests, tokens)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    async def acquire_async(self, requests=1, tokens=0):
+        wait = self._reserve(requests, tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+    def settle(self, reserved_tokens, actual_tokens):
+        """Correct a token reservation once the response reports real usage."""
+        if self.tpm and actual_tokens:
+            with self.lock:
+                self.token_tokens -= actual_tokens - reserved_tokens
+
+    def record_success(self):
+        if self.scale < 1.0:
+            with self.lock:
+                self.scale = min(1.0, self.scale * RECOVERY_FACTOR)
+
+    def backoff(self, error, attempt):
+        """
+        Delay before retrying `error` on attempt number `attempt` (0-based).
+        Re-raises if the error isn't transient or we're out of attempts.
+        """
+        if not is_retryable(error) or attempt >= MAX_RETRIES:
+            raise error
+        hint = retry_after(error)
+        delay = random.uniform(0, min(MAX_DELAY, BASE_DELAY * 2 ** attempt))  # Full jitter
+        if hint is not None:
+            delay = hint + random.uniform(0, BASE_DELAY)
+
+        count("quota_retries_total", quota=self.name, reason="rate_limit" if is_rate_limit(error) else "transient")
+        current_span().set(retries=attempt + 1)
+        with self.lock:
+            self.retries += 1
+            if is_rate_limit(error):
+                # Everyone sharing this quota waits, and the quota itself shrinks until successes restore it
+                self.rate_limited += 1
+                self.scale = max(MIN_SCALE, self.scale / 2)
+                self.paused_until = max(self.paused_until, time.monotonic() + delay)
+                self.request_tokens = min(self.request_tokens, 0.0)
+        print(f"   ⏳ {self.name}: {'rate limited' if is_rate_limit(error) else 'transient error'}, "
+              f"retrying in {delay:.1f}s (attempt {attempt + 1}/{MAX_RETRIES})...")
+        return delay
+
+    def call(self, fn, *args, requests=1, tokens=0, **kwargs):
+        attempt = 0
+        waited = 0.0
+        with span(f"{self.name}.call", tokens=tokens) as s:
+            while True:
+                waited += self.acquire(requests, tokens)
+                try:
+                    result = fn(*args, **kwargs)
+                except Exception as e:
+                    delay = self.backoff(e, attempt)
+                    waited += delay
+                    time.sleep(delay)
+                    attempt += 1
+                    continue
+                self.record_success()
+                s.set(quota_wait_ms=round(waited * 1000, 1))
+                return result
+
+    async def acall(self, fn, *args, requests=1, tokens=0, **kwargs):
+        attempt = 0
+        waited = 0.0
+        with span(f"{self.name}.call", tokens=tokens) as s:
+            while True:
+                waited += await self.acquire_async(requests, tokens)
+                try:
+                    result = await fn(*args, **kwargs)
+                except Exception as e:
+                    delay = self.backoff(e, attempt)
+                    waited += delay
+                    await asyncio.sleep(delay)
+                    attempt += 1
+                    continue
+                self.record_success()
+                s.set(quota_wait_ms=round(waited * 1000, 1))
+                return result
+
+    def summary(self):
+        return (f"{self.name}: {self.rpm * self.scale:.0f}/{self.rpm:.0f} RPM effective, "
+                f"{self.rate_limited} rate limited, {self.retries} retries")
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(name):
+    """The process-wide limiter for a quota in QUOTAS ("gemini" or "embedding")."""
+    with _limiters_lock:
+        if name not in _limiters:
+            rpm, tpm = QUOTAS[name]
+            _limiters[name] = QuotaLimiter(name, rpm, tpm)
+        return _limiters[name]
+
+
+def configure_quota(name, rpm=None, tpm=None):
+    """Override a quota (e.g. from a --rpm flag) before or after its limiter exists."""
+    limiter = get_limiter(name)
+    with limiter.lock:
+        if rpm:
+            limiter.rpm = rpm
+        if tpm:
+            limiter.tpm = tpm
+    return limiter
+
+
+def _usage_tokens(message):
+    usage = getattr(message, "usage_metadata", None) or {}
+    return usage.get("total_tokens") if hasattr(usage, "get") else None
+
+
+class RateLimitedChat:
+    """
+    LangChain chat model wrapper: invoke / ainvoke / astream go through the
+    shared limiter. Each call reserves prompt + OUTPUT_TOKEN_ESTIMATE tokens
+    and settles against usage_metadata when the response reports it. A stream
+    is only retried before its first chunk; sent text can't be taken back.
+    """
+
+    def __init__(self, llm, limiter=None, output_tokens=OUTPUT_TOKEN_ESTIMATE):
+        self.llm = llm
+        self.limiter = limiter or get_limiter("gemini")
+        self.output_tokens = output_tokens
+
+    def _reserve_for(self, prompt):
+        return estimate_tokens(str(prompt)) + self.output_tokens
+
+    @property
+    def model(self):
+        return str(getattr(self.llm, "model", "") or getattr(self.llm, "model_name", ""))
+
+    def invoke(self, prompt, **kwargs):
+        reserved = self._reserve_for(prompt)
+        response = self.limiter.call(self.llm.invoke, prompt, tokens=reserved, **kwargs)
+        self.limiter.settle(reserved, _usage_tokens(response))
+        record_usage(response, self.model)
+        return response
+
+    async def ainvoke(self, prompt, **kwargs):
+        reserved = self._reserve_for(prompt)
+        response = await self.limiter.acall(self.llm.ainvoke, prompt, tokens=reserved, **kwargs)
+        self.limiter.settle(reserved, _usage_tokens(response))
+        record_usage(response, self.model)
+        return response
+
+    async def astream(self, prompt, **kwargs):
+        reserved = self._reserve_for(prompt)
+        attempt = 0
+        # Not made current: the caller's own spans run between our yields
+        s = start_span(f"{self.limiter.name}.stream", tokens=reserved)
+        try:
+            while True:
+                s.set(quota_wait_ms=round(await self.limiter.acquire_async(1, reserved) * 1000, 1))
+                sent = False
+                usage = None
+                last = None
+                try:
+                    async for chunk in self.llm.astream(prompt, **kwargs):
+                        if not sent:
+                            s.set(first_chunk_ms=s.elapsed_ms())
+                        sent = True
+                        usage = _usage_tokens(chunk) or usage
+                        last = chunk if getattr(chunk, "usage_metadata", None) else last
+                        yield chunk
+                except Exception as e:
+                    if sent:
+                        raise
+                    await asyncio.sleep(self.limiter.backoff(e, attempt))
+                    attempt += 1
+                    s.set(retries=attempt)
+                    continue
+                self.limiter.record_success()
+                self.limiter.settle(reserved, usage)
+                record_usage(last, self.model)
+                return
+        except Exception as e:
+            s.end(e)
+            raise
+        finally:
+            s.end()
@@ -0,0 +1,377 @@
+"""
+Pipeline state in one SQLite database (WAL mode): the status of every URL in
+every stage, replacing data/visited_urls.txt, data/indexed_ids.txt and the
+scans of discovered_section_urls.jsonl / extracted_data.jsonl at startup.
+
+One row per (stage, key):
+    discover                folder pages of the browse tree   (key: folder URL)
+    extract                 section pages                     (key: section URL)
+    index:<backend>:<chunking>  sections uploaded to an index (key: source URL)
+status is pending -> (claimed ->) done | failed. Writes are buffered and
+committed in batches (COMMIT_EVERY rows or COMMIT_INTERVAL seconds, and on
+flush/close), so a crash loses at most a few seconds of bookkeeping and that
+work is simply redone. Resuming is a single indexed query instead of loading
+text files into sets.
+
+Several workers (threads or processes) can share a stage: claim() hands each
+one a disjoint batch of pending keys under a lease, and keys whose lease ran
+out (a crashed worker) become claimable again, or at once through release()
+when the worker is known to be dead. retry_failed() puts failed keys
+back in the pool until they have used MAX_ATTEMPTS claims.
+
+The first open imports the legacy files (see migrate()).
+
+Usage:
+    python common/state_store.py stats
+    python common/state_store.py show <url>
+    python common/state_store.py retry <stage>    # failed -> pending
+    python common/state_store.py reset <stage>    # forget a stage (e.g. after dropping an index)
+"""
+import json
+import os
+import socket
+import sqlite3
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.jsonl_reader import JsonlReader
+
+STATE_DB = "data/pipeline_state.sqlite"
+DISCOVER = "discover"
+EXTRACT = "extract"
+
+COMMIT_EVERY = 500      # Buffered writes per commit
+COMMIT_INTERVAL = 2.0   # ...or seconds since the last commit
+LEASE_SECONDS = 600     # A claim not finished (or renewed) by then is handed out again
+MAX_ATTEMPTS = 3
+
+# Legacy files imported by migrate()
+LEGACY_VISITED_FILE = "data/visited_urls.txt"
+LEGACY_DISCOVERED_FILE = "data/discovered_section_urls.jsonl"
+LEGACY_EXTRACTED_FILE = "data/extracted_data.jsonl"
+LEGACY_INDEX_CHECKPOINTS = {
+    "index:pinecone:section": "data/indexed_ids.txt",
+    "index:pinecone:structure": "data/indexed_ids_structure.txt",
+    "index:local:section": "data/local_index/indexed_ids.txt",
+    "index:local:structure": "data/local_index/indexed_ids_structure.txt",
+}
+
+
+def index_stage(backend, chunking):
+    return f"index:{backend}:{chunking}"
+
+
+def worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+
+
+class StateStore:
+    def __init__(self, path=STATE_DB, migrate=True):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # Autocommit mode: transactions are explicit (BEGIN IMMEDIATE), so one
+        # batch is one commit and claims are atomic across processes
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS tasks (
+                stage TEXT NOT NULL,
+                key TEXT NOT NULL,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                owner TEXT,
+                lease_until REAL,
+                info TEXT,
+                error TEXT,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (stage, key)
+            ) WITHOUT ROWID
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS tasks_by_status ON tasks (stage, status)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self.lock = threading.RLock()
+        self._adds = []
+        self._marks = []
+        self._last_commit = time.monotonic()
+        if migrate and self._meta("migrated") is None:
+            self.migrate()
+
+    @contextmanager
+    def _transaction(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        self.conn.execute("COMMIT")
+
+    def _meta(self, key):
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    # --- BUFFERED WRITES ---
+    def add(self, stage, keys, info=None):
+        """Registers keys as pending; keys the stage already knows are left as they are."""
+        info_json = json.dumps(info) if info is not None else None
+        with self.lock:
+            self._adds.extend((stage, key, info_json) for key in keys)
+            self._maybe_flush()
+
+    def mark(self, stage, keys, status="done", error=None):
+        """Sets the status of keys (adding them if needed) and drops any claim on them."""
+        with self.lock:
+            self._marks.extend((stage, key, status, error) for key in keys)
+            self._maybe_flush()
+
+    def _maybe_flush(self):
+        if (len(self._adds) + len(self._marks) >= COMMIT_EVERY
+                or time.monotonic() - self._last_commit >= COMMIT_INTERVAL):
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            if not self._adds and not self._marks:
+                return
+            now = time.time()
+            with self._transaction():
+                self.conn.executemany(
+                    "INSERT OR IGNORE INTO tasks (stage, key, status, info, updated_at) VALUES (?, ?, 'pending', ?, ?)",
+                    [(stage, key, info, now) for stage, key, info in self._adds]
+                )
+                self.conn.executemany(
+                    """
+                    INSERT INTO tasks (stage, key, status, error, updated_at)
+                    VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT (stage, key) DO UPDATE SET
+                        status = excluded.status,
+                        error = excluded.error,
+                        owner = NULL,
+                        lease_until = NULL,
+                        updated_at = excluded.updated_at
+                    """,
+                    [(stage, key, status, error, now)
+                     for stage, key, status, error in self._marks]
+                )
+            self._adds, self._marks = [], []
+            self._last_commit = time.monotonic()
+
+    def close(self):
+        self.flush()
+        self.conn.close()
+
+    # --- CLAIMS ---
+    def claim(self, stage, worker=None, limit=1, lease=LEASE_SECONDS, max_attempts=MAX_ATTEMPTS):
+        """
+        Atomically takes up to `limit` pending keys of a stage for `worker`,
+        counting an attempt on each. Keys whose lease ran out are handed out
+        again until they reach max_attempts.
+        """
+        worker = worker or worker_id()
+        now = time.time()
+        with self.lock:
+            self.flush()
+            with self._transaction():
+                keys = [row[0] for row in self.conn.execute(
+                    """
+                    SELECT key FROM tasks
+                    WHERE stage = ? AND attempts < ?
+                      AND (status = 'pending' OR (status = 'claimed' AND lease_until < ?))
+                    ORDER BY updated_at
+                    LIMIT ?
+                    """, (stage, max_attempts, now, limit)
+                )]
+                self.conn.executemany(
+                    "UPDATE tasks SET status = 'claimed', owner = ?, lease_until = ?, attempts = attempts + 1, updated_at = ? "
+                    "WHERE stage = ? AND key = ?",
+                    [(worker, now + lease, now, stage, key) for key in keys]
+                )
+        return keys
+
+    def renew(self, stage, keys, worker=None, lease=LEASE_SECONDS):
+        """Extends this worker's leases; returns the keys it still holds."""
+        worker = worker or worker_id()
+        now = time.time()
+        held = []
+        with self.lock:
+            self.flush()  # Keys marked since the last commit are no longer held
+            with self._transaction():
+                for key in keys:
+                    cursor = self.conn.execute(
+                        "UPDATE tasks SET lease_until = ? WHERE stage = ? AND key = ? AND status = 'claimed' AND owner = ?",
+                        (now + lease, stage, key, worker)
+                    )
+                    if cursor.rowcount:
+                        held.append(key)
+        return held
+
+    def release(self, stage, owner):
+        """
+        Puts the claims of a worker known to be dead back in the pool now
+        rather than when their leases run out; the attempt stays counted.
+        owner matches as a prefix, e.g. "host:pid:" for every thread of a process.
+        """
+        with self.lock:
+            self.flush()
+            with self._transaction():
+                cursor = self.conn.execute(
+                    "UPDATE tasks SET status = 'pending', owner = NULL, lease_until = NULL, updated_at = ? "
+                    "WHERE stage = ? AND status = 'claimed' AND owner LIKE ?",
+                    (time.time(), stage, owner.replace("%", "") + "%")
+                )
+        return cursor.rowcount
+
+    # --- READS ---
+    def keys(self, stage, status="done"):
+        """Keys of a stage with the given status (any status when None)."""
+        with self.lock:
+            self.flush()
+            if status is None:
+                rows = self.conn.execute("SELECT key FROM tasks WHERE stage = ?", (stage,))
+            else:
+                rows = self.conn.execute("SELECT key FROM tasks WHERE stage = ? AND status = ?", (stage, status))
+            return {row[0] for row in rows}
+
+    def status(self, stage, key):
+        with self.lock:
+            self.flush()
+            row = self.conn.execute("SELECT status FROM tasks WHERE stage = ? AND key = ?", (stage, key)).fetchone()
+        return row[0] if row else None
+
+    def counts(self, stage=None):
+        """{stage: {status: n}}"""
+        with self.lock:
+            self.flush()
+            query = "SELECT stage, status, COUNT(*) FROM tasks"
+            params = ()
+            if stage:
+                query += " WHERE stage = ?"
+                params = (stage,)
+            result = {}
+            for row_stage, status, n in self.conn.execute(query + " GROUP BY stage, status", params):
+                result.setdefault(row_stage, {})[status] = n
+        return result
+
+    def history(self, key):
+        with self.lock:
+            self.flush()
+            return self.conn.execute(
+                "SELECT stage, status, attempts, error, updated_at FROM tasks WHERE key = ? ORDER BY stage", (key,)
+            ).fetchall()
+
+    # --- MAINTENANCE ---
+    def reset(self, stage):
+        """Forgets a stage; "index:pinecone:*" style prefixes reset every matching stage."""
+        with self.lock:
+            self.flush()
+            with self._transaction():
+                if stage.endswith("*"):
+                    cursor = self.conn.execute("DELETE FROM tasks WHERE stage LIKE ?", (stage[:-1] + "%",))
+                else:
+                    cursor = self.conn.execute("DELETE FROM tasks WHERE stage = ?", (stage,))
+        return cursor.rowcount
+
+    def forget(self, stage, keys):
+        """Drops keys from a stage (e.g. repealed sections), so they count as never seen. Returns how many."""
+        keys = list(keys)
+        with self.lock:
+            self.flush()
+            with self._transaction():
+                before = self.conn.total_changes
+                self.conn.executemany("DELETE FROM tasks WHERE stage = ? AND key = ?", [(stage, k) for k in keys])
+                return self.conn.total_changes - before
+
+    def retry_failed(self, stage, max_attempts=None):
+        """
+        Failed keys back to pending: those with fewer than max_attempts
+        attempts, or all of them (attempts reset) when max_attempts is None.
+        """
+        with self.lock:
+            self.flush()
+            with self._transaction():
+                if max_attempts is None:
+                    cursor = self.conn.execute(
+                        "UPDATE tasks SET status = 'pending', attempts = 0, error = NULL "
+                        "WHERE stage = ? AND status = 'failed'", (stage,)
+                    )
+                else:
+                    cursor = self.conn.execute(
+                        "UPDATE tasks SET status = 'pending' WHERE stage = ? AND status = 'failed' AND attempts < ?",
+                        (stage, max_attempts)
+                    )
+        return cursor.rowcount
+
+    def migrate(self):
+        """
+        Imports the legacy resume files once: visited folders, discovered and
+        extracted section URLs, and the indexers' checkpoint lists. The files
+        are left in place (other tools still read the JSONL outputs).
+        """
+        imported = {}
+
+        def read_lines(path):
+            with open(path, "r", encoding="utf-8") as f:
+                return [line.strip() for line in f if line.strip()]
+
+        if os.path.exists(LEGACY_VISITED_FILE):
+            visited = read_lines(LEGACY_VISITED_FILE)
+            self.mark(DISCOVER, visited)
+            imported[DISCOVER] = len(visited)
+        if os.path.exists(LEGACY_DISCOVERED_FILE):
+            reader = JsonlReader(LEGACY_DISCOVERED_FILE, required_keys=("section_url",))
+            for record in reader:
+                self.add(EXTRACT, [record["section_url"]], info={"source_page": record.get("source_page")})
+            imported["extract (discovered)"] = reader.records
+        if os.path.exists(LEGACY_EXTRACTED_FILE):
+            reader = JsonlReader(LEGACY_EXTRACTED_FILE, required_keys=("source_url",))
+            done = [r["source_url"] for r in reader
+                    if r.get("content_markdown") and (r.get("title_number") or r.get("section_number"))]
+            self.mark(EXTRACT, done)
+            imported["extract (done)"] = len(done)
+        for stage, path in LEGACY_INDEX_CHECKPOINTS.items():
+            if os.path.exists(path):
+                ids = read_lines(path)
+                self.mark(stage, ids)
+                imported[stage] = len(ids)
+
+        self.flush()
+        self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('migrated', ?)", (json.dumps(imported),))
+        if imported:
+            print("🗃️  Imported legacy resume files into " + self.path + ": "
+                  + ", ".join(f"{stage} {n}" for stage, n in imported.items()))
+        return imported
+
+
+def main():
+    if len(sys.argv) < 2 or sys.argv[1] not in ("stats", "show", "retry", "reset"):
+        print(__doc__)
+        return
+
+    store = StateStore()
+    command = sys.argv[1]
+    if command == "stats":
+        counts = store.counts()
+        if not counts:
+            print("🗃️  No pipeline state yet.")
+        for stage, statuses in sorted(counts.items()):
+            print(f"🗃️  {stage}: " + ", ".join(f"{n} {status}" for status, n in sorted(statuses.items())))
+    elif command == "show":
+        rows = store.history(sys.argv[2])
+        if not rows:
+            print(f"❌ {sys.argv[2]} is not tracked.")
+        for stage, status, attempts, error, updated_at in rows:
+            when = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(updated_at))
+            print(f"   {stage}: {status} (attempts {attempts}, {when}){' - ' + error if error else ''}")
+    elif command == "retry":
+        print(f"🔁 {store.retry_failed(sys.argv[2])} failed keys in {sys.argv[2]} are pending again.")
+    else:
+        print(f"🗑️  Forgot {store.reset(sys.argv[2])} keys in {sys.argv[2]}.")
+    store.close()
+
+
+if __name__ == "__main__":
+    main()
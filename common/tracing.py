@@ -0,0 +1,386 @@
+"""
+Lightweight tracing and metrics for every pipeline stage.
+
+Code marks the work it does with spans:
+
+    with span("retrieve.vector", k=k) as s:
+        docs = vectorstore.similarity_search(query, k=k)
+        s.set(results=len(docs))
+
+A span records its name, duration, attributes and any exception type, and
+nests under whichever span is current in the same thread or asyncio task.
+contextvars carry the parent, so run_in_executor callers that wrap the call
+in contextvars.copy_context().run keep the tree. count() adds to a labelled
+counter (retries, rate limits, tokens, ...).
+
+Output:
+    TRACE_FILE (data/traces.jsonl)  one JSON line per finished span:
+        {"service", "trace", "span", "parent", "name", "start", "ms", "attrs"}
+        buffered and appended every FLUSH_SPANS spans / FLUSH_INTERVAL seconds
+    prometheus_text()               span duration histograms, error counts and
+                                    counters in the Prometheus text format;
+                                    agent/server.py serves it at GET /metrics,
+                                    other scripts write METRICS_DIR/<service>.prom
+                                    at exit (node_exporter textfile collector)
+
+TRACING=off turns spans and counters into no-ops. The service name defaults to
+the running script (extract_sections, server, ...).
+
+Usage:
+    python common/tracing.py summary [--service server] [--since 60]   # minutes
+    python common/tracing.py metrics                                    # Prometheus text from the trace file
+"""
+import argparse
+import atexit
+import contextvars
+import json
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+
+TRACING = os.getenv("TRACING", "on").lower() != "off"
+TRACE_FILE = os.getenv("TRACE_FILE", "data/traces.jsonl")
+METRICS_DIR = os.getenv("METRICS_DIR", "data/metrics")
+FLUSH_SPANS = 200
+FLUSH_INTERVAL = 5.0
+METRIC_PREFIX = "ccr"
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_current = contextvars.ContextVar("ccr_span", default=None)
+
+
+def _new_id():
+    return os.urandom(8).hex()
+
+
+def _service_name():
+    script = os.path.basename(sys.argv[0]) if sys.argv and sys.argv[0] else ""
+    name = os.path.splitext(script)[0]
+    return name if name and name not in ("-", "-c") else "python"
+
+
+class Span:
+    __slots__ = ("name", "attrs", "trace", "id", "parent", "start", "seconds", "_t0", "_token")
+
+    def __init__(self, name, attrs):
+        self.name = name
+        self.attrs = attrs
+        parent = _current.get()
+        self.trace = parent.trace if parent else _new_id()
+        self.parent = parent.id if parent else None
+        self.id = _new_id()
+        self.start = time.time()
+        self.seconds = None
+        self._t0 = time.perf_counter()
+        self._token = None
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+        return self
+
+    def elapsed_ms(self):
+        return round((time.perf_counter() - self._t0) * 1000, 1)
+
+    def end(self, error=None):
+        if self.seconds is None:
+            self.seconds = time.perf_counter() - self._t0
+            if error is not None:
+                self.attrs["error"] = type(error).__name__
+            _recorder.finish(self)
+
+    def __enter__(self):
+        self._token = _current.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            _current.reset(self._token)
+        except ValueError:
+            # Exited from another context (an async generator closed elsewhere)
+            pass
+        # GeneratorExit: a streaming generator was closed early, which is not a failure
+        self.end(None if isinstance(exc, GeneratorExit) else exc)
+        return False
+
+
+class _NoopSpan:
+    def set(self, **attrs):
+        return self
+
+    def elapsed_ms(self):
+        return 0.0
+
+    def end(self, error=None):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+def span(name, **attrs):
+    """Context manager: times the block as a child of the current span."""
+    return Span(name, attrs) if TRACING else NOOP_SPAN
+
+
+def start_span(name, **attrs):
+    """A span that is not made current (for work spread over yields); call .end() when done."""
+    return Span(name, attrs) if TRACING else NOOP_SPAN
+
+
+def current_span():
+    return _current.get() or NOOP_SPAN
+
+
+def count(name, value=1, **labels):
+    """Adds to counter `name` with the given labels."""
+    if TRACING:
+        _recorder.count(name, value, labels)
+
+
+def record_usage(message, model=""):
+    """Token counters from a LangChain message's usage_metadata (when the response carries it)."""
+    usage = getattr(message, "usage_metadata", None)
+    if not usage or not hasattr(usage, "get"):
+        return
+    for kind in ("input_tokens", "output_tokens"):
+        if usage.get(kind):
+            count("llm_tokens_total", usage[kind], model=model, kind=kind.split("_")[0])
+
+
+class Recorder:
+    def __init__(self, path=TRACE_FILE, metrics_dir=METRICS_DIR):
+        self.path = path
+        self.metrics_dir = metrics_dir
+        self.service = _service_name()
+        self.lock = threading.Lock()
+        self.buffer = []
+        self.last_flush = time.monotonic()
+        self.durations = defaultdict(lambda: [0] * (len(DURATION_BUCKETS) + 1))  # name -> bucket counts
+        self.sums = defaultdict(float)
+        self.errors = defaultdict(int)
+        self.counters = defaultdict(float)
+
+    def finish(self, s):
+        line = {"service": self.service, "trace": s.trace, "span": s.id, "parent": s.parent, "name": s.name,
+                "start": round(s.start, 6), "ms": round(s.seconds * 1000, 3), "attrs": s.attrs}
+        with self.lock:
+            self._observe(s.name, s.seconds, "error" in s.attrs)
+            self.buffer.append(line)
+            if len(self.buffer) >= FLUSH_SPANS or time.monotonic() - self.last_flush >= FLUSH_INTERVAL:
+                self._flush()
+
+    def _observe(self, name, seconds, error):
+        buckets = self.durations[name]
+        for i, bound in enumerate(DURATION_BUCKETS):
+            if seconds <= bound:
+                buckets[i] += 1
+                break
+        else:
+            buckets[-1] += 1
+        self.sums[name] += seconds
+        if error:
+            self.errors[name] += 1
+
+    def count(self, name, value, labels):
+        with self.lock:
+            self.counters[(name, tuple(sorted(labels.items())))] += value
+
+    def _flush(self):
+        self.last_flush = time.monotonic()
+        if not self.buffer:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write("".join(json.dumps(line, default=str) + "\n" for line in self.buffer))
+        except OSError as e:
+            print(f"⚠️ Trace export failed ({e}); dropping {len(self.buffer)} spans")
+        self.buffer = []
+
+    def flush(self):
+        with self.lock:
+            self._flush()
+
+    def prometheus_text(self):
+        with self.lock:
+            return _format_prometheus(self.durations, self.sums, self.errors, self.counters)
+
+    def write_metrics(self, directory=None):
+        """Atomically writes <directory>/<service>.prom."""
+        if not self.durations and not self.counters:
+            return None
+        directory = directory or self.metrics_dir
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{self.service}.prom")
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(self.prometheus_text())
+        os.replace(tmp_path, path)
+        return path
+
+
+def _label_text(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{str(v)}"'.replace("\n", " ") for k, v in labels) + "}"
+
+
+def _format_prometheus(durations, sums, errors, counters):
+    lines = [f"# TYPE {METRIC_PREFIX}_span_duration_seconds histogram"]
+    for name in sorted(durations):
+        cumulative = 0
+        for bound, n in zip(DURATION_BUCKETS + ("+Inf",), durations[name]):
+            cumulative += n
+            lines.append(f'{METRIC_PREFIX}_span_duration_seconds_bucket{{span="{name}",le="{bound}"}} {cumulative}')
+        lines.append(f'{METRIC_PREFIX}_span_duration_seconds_sum{{span="{name}"}} {sums[name]:.6f}')
+        lines.append(f'{METRIC_PREFIX}_span_duration_seconds_count{{span="{name}"}} {cumulative}')
+    lines.append(f"# TYPE {METRIC_PREFIX}_span_errors_total counter")
+    for name in sorted(errors):
+        lines.append(f'{METRIC_PREFIX}_span_errors_total{{span="{name}"}} {errors[name]}')
+    typed = set()
+    for (name, labels), value in sorted(counters.items()):
+        if name not in typed:
+            lines.append(f"# TYPE {METRIC_PREFIX}_{name} counter")
+            typed.add(name)
+        lines.append(f"{METRIC_PREFIX}_{name}{_label_text(labels)} {value:g}")
+    return "\n".join(lines) + "\n"
+
+
+_recorder = Recorder()
+
+
+def configure(trace_file=None, metrics_dir=None, enabled=None):
+    """Redirects output (e.g. to absolute paths before a chdir) or switches tracing on/off."""
+    global TRACING
+    _recorder.flush()
+    if trace_file:
+        _recorder.path = trace_file
+    if metrics_dir:
+        _recorder.metrics_dir = metrics_dir
+    if enabled is not None:
+        TRACING = enabled
+
+
+def prometheus_text():
+    return _recorder.prometheus_text()
+
+
+def flush():
+    _recorder.flush()
+
+
+def export():
+    """Flushes buffered spans and writes METRICS_DIR/<service>.prom (also runs at exit)."""
+    if TRACING:
+        _recorder.flush()
+        try:
+            return _recorder.write_metrics()
+        except OSError:
+            return None
+
+
+atexit.register(export)
+
+
+# --- REPORTS ---
+def load_spans(path=TRACE_FILE, service=None, since_minutes=None):
+    from common.jsonl_reader import JsonlReader
+    cutoff = time.time() - since_minutes * 60 if since_minutes else None
+    for line in JsonlReader(path, required_keys=("name", "ms")):
+        if service and line.get("service") != service:
+            continue
+        if cutoff and line.get("start", 0) < cutoff:
+            continue
+        yield line
+
+
+def _percentile(ordered, q):
+    return ordered[min(len(ordered) - 1, round(q / 100 * (len(ordered) - 1)))]
+
+
+def summarize(spans):
+    """
+    Per span name: count, total, mean and percentiles (ms), errors, and the
+    share of its parents' time, averaged over the root spans it ran under.
+    """
+    by_name = defaultdict(list)
+    errors = defaultdict(int)
+    children = defaultdict(lambda: defaultdict(float))  # parent name -> child name -> total ms
+    names_by_id = {}
+    roots = defaultdict(float)
+    spans = list(spans)
+    for s in spans:
+        names_by_id[s["span"]] = (s["name"], s["ms"])
+    for s in spans:
+        by_name[s["name"]].append(s["ms"])
+        if "error" in (s.get("attrs") or {}):
+            errors[s["name"]] += 1
+        parent = names_by_id.get(s.get("parent"))
+        if parent:
+            children[parent[0]][s["name"]] += s["ms"]
+        elif not s.get("parent"):
+            roots[s["name"]] += s["ms"]
+    rows = []
+    for name, values in by_name.items():
+        values.sort()
+        rows.append({"name": name, "count": len(values), "total_ms": sum(values),
+                     "mean_ms": sum(values) / len(values), "p50_ms": _percentile(values, 50),
+                     "p95_ms": _percentile(values, 95), "p99_ms": _percentile(values, 99),
+                     "errors": errors[name]})
+    rows.sort(key=lambda r: -r["total_ms"])
+    totals = {r["name"]: r["total_ms"] for r in rows}
+    breakdown = {
+        root: sorted(((child, ms, ms / totals[root] if totals[root] else 0.0)
+                      for child, ms in children[root].items()), key=lambda c: -c[1])
+        for root in roots
+    }
+    return rows, breakdown
+
+
+def print_summary(rows, breakdown):
+    if not rows:
+        print("📭 No spans recorded yet.")
+        return
+    print(f"{'span':<32} {'count':>7} {'total s':>9} {'mean ms':>9} {'p50':>8} {'p95':>8} {'p99':>8} {'errors':>6}")
+    for r in rows:
+        print(f"{r['name']:<32} {r['count']:>7} {r['total_ms'] / 1000:>9.1f} {r['mean_ms']:>9.1f} "
+              f"{r['p50_ms']:>8.1f} {r['p95_ms']:>8.1f} {r['p99_ms']:>8.1f} {r['errors']:>6}")
+    print("\n🔥 Hot path (share of each root span's time, direct children):")
+    for root, parts in sorted(breakdown.items()):
+        if parts:
+            print(f"   {root}: " + ", ".join(f"{child} {share:.0%}" for child, _, share in parts[:5]))
+
+
+def main():
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    parser = argparse.ArgumentParser(description="Summarize the pipeline trace file.")
+    parser.add_argument("command", choices=["summary", "metrics"])
+    parser.add_argument("--file", default=TRACE_FILE)
+    parser.add_argument("--service", default=None, help="Only spans from this script (server, extract_sections, ...)")
+    parser.add_argument("--since", type=float, default=None, help="Only the last N minutes")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.file):
+        print(f"❌ No trace file at {args.file}. Run a pipeline stage first (TRACING is on by default).")
+        return
+    spans = load_spans(args.file, args.service, args.since)
+    if args.command == "summary":
+        print_summary(*summarize(spans))
+        return
+
+    recorder = Recorder(args.file)
+    for s in spans:
+        recorder._observe(s["name"], s["ms"] / 1000, "error" in (s.get("attrs") or {}))
+    print(recorder.prometheus_text(), end="")
+
+
+if __name__ == "__main__":
+    main()
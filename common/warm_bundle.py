@@ -0,0 +1,226 @@
+"""
+Warm-start bundle: the agent's startup state in files that open by memory map.
+
+A cold start parses every line of the local index's metadata.jsonl and the
+keyword index's docs.jsonl (text included), and resolves the sentence-
+transformer through the Hugging Face hub. data/warm_bundle/ keeps the same
+state ready to map:
+
+    manifest.json          -> what each part was built from; a stale part is skipped
+    model/<name>/          -> the SentenceTransformer saved locally (safetensors
+                              weights are memory-mapped; no hub round trips)
+    vector_ids.json        -> the local index's row -> id list
+    vector_rows.bin/.npy   -> its metadata as JSON rows + int64 offsets
+    keyword_docs.bin/.npy  -> the keyword index's docs, same layout
+
+Opening then costs two offset arrays and an id list; a row's JSON is decoded
+only when a search returns it (or once per metadata filter). Any write to an
+index makes that part stale, and the loaders fall back to the normal path
+until the bundle is rebuilt.
+
+Usage:
+    python common/warm_bundle.py build [--model all-MiniLM-L6-v2]
+    python common/warm_bundle.py status
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+BUNDLE_DIR = os.getenv("WARM_BUNDLE_DIR", "data/warm_bundle")
+MANIFEST_FILE = "manifest.json"
+LOCAL_INDEX_DIR = "data/local_index"      # Same defaults as indexer/local_index.py and keyword_index.py;
+KEYWORD_INDEX_DIR = "data/keyword_index"  # not imported so this module stays cheap to import
+
+_warned = set()
+
+
+class JsonRows:
+    """Read-only sequence of JSON values: one blob plus an offsets array, both memory-mapped."""
+
+    def __init__(self, blob_path, offsets_path):
+        self.offsets = np.load(offsets_path, mmap_mode="r")
+        size = os.path.getsize(blob_path)
+        self.blob = np.memmap(blob_path, dtype=np.uint8, mode="r") if size else np.zeros(0, dtype=np.uint8)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        start, end = int(self.offsets[i]), int(self.offsets[i + 1])
+        return json.loads(self.blob[start:end].tobytes())
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    @staticmethod
+    def write(rows, blob_path, offsets_path):
+        offsets = [0]
+        with open(blob_path, "wb") as f:
+            for row in rows:
+                data = json.dumps(row).encode("utf-8")
+                f.write(data)
+                offsets.append(offsets[-1] + len(data))
+        np.save(offsets_path, np.asarray(offsets, dtype=np.int64))
+
+
+# --- STAMPS ---
+def _file_stamp(path):
+    stat = os.stat(path)
+    return {"path": os.path.abspath(path), "size": stat.st_size, "mtime": stat.st_mtime}
+
+
+def vector_stamp(index_dir):
+    with open(os.path.join(index_dir, "manifest.json"), "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    return {"metadata": _file_stamp(os.path.join(index_dir, "metadata.jsonl")), "count": manifest["count"]}
+
+
+def keyword_stamp(index_dir):
+    return {"docs": _file_stamp(os.path.join(index_dir, "docs.jsonl"))}
+
+
+def load_manifest(bundle_dir=BUNDLE_DIR):
+    try:
+        with open(os.path.join(bundle_dir, MANIFEST_FILE), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _fresh(part, stamp, bundle_dir):
+    manifest = load_manifest(bundle_dir)
+    if manifest is None or part not in manifest:
+        return False
+    if manifest[part] == stamp:
+        return True
+    if part not in _warned:
+        _warned.add(part)
+        print(f"⚠️ Warm bundle's {part} is stale; rebuild with: python common/warm_bundle.py build")
+    return False
+
+
+# --- LOADERS ---
+def model_dir(model_name, bundle_dir=BUNDLE_DIR):
+    """Local copy of a sentence-transformer in the bundle, or None."""
+    path = os.path.join(bundle_dir, "model", model_name.replace("/", "__"))
+    return path if os.path.exists(os.path.join(path, "modules.json")) else None
+
+
+def open_local_index(path=LOCAL_INDEX_DIR, bundle_dir=BUNDLE_DIR, **kwargs):
+    from indexer.local_index import LocalVectorIndex
+    if LocalVectorIndex.exists(path) and _fresh("vectors", vector_stamp(path), bundle_dir):
+        with open(os.path.join(bundle_dir, "vector_ids.json"), "r", encoding="utf-8") as f:
+            ids = json.load(f)
+        rows = JsonRows(os.path.join(bundle_dir, "vector_rows.bin"), os.path.join(bundle_dir, "vector_rows.npy"))
+        return LocalVectorIndex(path, rows=(ids, rows), **kwargs)
+    return LocalVectorIndex(path, **kwargs)
+
+
+def open_keyword_index(path=KEYWORD_INDEX_DIR, bundle_dir=BUNDLE_DIR):
+    from indexer.keyword_index import KeywordIndex
+    if KeywordIndex.exists(path) and _fresh("keyword", keyword_stamp(path), bundle_dir):
+        docs = JsonRows(os.path.join(bundle_dir, "keyword_docs.bin"), os.path.join(bundle_dir, "keyword_docs.npy"))
+        return KeywordIndex(path, docs=docs)
+    return KeywordIndex(path)
+
+
+# --- BUILD ---
+def build(bundle_dir=BUNDLE_DIR, vector_dir=LOCAL_INDEX_DIR, keyword_dir=KEYWORD_INDEX_DIR, models=()):
+    from indexer.keyword_index import KeywordIndex
+    from indexer.local_index import LocalVectorIndex
+
+    os.makedirs(bundle_dir, exist_ok=True)
+    manifest = load_manifest(bundle_dir) or {}
+
+    if LocalVectorIndex.exists(vector_dir):
+        index = LocalVectorIndex(vector_dir)
+        with open(os.path.join(bundle_dir, "vector_ids.json"), "w", encoding="utf-8") as f:
+            json.dump(index._ids, f)
+        JsonRows.write(index._metadata, os.path.join(bundle_dir, "vector_rows.bin"),
+                       os.path.join(bundle_dir, "vector_rows.npy"))
+        manifest["vectors"] = vector_stamp(vector_dir)
+        print(f"🧮 Vector rows: {index.count} from {vector_dir}")
+        if index.model and not index.model.startswith("models/"):
+            models = tuple(models) + (index.model,)
+    else:
+        manifest.pop("vectors", None)
+
+    if KeywordIndex.exists(keyword_dir):
+        with open(os.path.join(keyword_dir, "docs.jsonl"), "r", encoding="utf-8") as f:
+            JsonRows.write((json.loads(line) for line in f if line.strip()),
+                           os.path.join(bundle_dir, "keyword_docs.bin"), os.path.join(bundle_dir, "keyword_docs.npy"))
+        manifest["keyword"] = keyword_stamp(keyword_dir)
+        print(f"📑 Keyword docs from {keyword_dir}")
+    else:
+        manifest.pop("keyword", None)
+
+    for name in dict.fromkeys(models):
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError:
+            print(f"⚠️ sentence-transformers is not installed; {name} not bundled")
+            break
+        target = os.path.join(bundle_dir, "model", name.replace("/", "__"))
+        try:
+            model = SentenceTransformer(name)
+        except OSError as e:  # Not a hub model (e.g. the eval harness's hash embedder)
+            print(f"⚠️ Model {name} not bundled: {e}")
+            continue
+        shutil.rmtree(target, ignore_errors=True)
+        model.save(target)
+        manifest.setdefault("models", [])
+        if name not in manifest["models"]:
+            manifest["models"].append(name)
+        print(f"🧠 Model {name} saved to {target}")
+
+    tmp_path = os.path.join(bundle_dir, MANIFEST_FILE + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, os.path.join(bundle_dir, MANIFEST_FILE))
+    return manifest
+
+
+def status(bundle_dir=BUNDLE_DIR, vector_dir=LOCAL_INDEX_DIR, keyword_dir=KEYWORD_INDEX_DIR):
+    manifest = load_manifest(bundle_dir)
+    if manifest is None:
+        print(f"📭 No warm bundle at {bundle_dir}.")
+        return
+    for part, source, stamp in (("vectors", vector_dir, vector_stamp), ("keyword", keyword_dir, keyword_stamp)):
+        if part not in manifest:
+            print(f"   {part:<8} not bundled")
+        elif not os.path.exists(source):
+            print(f"   {part:<8} source {source} is gone")
+        else:
+            print(f"   {part:<8} {'fresh' if manifest[part] == stamp(source) else 'STALE (rebuild)'}")
+    for name in manifest.get("models", []):
+        print(f"   model    {name}: {'ok' if model_dir(name, bundle_dir) else 'missing'}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or inspect the warm-start bundle.")
+    parser.add_argument("command", choices=["build", "status"])
+    parser.add_argument("--model", action="append", default=[],
+                        help="Extra sentence-transformer to bundle (the local index's model is included)")
+    parser.add_argument("--dir", default=BUNDLE_DIR)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        print(f"📦 Building warm bundle in {args.dir}...")
+        build(args.dir, models=args.model)
+        print("✅ Done. The agent, batch_answer.py and index_data.py pick it up automatically.")
+    status(args.dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,125 +1,220 @@
+import argparse
 import asyncio
 import json
 import os
+import sys
+from contextlib import nullcontext
 from datetime import datetime
+from urllib.parse import urljoin
 from bs4 import BeautifulSoup
-from crawl4ai import AsyncWebCrawler
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.state_store import DISCOVER, EXTRACT, StateStore
+from common.tracing import count, span
+from crawler.politeness import DEFAULT_BURST, DEFAULT_RATE, HostRateLimiter
 
 # --- CONFIGURATION ---
 BASE_URL = "https://govt.westlaw.com"
 START_URL = "https://govt.westlaw.com/calregs/Browse/Home/California/CaliforniaCodeofRegulations?transitionType=Default&contextData=%28sc.Default%29"
 
-OUTPUT_FILE = "data/discovered_section_urls.jsonl"
-CHECKPOINT_FILE = "data/visited_urls.txt"
+OUTPUT_FILE = "data/discovered_section_urls.jsonl"  # Kept as the readable list; resume state is in the state store
+CONCURRENCY = 4   # Browser pages in flight at once
+MAX_RETRIES = 3   # Per folder, before we give up on it for this run
 
 # --- STATE MANAGEMENT ---
 visited_urls = set()
 existing_sections = set() # To track what we already found
-urls_to_visit = [START_URL]
-
-def load_state():
-    # 1. Load Visited Folders (The "Done List")
-    if os.path.exists(CHECKPOINT_FILE):
-        with open(CHECKPOINT_FILE, "r") as f:
-            for line in f:
-                visited_urls.add(line.strip())
-    
-    # 2. Load Existing Sections (So we don't save duplicates)
-    if os.path.exists(OUTPUT_FILE):
-        print("Loading existing results to avoid duplicates...")
-        with open(OUTPUT_FILE, "r", encoding="utf-8") as f:
-            for line in f:
-                try:
-                    if line.strip():
-                        data = json.loads(line)
-                        existing_sections.add(data["section_url"])
-                except:
-                    pass # Ignore broken lines
+seen_folders = set()      # visited + queued, so membership checks are O(1)
+
+def load_state(state):
+    """
+    Reads the "discover" and "extract" stages of the state store. Returns the
+    folders queued or failed in an earlier run, so an interrupted crawl picks
+    up its frontier instead of starting over from the home page.
+    """
+    visited_urls.update(state.keys(DISCOVER, "done"))
+    existing_sections.update(state.keys(EXTRACT, None))
+    frontier = state.keys(DISCOVER, "pending") | state.keys(DISCOVER, "failed")
+    if existing_sections:
         print(f" -> {len(existing_sections)} sections already saved. Skipping these.")
 
-    print(f"Resuming... {len(visited_urls)} folders visited.")
-
-def save_visit(url):
-    visited_urls.add(url)
-    with open(CHECKPOINT_FILE, "a") as f:
-        f.write(url + "\n")
-
-async def discover_urls():
-    load_state()
-    os.makedirs("data", exist_ok=True)
-
-    # Condition: Wait until we see at least 5 links (ensures page loaded)
-    WAIT_CONDITION = """() => {
-        return document.querySelectorAll("a").length > 5;
-    }"""
-
-    async with AsyncWebCrawler(verbose=True) as crawler:
-        while urls_to_visit:
-            current_url = urls_to_visit.pop(0)
-            
-            if current_url in visited_urls:
-                continue
-
-            print(f"\nCrawling: {current_url}")
-            
-            # --- FETCH PAGE ---
-            result = await crawler.arun(
-                url=current_url,
+    print(f"Resuming... {len(visited_urls)} folders visited, {len(frontier)} still queued.")
+    seen_folders.update(visited_urls)
+    return sorted(frontier)
+
+class Discovery:
+    """
+    Worker pool over a FIFO frontier (asyncio.Queue, deque-backed). Every worker
+    shares one browser and one per-host rate limiter, so the crawl runs as fast
+    as the politeness budget allows instead of one page at a time.
+    """
+
+    def __init__(self, crawler, limiter, sections_out, state):
+        self.crawler = crawler
+        self.limiter = limiter
+        self.sections_out = sections_out
+        self.state = state
+        self.frontier = asyncio.Queue()
+        self.attempts = {}
+        self.pages = 0
+
+    def enqueue(self, url):
+        if url in seen_folders:
+            return False
+        seen_folders.add(url)
+        self.state.add(DISCOVER, [url])
+        self.frontier.put_nowait(url)
+        return True
+
+    def save_visit(self, url):
+        visited_urls.add(url)
+        # Same batch as the sections found on the page: both land, or the page is re-crawled
+        self.state.mark(DISCOVER, [url])
+
+    def save_section(self, full_url, current_url):
+        record = {
+            "section_url": full_url,
+            "source_page": current_url,
+            "status": "discovered",
+            "retrieved_at": datetime.utcnow().isoformat()
+        }
+        self.sections_out.write(json.dumps(record) + "\n")
+        self.sections_out.flush()
+        self.state.add(EXTRACT, [full_url], info={"source_page": current_url})
+        existing_sections.add(full_url) # Add to memory so we don't save it again
+        print(f"  -> Found NEW Section: {full_url}")
+
+    async def fetch(self, url):
+        # Condition: Wait until we see at least 5 links (ensures page loaded)
+        WAIT_CONDITION = """() => {
+            return document.querySelectorAll("a").length > 5;
+        }"""
+
+        with span("discover.rate_wait"):
+            await self.limiter.acquire(url)
+        with span("discover.render"):
+            return await self.crawler.arun(
+                url=url,
                 js_code="window.scrollTo(0, document.body.scrollHeight);",
-                wait_for=f"js:{WAIT_CONDITION}", 
+                wait_for=f"js:{WAIT_CONDITION}",
                 bypass_cache=True,
                 magic=True
             )
-            
-            if not result.success:
-                print(f"Failed to fetch: {current_url}")
-                # Optional: Add back to end of queue to retry later
-                # urls_to_visit.append(current_url) 
-                continue
 
+    def retry_or_fail(self, url, reason):
+        self.limiter.record_failure(url)
+        attempts = self.attempts.get(url, 0) + 1
+        self.attempts[url] = attempts
+        if attempts < MAX_RETRIES:
+            count("crawl_retries_total", stage="discover")
+            print(f"{reason}: {url} (retry {attempts}/{MAX_RETRIES - 1}, "
+                  f"host rate now {self.limiter.current_rate(url):.2f}/s)")
+            self.frontier.put_nowait(url)
+        else:
+            print(f"Giving up on: {url} ({reason})")
+            count("crawl_failures_total", stage="discover")
+            try:
+                self.state.mark(DISCOVER, [url], "failed", error=reason)
+            except Exception as e:
+                print(f"   ⚠️ Could not record the failure ({e}); {url} stays queued for the next run.")
+
+    async def visit(self, current_url):
+        print(f"\nCrawling: {current_url}")
+
+        # --- FETCH PAGE ---
+        try:
+            result = await self.fetch(current_url)
+            success = result.success
+        except Exception as e:
+            print(f"Fetch error for {current_url}: {e}")
+            success = False
+
+        if not success:
+            self.retry_or_fail(current_url, "Failed to fetch")
+            return
+
+        self.limiter.record_success(current_url)
+        new_links_found = 0
+        with span("discover.parse") as s:
             soup = BeautifulSoup(result.html, "html.parser")
-            all_links = soup.find_all("a", href=True)
-            
-            # print(f"   [Debug] Found {len(all_links)} links.")
-            
-            new_links_found = 0
-            for a in all_links:
+
+            for a in soup.find_all("a", href=True):
                 href = a["href"]
-                
+
                 if href.startswith("http"):
                     full_url = href
                 else:
-                    full_url = BASE_URL + href
+                    full_url = urljoin(current_url, href)  # BASE_URL + href on Westlaw; any host in bench/
 
                 # CASE 1: Folder (Title, Chapter, etc.)
                 if "/calregs/Browse/" in href:
-                    if full_url not in visited_urls and full_url not in urls_to_visit:
-                        if full_url != current_url:
-                            urls_to_visit.append(full_url)
-                            new_links_found += 1
+                    if full_url != current_url and self.enqueue(full_url):
+                        new_links_found += 1
 
                 # CASE 2: File (Law Section)
                 elif "/calregs/Document/" in href:
                     # --- SMART CHECK: SKIP IF ALREADY FOUND ---
-                    if full_url in existing_sections:
-                        continue 
-
-                    record = {
-                        "section_url": full_url,
-                        "source_page": current_url,
-                        "status": "discovered",
-                        "retrieved_at": datetime.utcnow().isoformat()
-                    }
-                    
-                    with open(OUTPUT_FILE, "a", encoding="utf-8") as f:
-                        f.write(json.dumps(record) + "\n")
-                        print(f"  -> Found NEW Section: {full_url}")
-                        existing_sections.add(full_url) # Add to memory so we don't save it again
-
-            save_visit(current_url)
-            print(f"  Processed. Added {new_links_found} new folders to queue.")
-            
-            await asyncio.sleep(1.0)
+                    if full_url not in existing_sections:
+                        self.save_section(full_url, current_url)
+            s.set(new_folders=new_links_found)
+
+        self.save_visit(current_url)
+        self.pages += 1
+        print(f"  Processed. Added {new_links_found} new folders to queue ({self.frontier.qsize()} queued).")
+
+    async def worker(self):
+        while True:
+            url = await self.frontier.get()
+            try:
+                if url not in visited_urls:
+                    with span("discover.page", url=url):
+                        await self.visit(url)
+            except Exception as e:
+                # A bad page (no HTML, a parse error) or a state store hiccup must not end this
+                # worker: frontier.join() would then wait forever on the URLs it leaves behind
+                self.retry_or_fail(url, f"Crawl error ({e})")
+            finally:
+                self.frontier.task_done()
+
+    async def run(self, start_urls, concurrency):
+        for url in start_urls:
+            if url not in visited_urls:
+                seen_folders.add(url)
+                self.state.add(DISCOVER, [url])
+                self.frontier.put_nowait(url)
+
+        workers = [asyncio.create_task(self.worker()) for _ in range(concurrency)]
+        await self.frontier.join()
+        for w in workers:
+            w.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+
+async def discover_urls(concurrency=CONCURRENCY, rate=DEFAULT_RATE, burst=DEFAULT_BURST,
+                        start_url=START_URL, crawler=None):
+    """crawler: anything with AsyncWebCrawler's arun() (bench/ passes a plain HTTP client)."""
+    os.makedirs("data", exist_ok=True)
+    state = StateStore()
+    frontier = load_state(state)
+
+    limiter = HostRateLimiter(rate=rate, burst=burst)
+    print(f"🚀 Discovering with {concurrency} pages in flight, {rate} req/s per host...")
+
+    if not crawler:
+        from crawl4ai import AsyncWebCrawler  # Only a real crawl needs the browser stack
+    async with nullcontext(crawler) if crawler else AsyncWebCrawler(verbose=True) as crawler:
+        with open(OUTPUT_FILE, "a", encoding="utf-8") as sections_out:
+            discovery = Discovery(crawler, limiter, sections_out, state)
+            try:
+                await discovery.run(frontier or [start_url], concurrency)
+            finally:
+                state.close()
+
+    print(f"✅ Discovery complete: {discovery.pages} folders crawled, {len(existing_sections)} sections known.")
 
 if __name__ == "__main__":
-    asyncio.run(discover_urls())
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Discover every CCR section URL from the browse tree.")
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY, help="Browser pages in flight")
+    parser.add_argument("--rate", type=float, default=DEFAULT_RATE, help="Requests per second per host")
+    parser.add_argument("--burst", type=int, default=DEFAULT_BURST, help="Requests allowed back-to-back")
+    args = parser.parse_args()
+    asyncio.run(discover_urls(args.concurrency, args.rate, args.burst))
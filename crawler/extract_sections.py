@@ -1,181 +1,364 @@
+import argparse
 import asyncio
+import collections
 import json
 import os
-import re
-from datetime import datetime
-from bs4 import BeautifulSoup
-from crawl4ai import AsyncWebCrawler
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.corpus_store import CorpusStore
+from common.jsonl_reader import JsonlReader
+from common.state_store import EXTRACT, LEASE_SECONDS, MAX_ATTEMPTS, StateStore, worker_id
+from crawler.html_store import HtmlStore, document_guid, read_object
+from crawler.parsing import BACKEND, parse_page
+from common.tracing import count, span
+from crawler.politeness import AdaptiveConcurrency, HostRateLimiter
 
 # --- CONFIGURATION ---
-INPUT_FILE = "data/discovered_section_urls.jsonl"
 OUTPUT_FILE = "data/extracted_data.jsonl"
-CONCURRENCY = 3
+CONCURRENCY = 3        # Starting window of fetches in flight
+MAX_CONCURRENCY = 8    # Upper bound for the adaptive window
+TARGET_LATENCY = 10.0  # Seconds; slower pages shrink the window
+RATE = 2.0             # Requests per second per host
+MAX_RETRIES = 2
+FLUSH_INTERVAL = 2.0   # Seconds between writer flushes
+FLUSH_RECORDS = 50     # ...or this many buffered records, whichever comes first
+CLAIM_BATCH = 200      # URLs claimed from the state store at a time
+REPARSE_BATCH = 32     # Records per --reparse task sent to a worker process
+REPARSE_IN_FLIGHT = 4  # --reparse tasks queued per process; bounds memory on a large output
 
 # --- RESUME LOGIC ---
-processed_urls = set()
-if os.path.exists(OUTPUT_FILE):
-    with open(OUTPUT_FILE, "r", encoding="utf-8") as f:
-        for line in f:
-            try:
-                data = json.loads(line)
-                # Ensure we have content and at least a Title or Section to count as "Done"
-                if data.get("content_markdown") and (data.get("title_number") or data.get("section_number")):
-                    processed_urls.add(data["source_url"])
-            except: pass
-    print(f"🔄 Resuming... {len(processed_urls)} valid records already extracted.")
-
-def parse_metadata_from_text(markdown_text, struct, current_section_num, current_section_head):
+# The "extract" stage of the state store lists every discovered section URL and
+# whether it has been extracted; workers claim pending URLs in batches, so
+# several extractor processes can share the backlog.
+def sync_corpus():
+    store = CorpusStore()
+    added = store.sync(OUTPUT_FILE)
+    store.close()
+    print(f"📦 Corpus store updated ({added} records ingested, {len(store)} sections).")
+
+async def record_writer(records, output_file, state):
     """
-    Scans the first 20 lines of text to find missing Hierarchy or Section info.
+    Single writer task: one open file, flushed every FLUSH_INTERVAL seconds
+    or FLUSH_RECORDS records, instead of reopening the output per record.
+    URLs are marked extracted only once their records are flushed.
     """
-    lines = markdown_text.split('\n')[:30] # Look at first 30 lines
-    
-    for line in lines:
-        line = line.strip()
-        if not line: continue
-
-        # 1. Fallback for Hierarchy (Title, Div, Chap)
-        if not struct["title_number"]:
-            m = re.match(r"^Title\s+([0-9A-Za-z]+)\.?\s+(.*)", line, re.IGNORECASE)
-            if m: 
-                struct["title_number"] = m.group(1)
-                struct["title_name"] = m.group(2)
-        
-        if not struct["division"]:
-            m = re.match(r"^Division\s+([0-9A-Za-z]+)\.?\s+(.*)", line, re.IGNORECASE)
-            if m: struct["division"] = f"{m.group(1)}. {m.group(2)}"
-
-        if not struct["chapter"]:
-            m = re.match(r"^Chapter\s+([0-9A-Za-z]+)\.?\s+(.*)", line, re.IGNORECASE)
-            if m: struct["chapter"] = f"{m.group(1)}. {m.group(2)}"
-
-        # 2. Fallback for Section Number (Crucial!)
-        # Looks for: "§ 123. Heading" OR "Section 123. Heading"
-        if not current_section_num:
-            # Match "§ 1234. Text"
-            sec_m = re.match(r"^§\s*([0-9A-Za-z\.]+)\.?\s*(.*)", line)
-            if not sec_m:
-                # Match "Section 1234. Text"
-                sec_m = re.match(r"^Section\s+([0-9A-Za-z\.]+)\.?\s*(.*)", line, re.IGNORECASE)
-            
-            if sec_m:
-                current_section_num = sec_m.group(1)
-                current_section_head = sec_m.group(2)
-
-    return struct, current_section_num, current_section_head
-
-async def extract_content():
-    urls_to_process = []
-    try:
-        with open(INPUT_FILE, "r", encoding="utf-8") as f:
-            for line in f:
-                if line.strip():
-                    try:
-                        record = json.loads(line)
-                        if record["section_url"] not in processed_urls:
-                            urls_to_process.append(record["section_url"])
-                    except: pass
-    except FileNotFoundError:
-        print(f"❌ Error: {INPUT_FILE} not found.")
-        return
+    buffered = []
+    last_flush = time.monotonic()
+    finished = False
+    with open(output_file, "a", encoding="utf-8") as f:
+        while not finished:
+            try:
+                item = await asyncio.wait_for(records.get(), timeout=FLUSH_INTERVAL)
+                if item is None:
+                    finished = True
+                else:
+                    url, record = item
+                    f.write(json.dumps(record) + "\n")
+                    buffered.append(url)
+            except asyncio.TimeoutError:
+                pass
+            if buffered and (finished or len(buffered) >= FLUSH_RECORDS or time.monotonic() - last_flush >= FLUSH_INTERVAL):
+                f.flush()
+                state.mark(EXTRACT, buffered)
+                buffered = []
+                last_flush = time.monotonic()
 
-    total = len(urls_to_process)
-    print(f"🚀 Starting Extraction for {total} URLs...")
+class Extractor:
+    """
+    Sliding-window scheduler: workers pull URLs from a queue and every fetch
+    goes through the adaptive window and the per-host rate limiter, so a new
+    fetch starts as soon as any one finishes.
+    """
 
-    # Wait for the main text box
-    WAIT_CONDITION = """() => {
-        return document.getElementById('co_document') !== null || 
-               document.getElementById('co_docContent') !== null || 
-               document.querySelector('.co_contentWrapper') !== null;
-    }"""
+    def __init__(self, crawler, window, limiter, records, store, state=None, lease=LEASE_SECONDS,
+                 claim_batch=CLAIM_BATCH):
+        self.crawler = crawler
+        self.window = window
+        self.limiter = limiter
+        self.records = records
+        self.store = store
+        self.state = state
+        self.worker_name = worker_id()
+        self.lease = lease
+        self.claim_batch = claim_batch
+        self.held = []  # Claimed URLs of the current batch, renewed while it runs
+        self.queue = asyncio.Queue()
+        self.attempts = {}
+        self.done = 0
+        self.failed = 0
+        self.total = 0
 
-    async with AsyncWebCrawler(verbose=False) as crawler:
-        for i in range(0, total, CONCURRENCY):
-            batch = urls_to_process[i : i + CONCURRENCY]
-            print(f"   Processing batch {i}/{total}...")
+    async def fetch(self, url):
+        # Wait for the main text box
+        WAIT_CONDITION = """() => {
+            return document.getElementById('co_document') !== null ||
+                   document.getElementById('co_docContent') !== null ||
+                   document.querySelector('.co_contentWrapper') !== null;
+        }"""
 
-            tasks = []
-            for url in batch:
-                tasks.append(crawler.arun(
+        with span("extract.window_wait", limit=self.window.limit):
+            await self.window.acquire()
+        started = None
+        ok = None
+        try:
+            # Inside the try so a cancelled or failed rate wait still gives the window slot back
+            with span("extract.rate_wait"):
+                await self.limiter.acquire(url)
+            started = time.monotonic()
+            ok = False
+            # Navigation, rendering and the wait_for condition all happen inside arun()
+            with span("extract.render") as s:
+                result = await self.crawler.arun(
                     url=url,
                     js_code="window.scrollTo(0, document.body.scrollHeight);",
                     wait_for=f"js:{WAIT_CONDITION}",
                     magic=True,
                     bypass_cache=True
-                ))
+                )
+                s.set(success=result.success)
+            ok = result.success
+            return result
+        finally:
+            await self.window.release(time.monotonic() - started if started is not None else 0.0, ok)
 
-            results = await asyncio.gather(*tasks)
+    def retry_or_fail(self, url, reason):
+        self.limiter.record_failure(url)
+        attempts = self.attempts.get(url, 0) + 1
+        self.attempts[url] = attempts
+        if attempts <= MAX_RETRIES:
+            count("crawl_retries_total", stage="extract")
+            print(f"   ⚠️ {reason}: {url} (retry {attempts}/{MAX_RETRIES})")
+            self.queue.put_nowait(url)
+        else:
+            self.failed += 1
+            count("crawl_failures_total", stage="extract")
+            if self.state is not None:
+                self.state.mark(EXTRACT, [url], "failed", error=reason)
+            print(f"   ⚠️ {reason}, giving up: {url}")
 
-            for result in results:
-                if not result.success:
-                    print(f"   ⚠️ Network Fail: {result.url}")
-                    continue
+    async def process(self, url):
+        with span("extract.page", url=url) as page:
+            page.set(outcome=await self._process(url))
+
+    async def _process(self, url):
+        try:
+            result = await self.fetch(url)
+        except Exception as e:
+            self.retry_or_fail(url, f"Fetch error ({e})")
+            return "fetch_error"
+
+        if not result.success:
+            self.retry_or_fail(url, "Network Fail")
+            return "network_fail"
+        self.limiter.record_success(url)
+
+        # Keep the raw page so parser fixes can be replayed with --reparse
+        with span("extract.snapshot"):
+            snapshot = self.store.put(result.url, result.html)
+
+        with span("extract.parse", parser=BACKEND):
+            extracted_record = parse_page(result.html, result.url, snapshot["fetched_at"])
+        if extracted_record is None:
+            self.failed += 1
+            if self.state is not None:
+                self.state.mark(EXTRACT, [url], "failed", error="content not found")
+            print(f"   ⚠️ Content not found for {result.url}")
+            return "not_found"
+
+        await self.records.put((url, extracted_record))
+        self.done += 1
+        if self.done % 25 == 0:
+            print(f"   Processed {self.done}/{self.total} (window: {self.window.limit}, failed: {self.failed})...")
+        return "ok"
+
+    async def worker(self):
+        while True:
+            url = await self.queue.get()
+            try:
+                await self.process(url)
+            except Exception as e:
+                # A snapshot write or parser error on one page must not end this worker
+                self.retry_or_fail(url, f"Extract error ({e})")
+            finally:
+                self.queue.task_done()
+
+    async def renew_leases(self):
+        # A live worker keeps its batch; a crashed one stops renewing and its URLs go back to the pool
+        while True:
+            await asyncio.sleep(self.lease / 3)
+            if self.held:
+                self.held = self.state.renew(EXTRACT, self.held, self.worker_name, lease=self.lease)
 
-                soup = BeautifulSoup(result.html, "html.parser")
+    def claim(self):
+        self.held = self.state.claim(EXTRACT, self.worker_name, limit=self.claim_batch, lease=self.lease)
+        return self.held
 
-                # 1. GET CONTENT
-                content_div = soup.find("div", {"id": "co_document"}) or \
-                              soup.find("div", {"id": "co_docContent"}) or \
-                              soup.find("div", class_="co_contentWrapper")
+    async def run(self, urls=None):
+        """Processes the given URLs, or (urls=None) claims batches from the state store until none are left."""
+        # Enough workers to fill the largest window; the window decides how many actually fetch
+        workers = [asyncio.create_task(self.worker()) for _ in range(self.window.maximum)]
+        if urls is None:
+            workers.append(asyncio.create_task(self.renew_leases()))
+        batch = urls if urls is not None else self.claim()
+        while batch:
+            self.total += len(batch)
+            for url in batch:
+                self.queue.put_nowait(url)
+            await self.queue.join()
+            batch = self.claim() if urls is None else None
+        for w in workers:
+            w.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+
+def reparse_one(job):
+    store_path, entry, record = job
+    html = read_object(store_path, entry["sha256"])
+    url = record["source_url"] if record else entry["url"]
+    reparsed = parse_page(html, url, entry["fetched_at"])
+    if reparsed is None:
+        return ("unparsed", record) if record else ("empty", None)
+    return ("replaced" if record else "added"), reparsed
+
+def reparse_batch(jobs):
+    return [reparse_one(job) for job in jobs]
+
+def reparse(workers=None):
+    """
+    Re-parses OUTPUT_FILE's records from their stored snapshots across a
+    process pool. No network: this is what to run after changing parse_page().
+    Records without a snapshot, or whose snapshot no longer yields content,
+    are kept as they are; snapshots of pages missing from the output are
+    added when they now parse (and marked extracted).
+    """
+    store = HtmlStore()
+    if not len(store):
+        print("❌ No HTML snapshots yet. Run a normal extraction first.")
+        return
+    if not os.path.exists(OUTPUT_FILE):
+        print(f"❌ {OUTPUT_FILE} not found. Run a normal extraction first.")
+        return
+
+    reader = JsonlReader(OUTPUT_FILE, required_keys=("source_url",))
+    seen = set()
+
+    def jobs():
+        # Output order is kept: one job per existing record, then the snapshots it never had
+        for record in reader:
+            guid = document_guid(record["source_url"])
+            seen.add(guid)
+            yield store.path, store.entries.get(guid), record
+        for guid, entry in store.entries.items():
+            if guid not in seen:
+                yield store.path, entry, None
 
-                if not content_div:
-                    print(f"   ⚠️ Content not found for {result.url}")
+    print(f"♻️  Re-parsing {OUTPUT_FILE} from {len(store)} snapshots with {workers or os.cpu_count()} processes "
+          f"(parser: {BACKEND})...")
+    started = time.perf_counter()
+
+    outcomes = {"replaced": 0, "kept": 0, "unparsed": 0, "added": 0, "empty": 0}
+    added_urls = []
+    # Sliding window of (future or None, [(job, result)]) in output order. Records without a snapshot
+    # (extracted before snapshots existed) never leave this process; the rest go out in batches, and at
+    # most REPARSE_IN_FLIGHT per process are queued, so the output is never held in memory at once.
+    in_flight = collections.deque()
+    batch = []
+    max_in_flight = (workers or os.cpu_count() or 1) * REPARSE_IN_FLIGHT
+
+    def submit():
+        jobs_out = [job for job, _ in batch if job is not None]
+        in_flight.append((pool.submit(reparse_batch, jobs_out) if jobs_out else None, batch[:]))
+        batch.clear()
+
+    def drain(limit):
+        while len(in_flight) > limit:
+            future, items = in_flight.popleft()
+            results = iter(future.result() if future else ())
+            for job, result in items:
+                outcome, record = next(results) if job is not None else result
+                outcomes[outcome] += 1
+                if record is None:
                     continue
+                if outcome == "added":
+                    added_urls.append(record["source_url"])
+                out.write(json.dumps(record) + "\n")
 
-                markdown_text = content_div.get_text(separator="\n\n", strip=True)
-
-                # 2. GET BREADCRUMBS (Hierarchy)
-                breadcrumbs = []
-                bc_div = soup.find("div", {"id": "co_breadcrumb"}) or soup.find("div", class_="co_breadcrumb")
-                if bc_div:
-                    breadcrumbs = [li.get_text(strip=True) for li in bc_div.find_all("li")]
-                
-                # Parse Breadcrumbs first
-                hierarchy_data = {
-                    "title_number": None, "title_name": None, "division": None,
-                    "chapter": None, "subchapter": None, "article": None
-                }
-                # (Simple parsing logic matches previous script)
-                for item in breadcrumbs:
-                    item = item.strip()
-                    m = re.match(r"^(Title|Division|Chapter|Article)\s+([0-9A-Za-z\.]+)\.?\s*(.*)", item, re.IGNORECASE)
-                    if m:
-                        t = m.group(1).lower()
-                        if t == "title": hierarchy_data["title_number"], hierarchy_data["title_name"] = m.group(2), m.group(3)
-                        elif t == "division": hierarchy_data["division"] = f"{m.group(2)}. {m.group(3)}"
-                        elif t == "chapter": hierarchy_data["chapter"] = f"{m.group(2)}. {m.group(3)}"
-                        elif t == "article": hierarchy_data["article"] = f"{m.group(2)}. {m.group(3)}"
-
-                # 3. GET METADATA (Title Tag)
-                page_title = soup.find("title").get_text().split("|")[0].strip() if soup.find("title") else "Unknown"
-                
-                # Try to find Section in Title Tag
-                sec_match = re.search(r"§\s*([0-9A-Za-z\.]+)\.\s*(.*)", page_title)
-                section_number = sec_match.group(1) if sec_match else None
-                section_heading = sec_match.group(2) if sec_match else page_title
-
-                # 4. FALLBACK: Look inside the text if Breadcrumbs/Title failed
-                hierarchy_data, section_number, section_heading = parse_metadata_from_text(
-                    markdown_text, hierarchy_data, section_number, section_heading
-                )
+    tmp_path = OUTPUT_FILE + ".reparse.tmp"
+    with ProcessPoolExecutor(max_workers=workers) as pool, open(tmp_path, "w", encoding="utf-8") as out:
+        for job in jobs():
+            _, entry, record = job
+            batch.append((job, None) if entry is not None else (None, ("kept", record)))
+            if len(batch) >= REPARSE_BATCH:
+                submit()
+                drain(max_in_flight)
+        if batch:
+            submit()
+        drain(0)
 
-                # 5. SAVE
-                extracted_record = {
-                    "citation": f"{hierarchy_data['title_number']} CCR § {section_number}" if section_number else page_title,
-                    "source_url": result.url,
-                    "retrieved_at": datetime.utcnow().isoformat(),
-                    **hierarchy_data, # Unpack hierarchy fields
-                    "section_number": section_number,
-                    "section_heading": section_heading,
-                    "content_markdown": markdown_text
-                }
+    # Swap in atomically so a crash never leaves a half-written dataset
+    os.replace(tmp_path, OUTPUT_FILE)
+    if added_urls:
+        state = StateStore()
+        state.mark(EXTRACT, added_urls)
+        state.close()
 
-                with open(OUTPUT_FILE, "a", encoding="utf-8") as f:
-                    f.write(json.dumps(extracted_record) + "\n")
+    elapsed = time.perf_counter() - started
+    print(f"✅ Re-parse Complete in {elapsed:.1f}s: {outcomes['replaced']} records replaced, "
+          f"{outcomes['kept'] + outcomes['unparsed']} kept ({outcomes['kept']} without a snapshot, "
+          f"{outcomes['unparsed']} whose snapshot has no content under this parser), {outcomes['added']} added "
+          f"from snapshots, {reader.errors} malformed lines dropped.")
+    if outcomes["empty"]:
+        print(f"   ⚠️ {outcomes['empty']} snapshots not in the output still have no content.")
+    sync_corpus()
 
-            await asyncio.sleep(1.0)
+async def extract_content(concurrency=CONCURRENCY, max_concurrency=MAX_CONCURRENCY, rate=RATE, crawler=None):
+    """crawler: anything with AsyncWebCrawler's arun() (bench/ passes a plain HTTP client)."""
+    state = StateStore()
+    # Failures from earlier runs get another go, up to MAX_ATTEMPTS claims each
+    state.retry_failed(EXTRACT, max_attempts=MAX_ATTEMPTS)
+    counts = state.counts(EXTRACT).get(EXTRACT, {})
+    if not counts:
+        print("❌ Error: no discovered sections in the state store. Run crawler/discover_all_urls.py first.")
+        state.close()
+        return
+    if counts.get("done"):
+        print(f"🔄 Resuming... {counts['done']} valid records already extracted.")
+
+    total = counts.get("pending", 0)  # Includes the failures retry_failed() just re-queued
+    print(f"🚀 Starting Extraction for {total} URLs (window {concurrency}-{max_concurrency}, {rate} req/s, parser: {BACKEND})...")
+
+    window = AdaptiveConcurrency(initial=concurrency, maximum=max_concurrency, target_latency=TARGET_LATENCY)
+    limiter = HostRateLimiter(rate=rate)
+    records = asyncio.Queue()
+    writer = asyncio.create_task(record_writer(records, OUTPUT_FILE, state))
+
+    try:
+        if not crawler:
+            from crawl4ai import AsyncWebCrawler  # Only a real crawl needs the browser stack
+        async with nullcontext(crawler) if crawler else AsyncWebCrawler(verbose=False) as crawler:
+            extractor = Extractor(crawler, window, limiter, records, HtmlStore(), state)
+            await extractor.run()
+    finally:
+        await records.put(None)
+        await writer
+        state.close()
 
-    print("✅ Extraction Complete!")
+    print(f"✅ Extraction Complete! {extractor.done} saved, {extractor.failed} failed.")
+    sync_corpus()
 
 if __name__ == "__main__":
-    asyncio.run(extract_content())
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Extract section text for every discovered URL.")
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY, help="Initial fetches in flight")
+    parser.add_argument("--max-concurrency", type=int, default=MAX_CONCURRENCY, help="Upper bound for the adaptive window")
+    parser.add_argument("--rate", type=float, default=RATE, help="Requests per second per host")
+    parser.add_argument("--reparse", action="store_true",
+                        help="Re-parse the output's records from saved HTML snapshots instead of fetching")
+    parser.add_argument("--workers", type=int, default=None, help="Processes for --reparse (default: all cores)")
+    args = parser.parse_args()
+    if args.reparse:
+        reparse(args.workers)
+    else:
+        asyncio.run(extract_content(args.concurrency, args.max_concurrency, args.rate))
@@ -0,0 +1,130 @@
+"""
+Compressed, content-addressed store of raw section HTML.
+
+Every page the extractor fetches is kept, so a parser fix can be applied with
+`python crawler/extract_sections.py --reparse` instead of re-fetching 5,300
+pages through a headless browser.
+
+Layout of data/html_snapshots/:
+    objects/ab/abcdef....html.gz -> gzip'd HTML, named by sha256 of the HTML
+    index.jsonl                  -> {"guid", "url", "sha256", "fetched_at"}; last line per guid wins
+
+Identical pages share one object; the index maps each Westlaw document GUID
+(the "I..." id in /calregs/Document/<guid>) to its latest snapshot.
+
+Usage:
+    python crawler/html_store.py stats
+    python crawler/html_store.py dump <guid or url> [out.html]
+"""
+import gzip
+import hashlib
+import json
+import os
+import re
+import sys
+from datetime import datetime
+
+SNAPSHOT_DIR = "data/html_snapshots"
+INDEX_FILE = "index.jsonl"
+
+GUID_RE = re.compile(r"/Document/(I[0-9A-Fa-f]{32})")
+
+
+def document_guid(url):
+    m = GUID_RE.search(url)
+    if m:
+        return m.group(1).upper()
+    # Not a Westlaw document URL; still give it a stable key
+    return "U" + hashlib.sha1(url.encode("utf-8")).hexdigest()
+
+
+class HtmlStore:
+    def __init__(self, path=SNAPSHOT_DIR):
+        self.path = path
+        self.entries = {}
+        index_path = os.path.join(path, INDEX_FILE)
+        if os.path.exists(index_path):
+            with open(index_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # Torn last line from an interrupted run
+                    self.entries[entry["guid"]] = entry
+
+    def _object_path(self, sha):
+        return os.path.join(self.path, "objects", sha[:2], sha + ".html.gz")
+
+    def put(self, url, html, fetched_at=None):
+        data = html.encode("utf-8")
+        sha = hashlib.sha256(data).hexdigest()
+        object_path = self._object_path(sha)
+
+        if not os.path.exists(object_path):
+            os.makedirs(os.path.dirname(object_path), exist_ok=True)
+            tmp_path = f"{object_path}.{os.getpid()}.tmp"  # Extractor processes can share the store
+            with open(tmp_path, "wb") as f:
+                f.write(gzip.compress(data, compresslevel=6))
+            os.replace(tmp_path, object_path)
+
+        guid = document_guid(url)
+        entry = {
+            "guid": guid,
+            "url": url,
+            "sha256": sha,
+            "fetched_at": fetched_at or datetime.utcnow().isoformat()
+        }
+        previous = self.entries.get(guid)
+        if previous is None or previous["sha256"] != sha or previous["url"] != url:
+            with open(os.path.join(self.path, INDEX_FILE), "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry) + "\n")
+        self.entries[guid] = entry
+        return entry
+
+    def get(self, key):
+        """HTML for a GUID or a document URL (None if we never stored it)."""
+        entry = self.entries.get(key) or self.entries.get(document_guid(key))
+        if entry is None:
+            return None
+        return read_object(self.path, entry["sha256"])
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __iter__(self):
+        return iter(self.entries.values())
+
+
+def read_object(path, sha):
+    # Module-level so process-pool workers can load snapshots without the index
+    with gzip.open(os.path.join(path, "objects", sha[:2], sha + ".html.gz"), "rb") as f:
+        return f.read().decode("utf-8")
+
+
+def main():
+    if len(sys.argv) < 2 or sys.argv[1] not in ("stats", "dump"):
+        print(__doc__)
+        return
+
+    store = HtmlStore()
+    if sys.argv[1] == "stats":
+        objects = {e["sha256"] for e in store}
+        size = sum(
+            os.path.getsize(os.path.join(root, name))
+            for root, _, names in os.walk(os.path.join(SNAPSHOT_DIR, "objects")) for name in names
+        )
+        print(f"📦 {len(store)} documents, {len(objects)} unique snapshots, {size / 1e6:.1f} MB compressed")
+        return
+
+    html = store.get(sys.argv[2])
+    if html is None:
+        print(f"❌ No snapshot for {sys.argv[2]}")
+        return
+    out = sys.argv[3] if len(sys.argv) > 3 else "debug_page.html"
+    with open(out, "w", encoding="utf-8") as f:
+        f.write(html)
+    print(f"📄 Saved HTML to '{out}' ({len(html)} characters)")
+
+
+if __name__ == "__main__":
+    main()
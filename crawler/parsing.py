@@ -0,0 +1,229 @@
+"""
+Section page parser shared by the live extractor and --reparse.
+
+Picks the fastest HTML backend that is installed:
+    selectolax (lexbor)  ~20x faster than html.parser on Westlaw pages
+    lxml                 via BeautifulSoup(html, "lxml")
+    html.parser          always available, the reference implementation
+Set CCR_HTML_PARSER=selectolax|lxml|html.parser to force one.
+
+All backends must produce identical records; bench/bench_parser.py checks
+that against html.parser and measures pages/sec.
+"""
+import os
+import re
+from datetime import datetime
+
+# --- COMPILED PATTERNS ---
+TITLE_LINE_RE = re.compile(r"^Title\s+([0-9A-Za-z]+)\.?\s+(.*)", re.IGNORECASE)
+DIVISION_LINE_RE = re.compile(r"^Division\s+([0-9A-Za-z]+)\.?\s+(.*)", re.IGNORECASE)
+CHAPTER_LINE_RE = re.compile(r"^Chapter\s+([0-9A-Za-z]+)\.?\s+(.*)", re.IGNORECASE)
+SECTION_SIGN_LINE_RE = re.compile(r"^§\s*([0-9A-Za-z\.]+)\.?\s*(.*)")
+SECTION_WORD_LINE_RE = re.compile(r"^Section\s+([0-9A-Za-z\.]+)\.?\s*(.*)", re.IGNORECASE)
+BREADCRUMB_RE = re.compile(r"^(Title|Division|Chapter|Article)\s+([0-9A-Za-z\.]+)\.?\s*(.*)", re.IGNORECASE)
+PAGE_TITLE_SECTION_RE = re.compile(r"§\s*([0-9A-Za-z\.]+)\.\s*(.*)")
+
+SEPARATOR = "\n\n"
+CONTENT_SELECTORS = ("div#co_document", "div#co_docContent", "div.co_contentWrapper")
+BREADCRUMB_SELECTORS = ("div#co_breadcrumb", "div.co_breadcrumb")
+SKIP_TEXT_PARENTS = frozenset(("script", "style", "template"))
+
+
+def _detect_backend():
+    forced = os.getenv("CCR_HTML_PARSER")
+    if forced:
+        return forced
+    try:
+        import selectolax.lexbor  # noqa: F401
+        return "selectolax"
+    except ImportError:
+        pass
+    try:
+        import lxml  # noqa: F401
+        return "lxml"
+    except ImportError:
+        return "html.parser"
+
+
+BACKEND = _detect_backend()
+
+
+def available_backends():
+    backends = ["html.parser"]
+    try:
+        import lxml  # noqa: F401
+        backends.append("lxml")
+    except ImportError:
+        pass
+    try:
+        import selectolax.lexbor  # noqa: F401
+        backends.append("selectolax")
+    except ImportError:
+        pass
+    return backends
+
+
+class SoupPage:
+    """BeautifulSoup view of a page (html.parser or lxml tree builder)."""
+
+    def __init__(self, html, features):
+        from bs4 import BeautifulSoup
+        self.soup = BeautifulSoup(html, features)
+
+    def content_text(self):
+        soup = self.soup
+        content_div = soup.find("div", {"id": "co_document"}) or \
+                      soup.find("div", {"id": "co_docContent"}) or \
+                      soup.find("div", class_="co_contentWrapper")
+        if not content_div:
+            return None
+        return content_div.get_text(separator=SEPARATOR, strip=True)
+
+    def breadcrumbs(self):
+        bc_div = self.soup.find("div", {"id": "co_breadcrumb"}) or self.soup.find("div", class_="co_breadcrumb")
+        if not bc_div:
+            return []
+        return [li.get_text(strip=True) for li in bc_div.find_all("li")]
+
+    def page_title(self):
+        title = self.soup.find("title")
+        return title.get_text() if title else None
+
+
+class LexborPage:
+    """selectolax view of a page; text joining mirrors BeautifulSoup's get_text(strip=True)."""
+
+    def __init__(self, html):
+        from selectolax.lexbor import LexborHTMLParser
+        self.tree = LexborHTMLParser(html)
+
+    def _first(self, selectors):
+        for selector in selectors:
+            node = self.tree.css_first(selector)
+            if node is not None:
+                return node
+        return None
+
+    @staticmethod
+    def _strings(node):
+        for child in node.traverse(include_text=True):
+            if child.tag != "-text" or (child.parent is not None and child.parent.tag in SKIP_TEXT_PARENTS):
+                continue
+            text = child.text_content.strip()
+            if text:
+                yield text
+
+    def content_text(self):
+        node = self._first(CONTENT_SELECTORS)
+        if node is None:
+            return None
+        return SEPARATOR.join(self._strings(node))
+
+    def breadcrumbs(self):
+        node = self._first(BREADCRUMB_SELECTORS)
+        if node is None:
+            return []
+        return ["".join(self._strings(li)) for li in node.css("li")]
+
+    def page_title(self):
+        node = self.tree.css_first("title")
+        return node.text() if node is not None else None
+
+
+def load_page(html, backend=None):
+    backend = backend or BACKEND
+    if backend == "selectolax":
+        return LexborPage(html)
+    return SoupPage(html, "lxml" if backend == "lxml" else "html.parser")
+
+
+def parse_metadata_from_text(markdown_text, struct, current_section_num, current_section_head):
+    """
+    Scans the first 30 lines of text to find missing Hierarchy or Section info.
+    """
+    lines = markdown_text.split('\n')[:30] # Look at first 30 lines
+
+    for line in lines:
+        # Nothing left to fill in: the remaining lines can't change the result
+        if struct["title_number"] and struct["division"] and struct["chapter"] and current_section_num:
+            break
+
+        line = line.strip()
+        if not line: continue
+
+        # 1. Fallback for Hierarchy (Title, Div, Chap)
+        if not struct["title_number"]:
+            m = TITLE_LINE_RE.match(line)
+            if m:
+                struct["title_number"] = m.group(1)
+                struct["title_name"] = m.group(2)
+
+        if not struct["division"]:
+            m = DIVISION_LINE_RE.match(line)
+            if m: struct["division"] = f"{m.group(1)}. {m.group(2)}"
+
+        if not struct["chapter"]:
+            m = CHAPTER_LINE_RE.match(line)
+            if m: struct["chapter"] = f"{m.group(1)}. {m.group(2)}"
+
+        # 2. Fallback for Section Number (Crucial!)
+        # Looks for: "§ 123. Heading" OR "Section 123. Heading"
+        if not current_section_num:
+            sec_m = SECTION_SIGN_LINE_RE.match(line) or SECTION_WORD_LINE_RE.match(line)
+            if sec_m:
+                current_section_num = sec_m.group(1)
+                current_section_head = sec_m.group(2)
+
+    return struct, current_section_num, current_section_head
+
+
+def parse_page(html, url, retrieved_at=None, backend=None):
+    """
+    Turns one fetched section page into an output record (None if the page
+    has no regulation text).
+    """
+    page = load_page(html, backend)
+
+    # 1. GET CONTENT
+    markdown_text = page.content_text()
+    if markdown_text is None:
+        return None
+
+    # 2. GET BREADCRUMBS (Hierarchy)
+    hierarchy_data = {
+        "title_number": None, "title_name": None, "division": None,
+        "chapter": None, "subchapter": None, "article": None
+    }
+    for item in page.breadcrumbs():
+        m = BREADCRUMB_RE.match(item.strip())
+        if m:
+            t = m.group(1).lower()
+            if t == "title": hierarchy_data["title_number"], hierarchy_data["title_name"] = m.group(2), m.group(3)
+            elif t == "division": hierarchy_data["division"] = f"{m.group(2)}. {m.group(3)}"
+            elif t == "chapter": hierarchy_data["chapter"] = f"{m.group(2)}. {m.group(3)}"
+            elif t == "article": hierarchy_data["article"] = f"{m.group(2)}. {m.group(3)}"
+
+    # 3. GET METADATA (Title Tag, looked up once)
+    raw_title = page.page_title()
+    page_title = raw_title.split("|")[0].strip() if raw_title is not None else "Unknown"
+
+    # Try to find Section in Title Tag
+    sec_match = PAGE_TITLE_SECTION_RE.search(page_title)
+    section_number = sec_match.group(1) if sec_match else None
+    section_heading = sec_match.group(2) if sec_match else page_title
+
+    # 4. FALLBACK: Look inside the text if Breadcrumbs/Title failed
+    hierarchy_data, section_number, section_heading = parse_metadata_from_text(
+        markdown_text, hierarchy_data, section_number, section_heading
+    )
+
+    # 5. SAVE
+    return {
+        "citation": f"{hierarchy_data['title_number']} CCR § {section_number}" if section_number else page_title,
+        "source_url": url,
+        "retrieved_at": retrieved_at or datetime.utcnow().isoformat(),
+        **hierarchy_data, # Unpack hierarchy fields
+        "section_number": section_number,
+        "section_heading": section_heading,
+        "content_markdown": markdown_text
+    }
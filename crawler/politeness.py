@@ -0,0 +1,104 @@
+"""
+Per-host politeness limiter for the crawlers.
+
+Each host gets a token bucket (RATE requests/sec, BURST tokens). Workers call
+`await limiter.acquire(url)` before every fetch, so adding more concurrent
+browser pages never pushes a host past its budget. Failures halve the host's
+rate (down to MIN_RATE) and successes slowly restore it, so a struggling
+Westlaw server gets backed off automatically.
+"""
+import asyncio
+import time
+from urllib.parse import urlparse
+
+DEFAULT_RATE = 1.0   # requests per second per host
+DEFAULT_BURST = 2
+MIN_RATE = 0.05      # never slower than one request per 20s
+RECOVERY_FACTOR = 1.1
+
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        # The lock keeps waiters in FIFO order so no worker starves
+        async with self.lock:
+            self._refill()
+            if self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+                self._refill()
+            self.tokens -= 1
+
+
+class HostRateLimiter:
+    def __init__(self, rate=DEFAULT_RATE, burst=DEFAULT_BURST):
+        self.base_rate = rate
+        self.burst = burst
+        self.buckets = {}
+
+    def _bucket(self, url):
+        host = urlparse(url).netloc
+        if host not in self.buckets:
+            self.buckets[host] = TokenBucket(self.base_rate, self.burst)
+        return self.buckets[host]
+
+    async def acquire(self, url):
+        await self._bucket(url).acquire()
+
+    def record_success(self, url):
+        bucket = self._bucket(url)
+        bucket.rate = min(self.base_rate, bucket.rate * RECOVERY_FACTOR)
+
+    def record_failure(self, url):
+        bucket = self._bucket(url)
+        bucket.rate = max(MIN_RATE, bucket.rate / 2)
+        bucket.tokens = min(bucket.tokens, 0.0)  # Pause before the next request
+
+    def current_rate(self, url):
+        return self._bucket(url).rate
+
+
+class AdaptiveConcurrency:
+    """
+    AIMD window for in-flight fetches. Each completed fetch reports its latency
+    and outcome: a window's worth of fast successes grows it by one, an error
+    or a slow page halves it. Workers block in acquire() while the window is full, so N fetches
+    stay in flight without a slow page holding up a whole batch.
+    """
+
+    def __init__(self, initial=3, minimum=1, maximum=12, target_latency=8.0):
+        self.window = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.target_latency = target_latency
+        self.in_flight = 0
+        self.condition = asyncio.Condition()
+
+    @property
+    def limit(self):
+        return int(self.window)
+
+    async def acquire(self):
+        async with self.condition:
+            await self.condition.wait_for(lambda: self.in_flight < self.limit)
+            self.in_flight += 1
+
+    async def release(self, latency, ok):
+        """ok=None frees the slot without feedback (the fetch never started)."""
+        async with self.condition:
+            self.in_flight -= 1
+            if ok is not None and (not ok or latency > self.target_latency):
+                self.window = max(float(self.minimum), self.window / 2)
+            elif ok is not None:
+                self.window = min(float(self.maximum), self.window + 1.0 / self.window)
+            self.condition.notify_all()
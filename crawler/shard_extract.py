@@ -0,0 +1,233 @@
+"""
+Sharded section extraction: N worker processes, each with its own browser.
+
+extract_sections.py runs one browser on one event loop, so HTML parsing
+competes with fetching for a single core. This coordinator starts --workers
+processes that each run the same Extractor against the "extract" stage of the
+state store: a worker claims a batch of URLs under a lease (SHARD_LEASE
+seconds, renewed while the batch is in progress), and URLs of a worker that
+dies go back to the pool, immediately when the coordinator sees the process
+exit and otherwise when the lease runs out. A crashed worker is restarted up
+to MAX_RESTARTS times.
+
+The politeness budget is shared, not multiplied: each worker gets --rate / N
+requests per second per host and a 1/N slice of the adaptive window. More
+workers therefore help until the host's rate limit, not the parser or one
+browser, is the bottleneck.
+
+Each worker appends to its own file in data/extract_shards/. When the workers
+are done (or on Ctrl+C) merge_shards() appends their records to
+data/extracted_data.jsonl, one per URL, skipping records the output already
+holds, and then deletes the shard files. The output stays append-only, so the
+corpus store and the indexers' byte offsets resume as usual. Shards left by a
+killed coordinator are merged on the next run (or with --merge-only).
+
+Usage:
+    python crawler/shard_extract.py --workers 4 [--rate 2.0]
+    python crawler/shard_extract.py --merge-only
+"""
+import argparse
+import asyncio
+import glob
+import hashlib
+import json
+import multiprocessing
+import os
+import socket
+import sys
+import time
+from contextlib import nullcontext
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.jsonl_reader import JsonlReader
+from common.state_store import EXTRACT, MAX_ATTEMPTS, StateStore
+from common.tracing import flush as flush_traces
+from crawler.extract_sections import (CONCURRENCY, MAX_CONCURRENCY, OUTPUT_FILE, RATE, TARGET_LATENCY, Extractor,
+                                      record_writer, sync_corpus)
+from crawler.html_store import HtmlStore
+from crawler.parsing import BACKEND
+from crawler.politeness import AdaptiveConcurrency, HostRateLimiter
+
+# --- CONFIGURATION ---
+SHARD_DIR = "data/extract_shards"
+WORKERS = max(1, min(4, os.cpu_count() or 1))
+SHARD_LEASE = 120       # Seconds; renewed every SHARD_LEASE / 3 while a worker is alive
+SHARD_CLAIM_BATCH = 25  # URLs per claim; small batches keep every worker busy until the end
+MAX_RESTARTS = 3        # Replacement processes for workers that crash
+POLL_INTERVAL = 1.0     # Seconds between checks on the worker processes
+
+
+def shard_file(shard, shard_dir=SHARD_DIR):
+    return os.path.join(shard_dir, f"extracted-{shard}.jsonl")
+
+
+# --- WORKER (runs in its own process) ---
+async def extract_shard(shard, rate, concurrency, max_concurrency, crawler_factory=None, shard_dir=SHARD_DIR):
+    state = StateStore(migrate=False)
+    window = AdaptiveConcurrency(initial=concurrency, maximum=max_concurrency, target_latency=TARGET_LATENCY)
+    limiter = HostRateLimiter(rate=rate, burst=1)  # N workers' bursts add up; keep each to one request
+    records = asyncio.Queue()
+    writer = asyncio.create_task(record_writer(records, shard_file(shard, shard_dir), state))
+
+    extractor = None
+    try:
+        if not crawler_factory:
+            from crawl4ai import AsyncWebCrawler  # Only a real crawl needs the browser stack
+        async with nullcontext(crawler_factory()) if crawler_factory else AsyncWebCrawler(verbose=False) as crawler:
+            extractor = Extractor(crawler, window, limiter, records, HtmlStore(), state, lease=SHARD_LEASE,
+                                  claim_batch=SHARD_CLAIM_BATCH)
+            await extractor.run()
+    finally:
+        await records.put(None)
+        await writer
+        state.close()
+        if extractor is not None:
+            print(f"   🧩 Worker {shard} (pid {os.getpid()}): {extractor.done} saved, {extractor.failed} failed.")
+
+
+def run_worker(shard, rate, concurrency, max_concurrency, crawler_factory=None, shard_dir=SHARD_DIR):
+    try:
+        asyncio.run(extract_shard(shard, rate, concurrency, max_concurrency, crawler_factory, shard_dir))
+    finally:
+        flush_traces()  # Process children exit without running atexit hooks
+
+
+# --- MERGE ---
+def _content_hash(record):
+    return hashlib.sha1((record.get("content_markdown") or "").encode("utf-8")).hexdigest()
+
+
+def merge_shards(output_file=OUTPUT_FILE, shard_dir=SHARD_DIR):
+    """
+    Appends the shard files' records to output_file and deletes the shards.
+    One record per URL: when a lease ran out mid-fetch two workers may both
+    have saved it, and the newest retrieval wins. A record whose URL and text
+    the output already holds is skipped, so merging again after a crash
+    half-way through adds nothing twice. Returns the number appended.
+    """
+    shards = sorted(glob.glob(os.path.join(shard_dir, "*.jsonl")))
+    if not shards:
+        return 0
+
+    # Pass 1: which shard line holds the newest copy of each URL
+    newest = {}
+    for shard_number, path in enumerate(shards):
+        for line_number, record in enumerate(JsonlReader(path, required_keys=("source_url",))):
+            url = record["source_url"]
+            rank = (record.get("retrieved_at") or "", shard_number, line_number)
+            if url not in newest or rank > newest[url]:
+                newest[url] = rank
+
+    # What the output already holds, streamed and kept only for the shards' URLs
+    existing = {}
+    if os.path.exists(output_file):
+        for record in JsonlReader(output_file, required_keys=("source_url",)):
+            if record["source_url"] in newest:
+                existing[record["source_url"]] = _content_hash(record)
+
+    # Pass 2: append the winners in shard order
+    appended, duplicates = 0, 0
+    with open(output_file, "a+", encoding="utf-8") as out:
+        # A torn last line from an interrupted writer must not swallow the first merged record
+        if out.tell() > 0:
+            out.seek(out.tell() - 1)
+            if out.read(1) != "\n":
+                out.write("\n")
+        for shard_number, path in enumerate(shards):
+            for line_number, record in enumerate(JsonlReader(path, required_keys=("source_url",))):
+                url = record["source_url"]
+                if newest[url][1:] != (shard_number, line_number) or existing.get(url) == _content_hash(record):
+                    duplicates += 1
+                    continue
+                out.write(json.dumps(record) + "\n")
+                existing[url] = _content_hash(record)
+                appended += 1
+        out.flush()
+        os.fsync(out.fileno())
+
+    for path in shards:
+        os.remove(path)
+    print(f"🧵 Merged {len(shards)} shard files into {output_file}: {appended} records, {duplicates} duplicates dropped.")
+    return appended
+
+
+# --- COORDINATOR ---
+def extract_sharded(workers=WORKERS, rate=RATE, concurrency=CONCURRENCY, max_concurrency=MAX_CONCURRENCY,
+                    crawler_factory=None, output_file=OUTPUT_FILE, shard_dir=SHARD_DIR):
+    """crawler_factory: picklable callable returning an object with AsyncWebCrawler's arun() (bench/ fixtures)."""
+    os.makedirs(shard_dir, exist_ok=True)
+    merge_shards(output_file, shard_dir)  # Leftovers of an interrupted run
+
+    state = StateStore()
+    state.retry_failed(EXTRACT, max_attempts=MAX_ATTEMPTS)
+    counts = state.counts(EXTRACT).get(EXTRACT, {})
+    if not counts:
+        print("❌ Error: no discovered sections in the state store. Run crawler/discover_all_urls.py first.")
+        state.close()
+        return
+    if counts.get("done"):
+        print(f"🔄 Resuming... {counts['done']} valid records already extracted.")
+
+    # Split the politeness budget so N workers fetch no faster than one extractor would
+    worker_rate = rate / workers
+    worker_max = max(1, max_concurrency // workers)
+    worker_initial = max(1, min(concurrency // workers, worker_max))
+    total = counts.get("pending", 0)  # Includes the failures retry_failed() just re-queued
+    print(f"🚀 Starting Extraction for {total} URLs with {workers} worker processes "
+          f"({worker_rate:.2f} req/s and window {worker_initial}-{worker_max} each, parser: {BACKEND})...")
+
+    context = multiprocessing.get_context("spawn")  # No inherited event loop, SQLite handle or browser
+    host = socket.gethostname()
+    started = time.perf_counter()
+
+    def start(shard):
+        process = context.Process(target=run_worker, name=f"extract-{shard}",
+                                  args=(shard, worker_rate, worker_initial, worker_max, crawler_factory, shard_dir))
+        process.start()
+        return process
+
+    processes = {shard: start(shard) for shard in range(workers)}
+    restarts = 0
+    try:
+        while processes:
+            time.sleep(POLL_INTERVAL)
+            for shard, process in list(processes.items()):
+                if process.is_alive():
+                    continue
+                del processes[shard]
+                if process.exitcode == 0:
+                    continue
+                released = state.release(EXTRACT, f"{host}:{process.pid}:")
+                print(f"   💥 Worker {shard} exited with code {process.exitcode}; {released} claimed URLs released.")
+                if restarts < MAX_RESTARTS:
+                    restarts += 1
+                    processes[shard] = start(shard)
+    finally:
+        for process in processes.values():
+            process.terminate()
+        for process in processes.values():
+            process.join()
+            state.release(EXTRACT, f"{host}:{process.pid}:")
+        counts = state.counts(EXTRACT).get(EXTRACT, {})
+        state.close()
+        merge_shards(output_file, shard_dir)
+
+    elapsed = time.perf_counter() - started
+    print(f"✅ Extraction Complete! {counts.get('done', 0)} extracted, {counts.get('failed', 0)} failed, "
+          f"{counts.get('pending', 0) + counts.get('claimed', 0)} left, in {elapsed:.1f}s.")
+    sync_corpus()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Extract section text with several browser processes.")
+    parser.add_argument("--workers", type=int, default=WORKERS, help="Worker processes, one browser each")
+    parser.add_argument("--rate", type=float, default=RATE, help="Requests per second per host, shared by all workers")
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY, help="Initial fetches in flight, all workers")
+    parser.add_argument("--max-concurrency", type=int, default=MAX_CONCURRENCY,
+                        help="Upper bound for the adaptive window, all workers")
+    parser.add_argument("--merge-only", action="store_true", help="Only fold leftover shard files into the output")
+    args = parser.parse_args()
+    if args.merge_only:
+        merge_shards()
+        sync_corpus()
+    else:
+        extract_sharded(max(1, args.workers), args.rate, args.concurrency, args.max_concurrency)
@@ -0,0 +1,204 @@
+"""
+Structure-aware chunking of extracted CCR sections.
+
+The extractor joins text nodes with blank lines (get_text(separator="\\n\\n")),
+so every subsection marker and every History / Authority / Reference block
+starts its own paragraph. We split there instead of embedding a whole section:
+
+- "(a)", "(b)", ... (top-level subsections) always start a new chunk
+- "(1)" / "(A)" / "(i)" (nested) start a new chunk only when the current one is
+  full; the parent's lead-in line is repeated so the chunk still reads on its own
+- "(i)", "(v)", "(x)" are read as letters only when they follow the previous
+  top-level marker ("(i)" right after "(h)"); otherwise they are roman numerals
+- History / Credits / Note: Authority cited / Reference get their own chunk
+- Westlaw footer boilerplate ("End of Document", currentness notes) is dropped
+
+Chunk ids are stable across runs: "<source_url>#chunk-<n>".
+"""
+import re
+
+STRATEGIES = ("structure", "section")
+DEFAULT_STRATEGY = "structure"
+
+MAX_CHUNK_CHARS = 1500
+MIN_CHUNK_CHARS = 200
+MAX_LEAD_IN_CHARS = 300
+
+TOP_LEVEL_RE = re.compile(r"^\([a-z]{1,2}\)")
+NESTED_RE = re.compile(r"^\((?:\d{1,3}|[A-Z]{1,2})\)")
+ROMAN_RE = re.compile(r"^\([ivx]+\)")
+CAPITAL_RE = re.compile(r"^\([A-Z]{1,2}\)")
+BLOCK_RE = re.compile(r"^(History|Credits|Note:|Authority cited|Reference:?)\b", re.IGNORECASE)
+BOILERPLATE_RE = re.compile(
+    r"^(End of Document|Currentness|This database is current through|Cal\. Admin\. Code tit\.)",
+    re.IGNORECASE
+)
+
+
+def chunk_id(source_url, n):
+    return f"{source_url}#chunk-{n}"
+
+
+def parent_id(chunk_or_id):
+    """Source URL of a chunk id (whole-section ids are returned unchanged)."""
+    return chunk_or_id.split("#chunk-")[0]
+
+
+def _split_long(paragraph, max_chars):
+    # Last resort for a single paragraph longer than a chunk: cut on whitespace
+    pieces = []
+    while len(paragraph) > max_chars:
+        cut = paragraph.rfind(" ", 0, max_chars)
+        if cut <= 0:
+            cut = max_chars
+        pieces.append(paragraph[:cut].strip())
+        paragraph = paragraph[cut:].strip()
+    if paragraph:
+        pieces.append(paragraph)
+    return pieces
+
+
+def next_marker(marker):
+    """"(h)" -> "(i)", "(z)" -> "(aa)", "(aa)" -> "(bb)"; "" (no marker yet) -> "(a)"."""
+    letters = marker.strip("()")
+    if not letters:
+        return "(a)"
+    if letters[-1] == "z":
+        return "(" + "a" * (len(letters) + 1) + ")"
+    return "(" + chr(ord(letters[-1]) + 1) * len(letters) + ")"
+
+
+def top_level_marker(para, previous="", last_marker=""):
+    """
+    The paragraph's top-level marker ("(c)"), or None. previous is the last
+    top-level marker and last_marker the last marker of any level: "(i)" is
+    subsection (i) only right after "(h)", and not under an "(A)" item, where
+    it is the first roman numeral.
+    """
+    m = TOP_LEVEL_RE.match(para)
+    if not m:
+        return None
+    marker = m.group(0)
+    if ROMAN_RE.match(marker) and (marker != next_marker(previous) or CAPITAL_RE.match(last_marker)):
+        return None
+    return marker
+
+
+def split_paragraphs(markdown_text, max_chars=MAX_CHUNK_CHARS):
+    """
+    Groups paragraphs into (label, text) pieces, where label is the
+    top-level subsection ("(a)"), "history", or "" for the preamble.
+    """
+    pieces = []
+    current = []
+    current_len = 0
+    label = ""
+    lead_in = None
+    in_block = False
+    top = ""          # Last top-level marker, to tell "(i)" the letter from (i) the numeral
+    last_marker = ""
+
+    def flush():
+        nonlocal current, current_len
+        if current:
+            pieces.append((label, "\n\n".join(current)))
+        current, current_len = [], 0
+
+    for para in markdown_text.split("\n\n"):
+        para = para.strip()
+        if not para or BOILERPLATE_RE.match(para):
+            continue
+
+        marker = None if in_block else top_level_marker(para, top, last_marker)
+        if BLOCK_RE.match(para):
+            # History / Authority / Reference trail the section; keep them together
+            if not in_block:
+                flush()
+                label, lead_in, in_block = "history", None, True
+        elif marker:
+            if current_len >= MIN_CHUNK_CHARS or label:
+                flush()
+            label = top = marker
+            lead_in = para if len(para) <= MAX_LEAD_IN_CHARS else None
+        elif current_len >= MIN_CHUNK_CHARS and current_len + len(para) > max_chars:
+            flush()
+            nested = NESTED_RE.match(para) or ROMAN_RE.match(para)
+            if not in_block and lead_in and nested and len(lead_in) + len(para) <= max_chars:
+                current, current_len = [lead_in], len(lead_in)
+
+        any_marker = TOP_LEVEL_RE.match(para) or NESTED_RE.match(para)
+        if any_marker:
+            last_marker = any_marker.group(0)
+
+        for piece in _split_long(para, max_chars):
+            # Tiny headers ("History", a short lead-in) ride along with the next piece
+            if current_len >= MIN_CHUNK_CHARS and current_len + len(piece) > max_chars:
+                flush()
+            current.append(piece)
+            current_len += len(piece)
+
+    flush()
+    return pieces
+
+
+def chunk_record(record, strategy=DEFAULT_STRATEGY, max_chars=MAX_CHUNK_CHARS):
+    """
+    Returns a list of chunk dicts for one extracted record. Every chunk carries
+    its parent's citation/hierarchy so it can be cited without the full section.
+    """
+    if strategy not in STRATEGIES:
+        raise ValueError(f"Unknown chunking strategy {strategy!r} (expected one of {STRATEGIES})")
+
+    text = record.get("content_markdown") or ""
+    source_url = record["source_url"]
+    base = {
+        "parent_id": source_url,
+        "citation": str(record.get("citation", "Unknown")),
+        "section_heading": record.get("section_heading") or "",
+        "title_number": str(record.get("title_number") or ""),
+        "division": str(record.get("division") or ""),
+        "chapter": str(record.get("chapter") or ""),
+        "article": str(record.get("article") or ""),
+        "section_number": str(record.get("section_number") or ""),
+    }
+
+    if strategy == "section":
+        # Legacy behaviour: one vector per section, id is the URL itself
+        return [{**base, "id": source_url, "chunk_index": 0, "subsection": "", "text": text}]
+
+    return [
+        {**base, "id": chunk_id(source_url, n), "chunk_index": n, "subsection": label, "text": piece}
+        for n, (label, piece) in enumerate(split_paragraphs(text, max_chars))
+    ]
+
+
+def embedding_text(chunk):
+    return f"{chunk['citation']}: {chunk['text']}"
+
+
+def hierarchy_number(value):
+    """"3. Air Resources Board" -> "3": the part of a division/chapter/article a query can name."""
+    parts = str(value or "").split()
+    return parts[0].rstrip(".") if parts else ""
+
+
+def hierarchy_metadata(record):
+    """Exact-match hierarchy fields for metadata filters (see agent/hierarchy.py)."""
+    return {
+        "title_number": str(record.get("title_number") or ""),
+        "division_number": hierarchy_number(record.get("division")),
+        "chapter_number": hierarchy_number(record.get("chapter")),
+        "article_number": hierarchy_number(record.get("article")),
+    }
+
+
+def vector_metadata(record, chunk):
+    """Metadata stored alongside each vector by reset_db.py and refresh.py."""
+    return {
+        "source": record.get("source_url", ""),
+        "citation": record.get("citation", ""),
+        "heading": record.get("section_heading", ""),
+        "subsection": chunk["subsection"],
+        "chunk_index": chunk["chunk_index"],
+        **hierarchy_metadata(record)
+    }
@@ -0,0 +1,121 @@
+"""
+Embedding model helpers shared by the indexers and the agent.
+
+Both indexers write vectors with different models (MiniLM in index_data.py,
+text-embedding-004 in reset_db.py), so anything that reads an index back has to
+embed queries with the same model. get_embeddings() returns an object with the
+LangChain interface (embed_documents / embed_query) for either one; Google
+embedders come wrapped in RateLimitedEmbeddings so every caller shares the
+EMBEDDING_RPM / EMBEDDING_TPM quota (see common/rate_limit.py).
+"""
+from common.rate_limit import estimate_tokens, get_limiter
+from common.tracing import span
+
+GOOGLE_MODEL = "models/text-embedding-004"
+MINILM_MODEL = "all-MiniLM-L6-v2"
+GOOGLE_BATCH_LIMIT = 100  # Texts per batchEmbedContents request
+
+MODEL_DIMENSIONS = {
+    GOOGLE_MODEL: 768,
+    MINILM_MODEL: 384,
+}
+
+
+class SentenceTransformerEmbeddings:
+    """
+    Wraps a local SentenceTransformer so it looks like a LangChain embedder.
+    The model (and torch) load on the first encode, not at construction, so a
+    run whose embeddings all come from the cache never pays for them. The
+    warm bundle's saved copy is used when present (common/warm_bundle.py).
+    """
+
+    def __init__(self, model_name=MINILM_MODEL, model=None, batch_size=32, pool=None, workers=1):
+        self.model_name = model_name
+        self._model = model
+        self.batch_size = batch_size
+        self.pool = pool  # From model.start_multi_process_pool(); started on first use when workers > 1
+        self.workers = workers
+
+    @property
+    def model(self):
+        if self._model is None:
+            from sentence_transformers import SentenceTransformer
+            from common.warm_bundle import model_dir
+            with span("embedding.load_model", model=self.model_name):
+                self._model = SentenceTransformer(model_dir(self.model_name) or self.model_name)
+        return self._model
+
+    def stop_pool(self):
+        if self.pool is not None:
+            self.model.stop_multi_process_pool(self.pool)
+            self.pool = None
+
+    def embed_documents(self, texts):
+        texts = list(texts)
+        if not texts:
+            return []
+        if self.pool is None and self.workers > 1:
+            print(f"🧵 Starting {self.workers} encode worker processes...")
+            self.pool = self.model.start_multi_process_pool(target_devices=["cpu"] * self.workers)
+        with span("embedding.encode", texts=len(texts), pool=self.pool is not None):
+            if self.pool is not None:
+                return self.model.encode_multi_process(texts, self.pool, batch_size=self.batch_size).tolist()
+            return self.model.encode(texts, batch_size=self.batch_size).tolist()
+
+    def embed_query(self, text):
+        with span("embedding.encode", texts=1, pool=False):
+            return self.model.encode(text).tolist()
+
+    def embed_queries(self, texts):
+        # MiniLM embeds queries and documents the same way
+        return self.embed_documents(texts)
+
+
+class RateLimitedEmbeddings:
+    """
+    Google embedder behind the shared embedding quota. Batches are split at
+    GOOGLE_BATCH_LIMIT so each limiter reservation is exactly one API request,
+    and 429s / transient errors are retried with backoff instead of failing
+    the caller's batch.
+    """
+
+    def __init__(self, embeddings, limiter=None):
+        self.embeddings = embeddings
+        self.limiter = limiter or get_limiter("embedding")
+
+    def _embed(self, texts, **kwargs):
+        texts = list(texts)
+        vectors = []
+        for start in range(0, len(texts), GOOGLE_BATCH_LIMIT):
+            batch = texts[start:start + GOOGLE_BATCH_LIMIT]
+            tokens = sum(estimate_tokens(t) for t in batch)
+            vectors.extend(self.limiter.call(self.embeddings.embed_documents, batch, tokens=tokens, **kwargs))
+        return vectors
+
+    def embed_documents(self, texts):
+        return self._embed(texts)
+
+    def embed_query(self, text):
+        return self.limiter.call(self.embeddings.embed_query, text, tokens=estimate_tokens(text))
+
+    def embed_queries(self, texts):
+        return self._embed(texts, task_type="RETRIEVAL_QUERY")
+
+
+def embed_queries(embeddings, texts):
+    """
+    Several queries in one call. Google needs the query task type spelled out
+    on embed_documents; anything else falls back to one call per query.
+    """
+    if hasattr(embeddings, "embed_queries"):
+        return embeddings.embed_queries(texts)
+    if type(embeddings).__name__ == "GoogleGenerativeAIEmbeddings":
+        return embeddings.embed_documents(texts, task_type="RETRIEVAL_QUERY")
+    return [embeddings.embed_query(t) for t in texts]
+
+
+def get_embeddings(model_name):
+    if model_name.startswith("models/"):
+        from langchain_google_genai import GoogleGenerativeAIEmbeddings
+        return RateLimitedEmbeddings(GoogleGenerativeAIEmbeddings(model=model_name))
+    return SentenceTransformerEmbeddings(model_name)
@@ -0,0 +1,131 @@
+"""
+Persistent embedding cache keyed by (model, hash of the embedded text).
+
+Re-running reset_db.py or index_data.py after an index/schema change used to
+re-embed all ~5,300 sections through the API. With the cache, only texts whose
+content actually changed are sent to the model; everything else is read back
+from one local SQLite file (32-byte sha256 key + float32 blob per vector).
+
+CachedEmbeddings wraps any LangChain-style embedder (embed_documents /
+embed_query), so it can be handed to PineconeVectorStore.from_documents as is.
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+
+import numpy as np
+
+from common.tracing import count
+from indexer.embedders import embed_queries
+
+EMBEDDING_CACHE_FILE = "data/embedding_cache.sqlite"
+LOOKUP_CHUNK = 500  # Stay well under SQLite's bound-parameter limit
+
+
+def cache_key(model, text):
+    return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).digest()
+
+
+class EmbeddingCache:
+    def __init__(self, path=EMBEDDING_CACHE_FILE):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # Shared by the agent server's worker threads; the lock serializes access
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (key BLOB PRIMARY KEY, model TEXT, vector BLOB) WITHOUT ROWID"
+        )
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, model, texts):
+        """Returns a list parallel to texts with a vector (list of floats) or None."""
+        keys = [cache_key(model, t) for t in texts]
+        found = {}
+        for start in range(0, len(keys), LOOKUP_CHUNK):
+            chunk = keys[start:start + LOOKUP_CHUNK]
+            placeholders = ",".join("?" * len(chunk))
+            with self.lock:
+                rows = self.conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", chunk
+                ).fetchall()
+            for key, blob in rows:
+                found[key] = np.frombuffer(blob, dtype=np.float32).tolist()
+
+        results = [found.get(k) for k in keys]
+        hits = sum(r is not None for r in results)
+        with self.lock:
+            self.hits += hits
+            self.misses += len(results) - hits
+        count("embedding_cache_lookups_total", hits, result="hit")
+        count("embedding_cache_lookups_total", len(results) - hits, result="miss")
+        return results
+
+    def put_many(self, model, texts, vectors):
+        rows = [
+            (cache_key(model, t), model, np.asarray(v, dtype=np.float32).tobytes())
+            for t, v in zip(texts, vectors)
+        ]
+        with self.lock:
+            self.conn.executemany("INSERT OR REPLACE INTO embeddings (key, model, vector) VALUES (?, ?, ?)", rows)
+            self.conn.commit()
+
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def close(self):
+        self.conn.close()
+
+
+class CachedEmbeddings:
+    """
+    Cache-through wrapper. Documents and queries are cached under different keys
+    because Google embeds them with different task types.
+    """
+
+    def __init__(self, embeddings, model_name, cache=None):
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.cache = cache or EmbeddingCache()
+        self.api_calls = 0
+
+    def embed_documents(self, texts):
+        texts = list(texts)
+        vectors = self.cache.get_many(self.model_name, texts)
+        missing = [i for i, v in enumerate(vectors) if v is None]
+        if missing:
+            self.api_calls += 1
+            fresh = self.embeddings.embed_documents([texts[i] for i in missing])
+            self.cache.put_many(self.model_name, [texts[i] for i in missing], fresh)
+            for i, v in zip(missing, fresh):
+                vectors[i] = list(v)
+        return vectors
+
+    def embed_query(self, text):
+        model = f"{self.model_name}#query"
+        vector = self.cache.get_many(model, [text])[0]
+        if vector is None:
+            self.api_calls += 1
+            vector = self.embeddings.embed_query(text)
+            self.cache.put_many(model, [text], [vector])
+        return vector
+
+    def embed_queries(self, texts):
+        """
+        Batch of queries in one API call, cached under the same keys as
+        embed_query(), so a later vector search for any of them is a cache hit.
+        """
+        texts = list(texts)
+        model = f"{self.model_name}#query"
+        vectors = self.cache.get_many(model, texts)
+        missing = [i for i, v in enumerate(vectors) if v is None]
+        if missing:
+            self.api_calls += 1
+            fresh = embed_queries(self.embeddings, [texts[i] for i in missing])
+            self.cache.put_many(model, [texts[i] for i in missing], fresh)
+            for i, v in zip(missing, fresh):
+                vectors[i] = list(v)
+        return vectors
@@ -1,9 +1,20 @@
-import json
+import argparse
 import os
+import queue
+import sys
+import threading
 import time
 from dotenv import load_dotenv
-from pinecone import Pinecone, ServerlessSpec
-from sentence_transformers import SentenceTransformer
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.corpus_store import CorpusStore
+from common.jsonl_reader import JsonlReader
+from common.state_store import StateStore, index_stage
+from common.tracing import span
+from indexer.chunking import DEFAULT_STRATEGY, STRATEGIES, chunk_record, embedding_text, hierarchy_metadata
+from indexer.embedders import MINILM_MODEL, MODEL_DIMENSIONS, SentenceTransformerEmbeddings
+from indexer.embedding_cache import EMBEDDING_CACHE_FILE, CachedEmbeddings, EmbeddingCache
+from indexer.local_index import LOCAL_INDEX_DIR, QUANTIZATIONS, LocalVectorIndex
 
 # --- CONFIGURATION ---
 # 1. Load Secrets from .env file
@@ -11,20 +22,170 @@ load_dotenv()
 
 PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
 
-# 2. Validate Keys
-if not PINECONE_API_KEY:
-    raise ValueError("❌ PINECONE_API_KEY not found! Please check your .env file.")
-
-# 3. Settings
+# 2. Settings
 INDEX_NAME = "ccr-regulations"
 INPUT_FILE = "data/extracted_data.jsonl"
-CHECKPOINT_FILE = "data/indexed_ids.txt"
-BATCH_SIZE = 50
+BATCH_SIZE = 50          # Vectors per upsert request
+ENCODE_BATCH_SIZE = 256  # Chunks per SentenceTransformer.encode call
+UPLOAD_QUEUE_SIZE = 4
 
-def main():
-    print("🚀 Starting Indexing Pipeline...")
+class Uploader:
+    """
+    Background upsert thread. A bounded queue keeps at most UPLOAD_QUEUE_SIZE
+    batches in flight, so a slow network applies back-pressure to encoding
+    instead of buffering the whole corpus in memory.
+    """
+
+    def __init__(self, index, state, stage, start_offset=0):
+        self.index = index
+        self.state = state
+        self.stage = stage
+        self.queue = queue.Queue(maxsize=UPLOAD_QUEUE_SIZE)
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.uploaded = 0
+        self.failed = 0
+        # Input byte offset up to which every record is safely uploaded
+        self.resume_offset = start_offset
+
+    def start(self):
+        self.thread.start()
+
+    def submit(self, batch_vectors, batch_ids, end_offset):
+        self.queue.put((batch_vectors, batch_ids, end_offset))
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            batch_vectors, batch_ids, end_offset = item
+            try:
+                with span("index.upsert", vectors=len(batch_vectors)):
+                    self.index.upsert(vectors=batch_vectors)
+
+                # Update Checkpoint (committed with the state store's next batch)
+                self.state.mark(self.stage, batch_ids)
+                self.uploaded += len(batch_vectors)
+                if not self.failed:
+                    self.resume_offset = end_offset
+            except Exception as e:
+                # Not marked done, so these sections are retried on the next run
+                self.state.mark(self.stage, batch_ids, "failed", error=str(e)[:200])
+                self.failed += 1
+                print(f"   ⚠️ Upload Error: {e}")
+
+def chunk_metadata(record, chunk, include_text=True):
+    # Create Metadata (For filtering). Without text the agent reads it from the
+    # corpus store; the empty key keeps langchain_pinecone from skipping the match.
+    return {
+        "citation": chunk["citation"],
+        "title_number": chunk["title_number"],
+        "division": chunk["division"],
+        "chapter": chunk["chapter"],
+        "section_number": chunk["section_number"],
+        "section_heading": chunk["section_heading"],
+        "subsection": chunk["subsection"],
+        "chunk_index": chunk["chunk_index"],
+        **hierarchy_metadata(record),
+        "url": record["source_url"],
+        "text": chunk["text"][:20000] if include_text else ""  # Limit size
+    }
+
+def index_records(reader, embedder, uploader, chunking=DEFAULT_STRATEGY, batch_size=ENCODE_BATCH_SIZE,
+                  skip_urls=(), include_text=True):
+    """
+    Chunks, embeds and hands records to the uploader, pooling chunks across
+    records so every encode call gets a full batch. Returns docs, chunks,
+    encode_seconds and seconds (wall clock).
+    """
+    stats = {"docs": 0, "chunks": 0, "encode_seconds": 0.0}
+    started = time.perf_counter()
+    pending = []  # (record, chunks, end offset) waiting to be encoded together
+
+    def flush_pending():
+        texts = [embedding_text(chunk) for _, chunks, _ in pending for chunk in chunks]
+        t0 = time.perf_counter()
+        with span("index.encode", docs=len(pending), chunks=len(texts)):
+            embeddings = iter(embedder.embed_documents(texts))
+        stats["encode_seconds"] += time.perf_counter() - t0
+
+        batch_vectors, batch_ids = [], []
+        for record, chunks, end_offset in pending:
+            for chunk in chunks:
+                batch_vectors.append({
+                    "id": chunk["id"],
+                    "values": next(embeddings),
+                    "metadata": chunk_metadata(record, chunk, include_text=include_text)
+                })
+            # Checkpoint by section: all of a record's chunks go up in the same batch
+            batch_ids.append(record["source_url"])
+            if len(batch_vectors) >= BATCH_SIZE:
+                # Blocks while the upload queue is full, so this span shows upsert backpressure
+                with span("index.submit_wait"):
+                    uploader.submit(batch_vectors, batch_ids, end_offset)
+                batch_vectors, batch_ids = [], []
+        if batch_vectors:
+            with span("index.submit_wait"):
+                uploader.submit(batch_vectors, batch_ids, end_offset)
+
+        stats["docs"] += len(pending)
+        stats["chunks"] += len(texts)
+        elapsed = time.perf_counter() - started
+        print(f"   ⚙️  {stats['docs']} docs / {stats['chunks']} chunks encoded "
+              f"({stats['docs'] / elapsed:.1f} docs/sec, upload queue: {uploader.queue.qsize()})")
+        pending.clear()
+
+    pending_chunks = 0
+    for record in reader:
+        # Skip if empty or already indexed
+        if not record.get("content_markdown") or record["source_url"] in skip_urls:
+            continue
+
+        chunks = chunk_record(record, strategy=chunking)
+        pending.append((record, chunks, reader.offset))
+        pending_chunks += len(chunks)
+
+        if pending_chunks >= batch_size:
+            flush_pending()
+            pending_chunks = 0
+
+    if pending:
+        flush_pending()
+    stats["seconds"] = time.perf_counter() - started
+    return stats
 
-    # 1. Initialize Pinecone
+def check_model(name, model, dimension):
+    # Upserting MiniLM vectors into an index built with another model fails on every batch
+    # (or, at the same width, silently mixes two embedding spaces), so refuse up front
+    if (model and model != MINILM_MODEL) or dimension != MODEL_DIMENSIONS[MINILM_MODEL]:
+        raise ValueError(f"❌ {name} holds {model or 'unknown-model'} vectors ({dimension} dims), but this script "
+                         f"embeds with {MINILM_MODEL} ({MODEL_DIMENSIONS[MINILM_MODEL]} dims). Keep that index "
+                         f"up to date with reset_db.py / refresh.py, or delete it to rebuild it here.")
+
+def open_index(backend, dtype, quantization=None):
+    if backend == "local":
+        if LocalVectorIndex.exists(LOCAL_INDEX_DIR):
+            index = LocalVectorIndex(LOCAL_INDEX_DIR)
+            check_model(LOCAL_INDEX_DIR, index.model, index.dimension)
+            if quantization and quantization != index.quantization:
+                print(f"🗜️  Re-quantizing {LOCAL_INDEX_DIR}: {index.quantization} -> {quantization}...")
+                index.quantize(quantization)
+        else:
+            quantization = quantization or "none"
+            print(f"Creating new local index: {LOCAL_INDEX_DIR} ({dtype}, quantization: {quantization})...")
+            index = LocalVectorIndex.create(LOCAL_INDEX_DIR, dimension=MODEL_DIMENSIONS[MINILM_MODEL],
+                                            model=MINILM_MODEL, dtype=dtype, quantization=quantization)
+        return index
+
+    # Validate Keys (only the Pinecone backend needs them)
+    if not PINECONE_API_KEY:
+        raise ValueError("❌ PINECONE_API_KEY not found! Please check your .env file.")
+
+    from pinecone import Pinecone, ServerlessSpec
     pc = Pinecone(api_key=PINECONE_API_KEY)
 
     # Create Index if it doesn't exist
@@ -37,83 +198,93 @@ def main():
             metric="cosine",
             spec=ServerlessSpec(cloud="aws", region="us-east-1")
         )
-    
-    index = pc.Index(INDEX_NAME)
+    else:
+        # reset_db.py builds this index with 768-dim Google embeddings
+        check_model(INDEX_NAME, None, pc.describe_index(INDEX_NAME).dimension)
+
+    return pc.Index(INDEX_NAME)
 
-    # 2. Load Embedding Model (Runs locally, Free)
-    print("📥 Loading AI Model (all-MiniLM-L6-v2)...")
-    model = SentenceTransformer('all-MiniLM-L6-v2')
+def main():
+    parser = argparse.ArgumentParser(description="Embed extracted sections and upload them to a vector index.")
+    parser.add_argument("--backend", choices=["pinecone", "local"], default="pinecone",
+                        help="pinecone (default) or a local memory-mapped index under data/local_index")
+    parser.add_argument("--dtype", choices=["float32", "float16"], default="float32",
+                        help="Storage type for a new local index")
+    parser.add_argument("--quantization", choices=QUANTIZATIONS, default=None,
+                        help="Local index: int8 or binary codes for the first-pass scan, rescored with full "
+                             "precision (default: none for a new index, unchanged for an existing one)")
+    parser.add_argument("--chunking", choices=STRATEGIES, default=DEFAULT_STRATEGY,
+                        help="structure (default): split on (a)/(1)/(A) and History blocks; section: one vector per section")
+    parser.add_argument("--no-cache", action="store_true",
+                        help=f"Always re-encode instead of reusing vectors from {EMBEDDING_CACHE_FILE}")
+    parser.add_argument("--batch-size", type=int, default=ENCODE_BATCH_SIZE,
+                        help=f"Chunks per encode call (default {ENCODE_BATCH_SIZE})")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Encode with a pool of N processes (use the core count on big boxes)")
+    parser.add_argument("--start-offset", type=int, default=0,
+                        help="Byte offset into the input file to resume from (printed at the end of a run)")
+    parser.add_argument("--text-in-store", action="store_true",
+                        help="Leave text out of vector metadata; the agent hydrates it from the corpus store")
+    args = parser.parse_args()
+
+    print(f"🚀 Starting Indexing Pipeline ({args.backend}, chunking: {args.chunking})...")
+
+    # 1. Initialize Vector Index
+    fresh_local = args.backend == "local" and not LocalVectorIndex.exists(LOCAL_INDEX_DIR)
+    index = open_index(args.backend, args.dtype, args.quantization)
+    # Whole-section and chunked vectors use different ids, so each strategy
+    # is its own stage in the state store
+    state = StateStore()
+    stage = index_stage(args.backend, args.chunking)
+    if fresh_local:
+        state.reset(index_stage("local", "*"))  # Progress of a deleted local index no longer applies
+
+    # 2. Embedding Model (Runs locally, Free). It loads on the first cache miss, from the warm bundle
+    # when one is built, so a re-run whose chunks are all cached never imports torch
+    encoder = SentenceTransformerEmbeddings(MINILM_MODEL, batch_size=args.batch_size, workers=args.workers)
+    embedder = encoder
+    if not args.no_cache:
+        embedder = CachedEmbeddings(encoder, MINILM_MODEL, EmbeddingCache(EMBEDDING_CACHE_FILE))
 
     # 3. Load Checkpoint (Resume logic)
-    indexed_ids = set()
-    if os.path.exists(CHECKPOINT_FILE):
-        with open(CHECKPOINT_FILE, "r") as f:
-            for line in f:
-                indexed_ids.add(line.strip())
+    indexed_ids = state.keys(stage, "done")
     print(f"🔄 Resuming... {len(indexed_ids)} items already in database.")
 
     # 4. Process Data
-    batch_vectors = []
-    batch_ids = []
-    
     if not os.path.exists(INPUT_FILE):
         print(f"❌ Error: {INPUT_FILE} not found. Run the extractor first.")
         return
 
-    with open(INPUT_FILE, "r", encoding="utf-8") as f:
-        lines = f.readlines()
+    if args.text_in_store:
+        store = CorpusStore()
+        print(f"📦 Corpus store: {store.sync(INPUT_FILE)} new records ingested ({len(store)} sections)")
+        store.close()
 
-    print(f"📄 Processing {len(lines)} documents...")
+    # Stream records one at a time; nothing holds the whole corpus in memory
+    reader = JsonlReader(INPUT_FILE, start_offset=args.start_offset, required_keys=("source_url",))
+    print(f"📄 Streaming documents from byte {args.start_offset} (encode batch: {args.batch_size})...")
 
-    for i, line in enumerate(lines):
-        try:
-            record = json.loads(line)
-        except:
-            continue
-
-        # Skip if empty or already indexed
-        if not record.get("content_markdown") or record["source_url"] in indexed_ids:
-            continue
+    # Uploads run on a background thread so encoding never waits on the network
+    uploader = Uploader(index, state, stage, start_offset=args.start_offset)
+    uploader.start()
 
-        # Create Metadata (For filtering)
-        metadata = {
-            "citation": str(record.get("citation", "Unknown")),
-            "title_number": str(record.get("title_number", "")),
-            "chapter": str(record.get("chapter", "")),
-            "section_number": str(record.get("section_number", "")),
-            "url": record["source_url"],
-            "text": record["content_markdown"][:20000] # Limit size
-        }
-
-        # Create Embedding
-        text_to_embed = f"{record['citation']}: {record['content_markdown']}"
-        embedding = model.encode(text_to_embed).tolist()
-
-        # Add to Batch
-        batch_vectors.append({
-            "id": record["source_url"], 
-            "values": embedding,
-            "metadata": metadata
-        })
-        batch_ids.append(record["source_url"])
-
-        # Upload Batch
-        if len(batch_vectors) >= BATCH_SIZE or i == len(lines) - 1:
-            if batch_vectors:
-                try:
-                    print(f"   📤 Uploading batch {i}...")
-                    index.upsert(vectors=batch_vectors)
-                    
-                    # Update Checkpoint
-                    with open(CHECKPOINT_FILE, "a") as cf:
-                        for vid in batch_ids:
-                            cf.write(vid + "\n")
-                    
-                    batch_vectors = []
-                    batch_ids = []
-                except Exception as e:
-                    print(f"   ⚠️ Upload Error: {e}")
+    started = time.perf_counter()
+    try:
+        stats = index_records(reader, embedder, uploader, args.chunking, args.batch_size,
+                              skip_urls=indexed_ids, include_text=not args.text_in_store)
+    finally:
+        uploader.close()
+        state.close()
+        encoder.stop_pool()
+        print(f"📑 Input: {reader.summary()}. Resume with --start-offset {uploader.resume_offset}")
 
+    elapsed = time.perf_counter() - started
+    print(f"📊 {stats['docs']} docs ({stats['chunks']} chunks) in {elapsed:.1f}s: "
+          f"{stats['docs'] / elapsed if elapsed else 0:.1f} docs/sec overall, "
+          f"{stats['chunks'] / stats['encode_seconds'] if stats['encode_seconds'] else 0:.1f} chunks/sec while encoding, "
+          f"{uploader.failed} failed upload batches")
+    if not args.no_cache:
+        print(f"💾 Embedding cache hit rate: {embedder.cache.hit_rate():.1%}")
     print("✅ Indexing Complete! Your database is ready.")
 
 if __name__ == "__main__":
@@ -0,0 +1,223 @@
+"""
+On-disk BM25 inverted index plus an exact citation lookup table.
+
+Built from data/extracted_data.jsonl with the same chunking as the vector
+index, so keyword and vector hits refer to the same passages and can be fused.
+
+Layout of data/keyword_index/:
+    vocab.json      -> term -> [offset, doc_freq] into the postings arrays
+    postings.npy    -> int32 doc numbers, grouped by term
+    tfs.npy         -> uint16 term frequencies, parallel to postings.npy
+    doc_lengths.npy -> int32 token count per doc
+    docs.jsonl      -> one line per doc: id, url, chunk_index, citation, ..., text
+    citations.json  -> "13:2030" / ":2030" -> list of doc numbers
+
+Usage:
+    python indexer/keyword_index.py [--chunking structure|section]
+"""
+import argparse
+import json
+import os
+import re
+import sys
+from collections import Counter, defaultdict
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.jsonl_reader import JsonlReader
+from indexer.chunking import DEFAULT_STRATEGY, STRATEGIES, chunk_record, hierarchy_metadata
+from indexer.local_index import matches_filter
+
+INPUT_FILE = "data/extracted_data.jsonl"
+KEYWORD_INDEX_DIR = "data/keyword_index"
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+TOKEN_RE = re.compile(r"[a-z0-9]+(?:\.[0-9]+[a-z]?)*")
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or that the this "
+    "to was were what when which who will with shall may any such".split()
+)
+
+# "13 CCR § 2030", "13 CCR 2030.5", "Title 13, Section 2030"
+CITATION_RE = re.compile(
+    r"\b(\d+)\s*(?:CCR|C\.C\.R\.|CA\s+ADC)\s*(?:§+\s*)?(\d+(?:\.\d+)*[a-z]?)\b", re.IGNORECASE
+)
+TITLE_SECTION_RE = re.compile(
+    r"\btitle\s+(\d+)\b.*?(?:§+|\bsection|\bsec\.)\s*(\d+(?:\.\d+)*[a-z]?)\b", re.IGNORECASE
+)
+# "§ 2030" or "Section 2030" without a title
+SECTION_ONLY_RE = re.compile(r"(?:§+|\bsection|\bsec\.)\s*(\d+(?:\.\d+)*[a-z]?)\b", re.IGNORECASE)
+
+
+def tokenize(text):
+    return [t for t in TOKEN_RE.findall(text.lower()) if t not in STOPWORDS]
+
+
+def citation_key(title_number, section_number):
+    section = str(section_number or "").strip().rstrip(".").lower()
+    if not section:
+        return None
+    return f"{str(title_number or '').strip()}:{section}"
+
+
+def citation_keys_from_query(query):
+    """Exact citation keys mentioned in a query, most specific first."""
+    keys = []
+    for pattern in (CITATION_RE, TITLE_SECTION_RE):
+        for title, section in pattern.findall(query):
+            keys.append(citation_key(title, section))
+    if not keys:
+        keys = [citation_key("", section) for section in SECTION_ONLY_RE.findall(query)]
+    return [k for k in dict.fromkeys(keys) if k]
+
+
+class KeywordIndex:
+    def __init__(self, path=KEYWORD_INDEX_DIR, docs=None):
+        # docs: a ready sequence of the docs.jsonl rows (the warm bundle's memory-mapped copy)
+        self.path = path
+        with open(os.path.join(path, "vocab.json"), "r", encoding="utf-8") as f:
+            self.vocab = json.load(f)
+        with open(os.path.join(path, "citations.json"), "r", encoding="utf-8") as f:
+            self.citations = json.load(f)
+        self.postings = np.load(os.path.join(path, "postings.npy"), mmap_mode="r")
+        self.tfs = np.load(os.path.join(path, "tfs.npy"), mmap_mode="r")
+        self.doc_lengths = np.load(os.path.join(path, "doc_lengths.npy"))
+        self.avg_length = float(self.doc_lengths.mean()) if len(self.doc_lengths) else 0.0
+
+        self.docs = docs
+        if docs is None:
+            self.docs = []
+            with open(os.path.join(path, "docs.jsonl"), "r", encoding="utf-8") as f:
+                for line in f:
+                    self.docs.append(json.loads(line))
+        self._partitions = {}
+
+    @staticmethod
+    def exists(path=KEYWORD_INDEX_DIR):
+        return os.path.exists(os.path.join(path, "vocab.json"))
+
+    def __len__(self):
+        return len(self.docs)
+
+    def scores(self, query):
+        scores = np.zeros(len(self.docs), dtype=np.float32)
+        n = len(self.docs)
+        for term in set(tokenize(query)):
+            entry = self.vocab.get(term)
+            if entry is None:
+                continue
+            offset, df = entry
+            doc_ids = self.postings[offset:offset + df]
+            tf = self.tfs[offset:offset + df].astype(np.float32)
+            idf = np.log(1.0 + (n - df + 0.5) / (df + 0.5))
+            norm = BM25_K1 * (1.0 - BM25_B + BM25_B * self.doc_lengths[doc_ids] / self.avg_length)
+            scores[doc_ids] += idf * tf * (BM25_K1 + 1.0) / (tf + norm)
+        return scores
+
+    def partition(self, metadata_filter):
+        """Boolean mask of docs matching a Pinecone-style filter (same fields as the vectors)."""
+        key = json.dumps(metadata_filter, sort_keys=True)
+        if key not in self._partitions:
+            self._partitions[key] = np.asarray([matches_filter(doc, metadata_filter) for doc in self.docs], dtype=bool)
+        return self._partitions[key]
+
+    def search(self, query, k=10, filter=None):
+        """BM25 top-k as a list of (doc_number, score), best first."""
+        scores = self.scores(query)
+        if filter:
+            scores[~self.partition(filter)] = 0.0
+        hits = np.flatnonzero(scores)
+        if len(hits) == 0:
+            return []
+        if len(hits) > k:
+            hits = hits[np.argpartition(-scores[hits], k - 1)[:k]]
+        hits = hits[np.argsort(-scores[hits])]
+        return [(int(d), float(scores[d])) for d in hits]
+
+    def lookup_citation(self, query):
+        """Doc numbers for every citation in the query (dict lookups only, no scoring)."""
+        found = []
+        for key in citation_keys_from_query(query):
+            found.extend(self.citations.get(key, []))
+        return list(dict.fromkeys(found))
+
+
+def build(input_file=INPUT_FILE, path=KEYWORD_INDEX_DIR, strategy=DEFAULT_STRATEGY):
+    term_postings = defaultdict(list)
+    doc_lengths = []
+    citations = defaultdict(list)
+
+    os.makedirs(path, exist_ok=True)
+    reader = JsonlReader(input_file, required_keys=("source_url",))
+    with open(os.path.join(path, "docs.jsonl"), "w", encoding="utf-8") as docs_out:
+        for record in reader:
+            if not record.get("content_markdown"):
+                continue
+
+            for chunk in chunk_record(record, strategy=strategy):
+                doc_number = len(doc_lengths)
+                tokens = tokenize(f"{chunk['citation']} {chunk['section_heading']} {chunk['text']}")
+                doc_lengths.append(len(tokens))
+                for term, tf in Counter(tokens).items():
+                    term_postings[term].append((doc_number, min(tf, 65535)))
+
+                for key in (citation_key(chunk["title_number"], chunk["section_number"]),
+                            citation_key("", chunk["section_number"])):
+                    if key:
+                        citations[key].append(doc_number)
+
+                docs_out.write(json.dumps({
+                    "id": chunk["id"],
+                    "url": record["source_url"],
+                    "chunk_index": chunk["chunk_index"],
+                    "citation": chunk["citation"],
+                    "section_heading": chunk["section_heading"],
+                    "chapter": chunk["chapter"],
+                    **hierarchy_metadata(record),
+                    "section_number": chunk["section_number"],
+                    "subsection": chunk["subsection"],
+                    "text": chunk["text"]
+                }) + "\n")
+
+    vocab = {}
+    postings, tfs = [], []
+    offset = 0
+    for term in sorted(term_postings):
+        entries = term_postings[term]
+        vocab[term] = [offset, len(entries)]
+        postings.extend(d for d, _ in entries)
+        tfs.extend(tf for _, tf in entries)
+        offset += len(entries)
+
+    np.save(os.path.join(path, "postings.npy"), np.asarray(postings, dtype=np.int32))
+    np.save(os.path.join(path, "tfs.npy"), np.asarray(tfs, dtype=np.uint16))
+    np.save(os.path.join(path, "doc_lengths.npy"), np.asarray(doc_lengths, dtype=np.int32))
+    with open(os.path.join(path, "citations.json"), "w", encoding="utf-8") as f:
+        json.dump(citations, f)
+    with open(os.path.join(path, "vocab.json"), "w", encoding="utf-8") as f:
+        json.dump(vocab, f)
+
+    print(f"📑 Input: {reader.summary()}")
+    return len(doc_lengths), len(vocab)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the BM25 + citation lookup index.")
+    parser.add_argument("--chunking", choices=STRATEGIES, default=DEFAULT_STRATEGY,
+                        help="Must match the chunking used for the vector index")
+    args = parser.parse_args()
+
+    if not os.path.exists(INPUT_FILE):
+        print(f"❌ Error: {INPUT_FILE} not found. Run the extractor first.")
+        return
+
+    print(f"🔎 Building keyword index ({args.chunking})...")
+    num_docs, num_terms = build(strategy=args.chunking)
+    print(f"✅ Indexed {num_docs} passages, {num_terms} terms -> {KEYWORD_INDEX_DIR}")
+
+
+if __name__ == "__main__":
+    main()
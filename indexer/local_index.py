@@ -0,0 +1,524 @@
+"""
+Local, memory-mapped vector index (offline alternative to Pinecone).
+
+Layout of an index directory:
+    manifest.json   -> model name, dimension, dtype, quantization, row count
+    vectors.bin     -> raw row-major matrix (count x dimension), unit-normalized
+    codes.bin       -> quantized copy of vectors.bin when quantization is on:
+                       int8 (dimension bytes per row, scale per row in scales.bin)
+                       or binary (sign bits, dimension / 8 bytes per row)
+    metadata.jsonl  -> append-only log of {"row", "id", "metadata"}; last entry per row wins
+                       ({"row", "id": null} marks a deleted row, reused by the next upsert)
+
+The matrix is opened with np.memmap, so every process that loads the same index
+shares one copy through the OS page cache. Search is a blocked dot product
+(cosine, since rows are normalized) followed by argpartition for the top-k.
+A Pinecone-style metadata filter restricts the scan to a partition: the rows
+whose metadata match, computed once per filter and cached until the next write.
+
+With quantization the scan runs over codes.bin instead: an int8 dot product,
+or Hamming distance between sign bits. It keeps top_k x oversample candidates
+and rescores them with the full-precision rows of vectors.bin, which are read
+from disk only for those candidates. The pages that stay hot are 4x (int8) or
+32x (binary) smaller than float32 vectors.
+
+Usage:
+    python indexer/local_index.py info
+    python indexer/local_index.py quantize binary [--path data/local_index]   # or int8 / none
+"""
+import argparse
+import json
+import os
+import shutil
+
+import numpy as np
+
+LOCAL_INDEX_DIR = "data/local_index"
+MANIFEST_FILE = "manifest.json"
+VECTORS_FILE = "vectors.bin"
+METADATA_FILE = "metadata.jsonl"
+
+CODES_FILE = "codes.bin"
+SCALES_FILE = "scales.bin"
+
+SUPPORTED_DTYPES = ("float32", "float16")
+QUANTIZATIONS = ("none", "int8", "binary")
+SCAN_BLOCK_ROWS = 65536
+INT8_BLOCK_ROWS = 4096  # int8 blocks are widened to float32 for the BLAS product; small blocks stay in cache
+# Candidates rescored per result; LOCAL_INDEX_OVERSAMPLE overrides
+DEFAULT_OVERSAMPLE = {"int8": 4, "binary": 20}
+
+_bitwise_count = getattr(np, "bitwise_count", None)  # NumPy >= 2.0
+_POPCOUNT = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(axis=1).astype(np.uint8)
+
+
+def _normalize(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def quantize(values, quantization):
+    """Unit-normalized float32 rows -> (codes, per-row scales or None)."""
+    if quantization == "int8":
+        peak = np.abs(values).max(axis=1)
+        peak[peak == 0] = 1.0
+        codes = np.round(values / peak[:, None] * 127).astype(np.int8)
+        return codes, (peak / 127).astype(np.float32)
+    if quantization == "binary":
+        return np.packbits(values > 0, axis=1), None
+    raise ValueError(f"quantization must be one of {QUANTIZATIONS}, got {quantization!r}")
+
+
+def code_width(quantization, dimension):
+    return dimension if quantization == "int8" else (dimension + 7) // 8
+
+
+def hamming(query_bits, codes):
+    """(queries, width) x (rows, width) packed bits -> (queries, rows) differing bits."""
+    codes = np.ascontiguousarray(codes)
+    query_bits = np.ascontiguousarray(query_bits)
+    if query_bits.shape[1] % 8 == 0:
+        # Eight bytes at a time
+        codes = codes.view(np.uint64)
+        query_bits = query_bits.view(np.uint64)
+    distances = np.empty((len(query_bits), len(codes)), dtype=np.int32)
+    for qi, bits in enumerate(query_bits):
+        diff = np.bitwise_xor(codes, bits)
+        if _bitwise_count is not None:
+            distances[qi] = _bitwise_count(diff).sum(axis=1)
+        else:
+            distances[qi] = _POPCOUNT[diff.view(np.uint8)].sum(axis=1)
+    return distances
+
+
+def matches_filter(metadata, metadata_filter):
+    """Pinecone filter subset: {"field": value | {"$eq": value} | {"$in": [values]}}, all fields ANDed."""
+    if not metadata:
+        return False
+    for field, condition in metadata_filter.items():
+        value = metadata.get(field)
+        if isinstance(condition, dict):
+            if "$eq" in condition and value != condition["$eq"]:
+                return False
+            if "$in" in condition and value not in condition["$in"]:
+                return False
+        elif value != condition:
+            return False
+    return True
+
+
+class LocalVectorIndex:
+    def __init__(self, path=LOCAL_INDEX_DIR, oversample=None, rows=None):
+        """
+        rows: optional (ids, metadata) already resolved from metadata.jsonl,
+        e.g. memory-mapped from the warm bundle (common/warm_bundle.py); the
+        log is then not replayed. Metadata is copied to a list on first write.
+        """
+        self.path = path
+        manifest_path = os.path.join(path, MANIFEST_FILE)
+        if not os.path.exists(manifest_path):
+            raise FileNotFoundError(f"No local index at {path}. Build one with --backend local first.")
+
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+
+        self.model = manifest["model"]
+        self.dimension = manifest["dimension"]
+        self.dtype = np.dtype(manifest["dtype"])
+        self.quantization = manifest.get("quantization", "none")  # Indexes built before quantization existed
+        self.count = manifest["count"]
+        self._oversample = oversample
+
+        self._rows = {}
+        self._matrix = None
+        self._codes = None
+        self._scales = None
+        self._partitions = {}
+
+        if rows is not None:
+            self._ids, self._metadata = list(rows[0]), rows[1]
+            self._rows = {vid: row for row, vid in enumerate(self._ids) if vid is not None}
+        else:
+            self._load_metadata()
+
+        # Rows freed by delete(); upsert() fills these before growing the file
+        self._free = [row for row, vid in enumerate(self._ids) if vid is None]
+
+    def _load_metadata(self):
+        self._ids = [None] * self.count
+        self._metadata = [None] * self.count
+        with open(os.path.join(self.path, METADATA_FILE), "r", encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                row = entry["row"]
+                if row >= self.count:
+                    continue  # Row written after the manifest was last committed
+                previous = self._ids[row]
+                if previous is not None and self._rows.get(previous) == row:
+                    del self._rows[previous]
+                self._ids[row] = entry["id"]
+                self._metadata[row] = entry["metadata"]
+                if entry["id"] is not None:
+                    self._rows[entry["id"]] = row
+
+    def _writable_metadata(self):
+        # Bundle-backed metadata is a read-only view; writes need a real list
+        if not isinstance(self._metadata, list):
+            self._metadata = list(self._metadata)
+
+    @classmethod
+    def create(cls, path=LOCAL_INDEX_DIR, dimension=768, model="", dtype="float32", quantization="none",
+               overwrite=False):
+        if dtype not in SUPPORTED_DTYPES:
+            raise ValueError(f"dtype must be one of {SUPPORTED_DTYPES}, got {dtype!r}")
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f"quantization must be one of {QUANTIZATIONS}, got {quantization!r}")
+        if os.path.exists(path):
+            if not overwrite:
+                raise FileExistsError(f"Local index already exists at {path}")
+            shutil.rmtree(path)
+
+        os.makedirs(path)
+        open(os.path.join(path, VECTORS_FILE), "wb").close()
+        open(os.path.join(path, METADATA_FILE), "w").close()
+        if quantization != "none":
+            open(os.path.join(path, CODES_FILE), "wb").close()
+        if quantization == "int8":
+            open(os.path.join(path, SCALES_FILE), "wb").close()
+        cls._write_manifest(path, {"model": model, "dimension": dimension, "dtype": dtype,
+                                   "quantization": quantization, "count": 0})
+        return cls(path)
+
+    @staticmethod
+    def exists(path=LOCAL_INDEX_DIR):
+        return os.path.exists(os.path.join(path, MANIFEST_FILE))
+
+    @staticmethod
+    def _write_manifest(path, manifest):
+        # Write-then-rename so readers never see a half-written manifest
+        tmp_path = os.path.join(path, MANIFEST_FILE + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, os.path.join(path, MANIFEST_FILE))
+
+    def _commit_manifest(self):
+        self._write_manifest(self.path, {
+            "model": self.model, "dimension": self.dimension, "dtype": self.dtype.name,
+            "quantization": self.quantization, "count": self.count
+        })
+
+    def __len__(self):
+        return self.count - len(self._free)
+
+    @property
+    def oversample(self):
+        default = DEFAULT_OVERSAMPLE.get(self.quantization, 1)
+        return int(self._oversample or os.getenv("LOCAL_INDEX_OVERSAMPLE") or default)
+
+    @property
+    def matrix(self):
+        if self._matrix is None:
+            if self.count == 0:
+                self._matrix = np.zeros((0, self.dimension), dtype=self.dtype)
+            else:
+                self._matrix = np.memmap(
+                    os.path.join(self.path, VECTORS_FILE),
+                    dtype=self.dtype, mode="r", shape=(self.count, self.dimension)
+                )
+        return self._matrix
+
+    @property
+    def codes(self):
+        """Quantized rows (int8 or packed sign bits); None without quantization."""
+        if self._codes is None and self.quantization != "none":
+            width = code_width(self.quantization, self.dimension)
+            code_dtype = np.int8 if self.quantization == "int8" else np.uint8
+            if self.count == 0:
+                self._codes = np.zeros((0, width), dtype=code_dtype)
+                self._scales = np.zeros(0, dtype=np.float32)
+            else:
+                self._codes = np.memmap(os.path.join(self.path, CODES_FILE),
+                                        dtype=code_dtype, mode="r", shape=(self.count, width))
+                if self.quantization == "int8":
+                    self._scales = np.memmap(os.path.join(self.path, SCALES_FILE),
+                                             dtype=np.float32, mode="r", shape=(self.count,))
+        return self._codes
+
+    def get_id(self, row):
+        return self._ids[row]
+
+    def get_metadata(self, row):
+        return self._metadata[row]
+
+    # --- WRITES ---
+    def _reset_views(self):
+        self._matrix = None
+        self._codes = None
+        self._scales = None
+        self._partitions = {}
+
+    def _write_codes(self, rows, values):
+        """Writes the quantized form of normalized float32 rows at the given row numbers."""
+        codes, scales = quantize(values, self.quantization)
+        width = codes.shape[1] * codes.itemsize
+        with open(os.path.join(self.path, CODES_FILE), "r+b") as cf:
+            for row, code in zip(rows, codes):
+                cf.seek(row * width)
+                cf.write(code.tobytes())
+        if scales is not None:
+            with open(os.path.join(self.path, SCALES_FILE), "r+b") as sf:
+                for row, scale in zip(rows, scales):
+                    sf.seek(row * 4)
+                    sf.write(scale.tobytes())
+
+    def upsert(self, vectors):
+        """
+        Accepts the same shape as Pinecone's index.upsert(vectors=[...]):
+        a list of {"id", "values", "metadata"} dicts.
+        """
+        if not vectors:
+            return
+
+        values = np.asarray([v["values"] for v in vectors], dtype=np.float32)
+        if values.shape[1] != self.dimension:
+            raise ValueError(f"Vector dimension {values.shape[1]} does not match index dimension {self.dimension}")
+        normalized = _normalize(values)
+        values = normalized.astype(self.dtype)
+        row_bytes = self.dimension * self.dtype.itemsize
+
+        self._writable_metadata()
+        new_count = self.count
+        rows = []
+        log_entries = []
+        with open(os.path.join(self.path, VECTORS_FILE), "r+b") as vf:
+            for vec, item in zip(values, vectors):
+                row = self._rows.get(item["id"])
+                if row is None and self._free:
+                    row = self._free.pop()
+                    self._ids[row] = item["id"]
+                    self._rows[item["id"]] = row
+                elif row is None:
+                    row = new_count
+                    new_count += 1
+                    self._ids.append(item["id"])
+                    self._metadata.append(None)
+                    self._rows[item["id"]] = row
+                vf.seek(row * row_bytes)
+                vf.write(vec.tobytes())
+                rows.append(row)
+                self._metadata[row] = item.get("metadata", {})
+                log_entries.append({"row": row, "id": item["id"], "metadata": self._metadata[row]})
+
+        if self.quantization != "none":
+            self._write_codes(rows, normalized)
+
+        with open(os.path.join(self.path, METADATA_FILE), "a", encoding="utf-8") as mf:
+            for entry in log_entries:
+                mf.write(json.dumps(entry) + "\n")
+
+        self.count = new_count
+        self._reset_views()
+        self._commit_manifest()
+
+    def delete(self, ids):
+        """
+        Same call as Pinecone's index.delete(ids=[...]). The row is zeroed and
+        tombstoned in the metadata log; unknown ids are ignored.
+        """
+        rows = [self._rows.pop(vid) for vid in ids if vid in self._rows]
+        if not rows:
+            return 0
+        self._writable_metadata()
+
+        zeros = np.zeros(self.dimension, dtype=self.dtype).tobytes()
+        row_bytes = self.dimension * self.dtype.itemsize
+        with open(os.path.join(self.path, VECTORS_FILE), "r+b") as vf:
+            for row in rows:
+                vf.seek(row * row_bytes)
+                vf.write(zeros)
+        if self.quantization != "none":
+            self._write_codes(rows, np.zeros((len(rows), self.dimension), dtype=np.float32))
+        with open(os.path.join(self.path, METADATA_FILE), "a", encoding="utf-8") as mf:
+            for row in rows:
+                self._ids[row] = None
+                self._metadata[row] = None
+                mf.write(json.dumps({"row": row, "id": None, "metadata": None}) + "\n")
+
+        self._free.extend(rows)
+        self._reset_views()
+        return len(rows)
+
+    def quantize(self, quantization):
+        """(Re)builds codes.bin from vectors.bin, or drops it with "none"."""
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f"quantization must be one of {QUANTIZATIONS}, got {quantization!r}")
+        for name in (CODES_FILE, SCALES_FILE):
+            if os.path.exists(os.path.join(self.path, name)):
+                os.remove(os.path.join(self.path, name))
+        self.quantization = quantization
+        if quantization != "none":
+            # Preallocate, then fill block by block so a large index never sits in memory as float32
+            with open(os.path.join(self.path, CODES_FILE), "wb") as cf:
+                cf.truncate(self.count * code_width(quantization, self.dimension))
+            if quantization == "int8":
+                with open(os.path.join(self.path, SCALES_FILE), "wb") as sf:
+                    sf.truncate(self.count * 4)
+            matrix = self.matrix
+            for start in range(0, self.count, SCAN_BLOCK_ROWS):
+                block = np.asarray(matrix[start:start + SCAN_BLOCK_ROWS], dtype=np.float32)
+                self._write_codes(range(start, start + len(block)), block)
+        self._reset_views()
+        self._commit_manifest()
+
+    # --- READS ---
+    def partition(self, metadata_filter):
+        """Sorted rows whose metadata match the filter (deleted rows never do)."""
+        key = json.dumps(metadata_filter, sort_keys=True)
+        if key not in self._partitions:
+            self._partitions[key] = np.asarray(
+                [row for row, metadata in enumerate(self._metadata) if matches_filter(metadata, metadata_filter)],
+                dtype=np.int64
+            )
+        return self._partitions[key]
+
+    def _scan(self, n_queries, top_k, rows, n, score_block, block_rows=SCAN_BLOCK_ROWS):
+        """
+        Blocked scan over n rows (all of them, or the given row numbers):
+        score_block(selection) returns (queries x block) scores. Returns
+        one list of (row, score) per query, best first.
+        """
+        scores = np.empty((n_queries, n), dtype=np.float32)
+        for start in range(0, n, block_rows):
+            selection = slice(start, min(start + block_rows, n)) if rows is None else rows[start:start + block_rows]
+            block_scores = score_block(selection)
+            scores[:, start:start + block_scores.shape[1]] = block_scores
+
+        excluded = 0
+        if rows is None and self._free:
+            scores[:, self._free] = -np.inf  # Deleted rows never match
+            excluded = len(self._free)
+        k = min(top_k, n - excluded)
+        if k <= 0:
+            return [[] for _ in range(n_queries)]
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        results = []
+        for qi, cols in enumerate(top):
+            cols = cols[np.argsort(-scores[qi, cols])]
+            row_ids = cols if rows is None else rows[cols]
+            results.append([(int(r), float(scores[qi, c])) for r, c in zip(row_ids, cols)])
+        return results
+
+    def search(self, query_vectors, top_k=3, rows=None, exact=False):
+        """
+        Batched top-k. Returns one list of (row, score) per query vector,
+        best match first. With rows (e.g. from partition()), only those rows
+        are read and scored. A quantized index ranks candidates on its codes
+        and returns exact scores for the rescored top_k (exact=True skips the
+        candidate pass).
+        """
+        queries = _normalize(np.atleast_2d(np.asarray(query_vectors, dtype=np.float32)))
+        n = self.count if rows is None else len(rows)
+        if n == 0:
+            return [[] for _ in range(len(queries))]
+
+        candidates = top_k * self.oversample
+        if exact or self.quantization == "none" or n <= candidates:
+            matrix = self.matrix
+            return self._scan(len(queries), top_k, rows, n,
+                              lambda sel: queries @ np.asarray(matrix[sel], dtype=np.float32).T)
+
+        codes = self.codes
+        if self.quantization == "int8":
+            scales = self._scales
+            shortlist = self._scan(len(queries), candidates, rows, n,
+                                   lambda sel: (queries @ np.asarray(codes[sel], dtype=np.float32).T) * scales[sel],
+                                   block_rows=INT8_BLOCK_ROWS)
+        else:
+            query_bits, _ = quantize(queries, "binary")
+            shortlist = self._scan(len(queries), candidates, rows, n,
+                                   lambda sel: self.dimension - 2 * hamming(query_bits, codes[sel]))
+
+        # Rescore: only the candidates' full-precision rows are read from vectors.bin
+        matrix = self.matrix
+        results = []
+        for query, matches in zip(queries, shortlist):
+            if not matches:
+                results.append([])
+                continue
+            candidate_rows = np.sort(np.fromiter((row for row, _ in matches), dtype=np.int64))
+            exact_scores = np.asarray(matrix[candidate_rows], dtype=np.float32) @ query
+            best = np.argsort(-exact_scores)[:top_k]
+            results.append([(int(candidate_rows[i]), float(exact_scores[i])) for i in best])
+        return results
+
+    def query(self, vector, top_k=3, filter=None):
+        rows = self.partition(filter) if filter else None
+        return [
+            {"id": self._ids[row], "score": score, "metadata": self._metadata[row]}
+            for row, score in self.search(vector, top_k=top_k, rows=rows)[0]
+        ]
+
+
+class LocalVectorStore:
+    """
+    Drop-in for the parts of PineconeVectorStore the agent uses.
+    Page content is read from metadata["text"], same as langchain_pinecone.
+    """
+
+    def __init__(self, index, embedding, text_key="text"):
+        self.index = index
+        self.embedding = embedding
+        self.text_key = text_key
+
+    @classmethod
+    def from_existing_index(cls, path=LOCAL_INDEX_DIR, embedding=None):
+        index = LocalVectorIndex(path)
+        if embedding is None:
+            from indexer.embedders import get_embeddings
+            embedding = get_embeddings(index.model)
+        return cls(index, embedding)
+
+    def _to_document(self, match):
+        from langchain_core.documents import Document
+        metadata = dict(match["metadata"])
+        text = metadata.pop(self.text_key, "")
+        return Document(id=match["id"], page_content=text, metadata=metadata)
+
+    def similarity_search_with_score(self, query, k=4, filter=None):
+        vector = self.embedding.embed_query(query)
+        return [(self._to_document(m), m["score"]) for m in self.index.query(vector, top_k=k, filter=filter)]
+
+    def similarity_search(self, query, k=4, filter=None):
+        return [doc for doc, _ in self.similarity_search_with_score(query, k=k, filter=filter)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect or quantize a local vector index.")
+    parser.add_argument("command", choices=["info", "quantize"])
+    parser.add_argument("quantization", nargs="?", choices=QUANTIZATIONS, help="For quantize")
+    parser.add_argument("--path", default=LOCAL_INDEX_DIR)
+    args = parser.parse_args()
+
+    index = LocalVectorIndex(args.path)
+    if args.command == "quantize":
+        if not args.quantization:
+            parser.error("quantize needs one of: " + ", ".join(QUANTIZATIONS))
+        print(f"🗜️  Quantizing {args.path} ({len(index)} vectors) to {args.quantization}...")
+        index.quantize(args.quantization)
+
+    float_mb = index.count * index.dimension * index.dtype.itemsize / 1e6
+    print(f"📦 {args.path}: {len(index)} vectors x {index.dimension} ({index.model or 'unknown model'})")
+    print(f"   vectors.bin: {float_mb:.1f} MB {index.dtype.name}")
+    if index.quantization != "none":
+        codes_mb = index.count * code_width(index.quantization, index.dimension) / 1e6
+        if index.quantization == "int8":
+            codes_mb += index.count * 4 / 1e6
+        print(f"   codes.bin:   {codes_mb:.1f} MB {index.quantization} ({float_mb / codes_mb:.0f}x smaller scan), "
+              f"rescoring top_k x {index.oversample} candidates")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,323 @@
+"""
+Incremental refresh: re-fetch sections, detect what changed, and apply only
+those changes to the vector index (instead of reset_db.py's full rebuild).
+
+1. Re-fetch every discovered section through the extractor's adaptive window
+   and per-host rate limiter (pages also land in the HTML snapshot store).
+2. Compare a normalized content hash per Westlaw document GUID with the stored
+   record. Whitespace and the "current through" banner are ignored, so only
+   real amendments count as changes.
+3. Upsert the chunks of added / changed sections whose text or metadata moved,
+   delete chunk ids that no longer exist and every chunk of removed sections.
+4. Append the changelog to data/changelog.jsonl, rewrite
+   data/extracted_data.jsonl, rebuild the keyword index if there is one and
+   drop cached agent answers that cited a changed section. Removed sections
+   are forgotten by the state store's extract and index stages.
+
+Stored records are read from the corpus store (common/corpus_store.py),
+which is brought up to date with data/extracted_data.jsonl first, so only
+the sections being compared are decoded, never the whole corpus at once.
+
+A section is "removed" when it is no longer in the discovered URL list; re-run
+discovery into a fresh file and pass it with --urls to pick up repeals. Pages
+that fail to fetch are left as they are.
+
+Usage:
+    python refresh.py                    # Pinecone, same layout as reset_db.py
+    python refresh.py --backend local
+    python refresh.py --dry-run          # fetch and report changes, nothing written
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import time
+from datetime import datetime
+from dotenv import load_dotenv
+
+from crawl4ai import AsyncWebCrawler
+
+from agent.answer_cache import ANSWER_CACHE_FILE, AnswerCache
+from common.corpus_store import CorpusStore
+from common.jsonl_reader import JsonlReader
+from common.state_store import EXTRACT, StateStore, index_stage
+from common.tracing import span
+from crawler.extract_sections import CONCURRENCY, MAX_CONCURRENCY, RATE, TARGET_LATENCY, Extractor
+from crawler.html_store import HtmlStore, document_guid
+from crawler.politeness import AdaptiveConcurrency, HostRateLimiter
+from indexer.chunking import (BOILERPLATE_RE, DEFAULT_STRATEGY, STRATEGIES, chunk_record, embedding_text,
+                              vector_metadata)
+from indexer.embedders import GOOGLE_MODEL, get_embeddings
+from indexer.embedding_cache import EMBEDDING_CACHE_FILE, CachedEmbeddings, EmbeddingCache
+from indexer.keyword_index import KEYWORD_INDEX_DIR, KeywordIndex, build as build_keyword_index
+from indexer.local_index import LOCAL_INDEX_DIR, LocalVectorIndex
+
+# --- CONFIGURATION ---
+load_dotenv(override=True)
+INDEX_NAME = "ccr-regulations"
+URLS_FILE = "data/discovered_section_urls.jsonl"
+DATA_FILE = "data/extracted_data.jsonl"
+CHANGELOG_FILE = "data/changelog.jsonl"
+BATCH_SIZE = 100
+MAX_REMOVED_FRACTION = 0.1  # More than this looks like a truncated URL list, not repeals
+HASH_FIELDS = ("citation", "title_number", "division", "chapter", "article", "section_number", "section_heading")
+
+
+def content_hash(record):
+    """sha256 of the section's metadata and text, ignoring layout and currentness banners."""
+    h = hashlib.sha256()
+    for field in HASH_FIELDS:
+        h.update(str(record.get(field) or "").encode("utf-8") + b"\0")
+    for line in (record.get("content_markdown") or "").split("\n"):
+        line = " ".join(line.split())
+        if line and not BOILERPLATE_RE.match(line):
+            h.update(line.encode("utf-8") + b"\n")
+    return h.hexdigest()
+
+
+def open_records(path):
+    # Keyed by GUID; a section extracted twice keeps its last record
+    store = CorpusStore()
+    ingested = store.sync(path)
+    print(f"📑 Stored records: {len(store)} sections in the corpus store ({ingested} ingested from {path})")
+    return store
+
+
+def load_urls(path):
+    urls = {}
+    for record in JsonlReader(path, required_keys=("section_url",)):
+        urls.setdefault(document_guid(record["section_url"]), record["section_url"])
+    return urls
+
+
+async def fetch_sections(urls, concurrency, max_concurrency, rate):
+    window = AdaptiveConcurrency(initial=concurrency, maximum=max_concurrency, target_latency=TARGET_LATENCY)
+    limiter = HostRateLimiter(rate=rate)
+    records = asyncio.Queue()
+    async with AsyncWebCrawler(verbose=False) as crawler:
+        extractor = Extractor(crawler, window, limiter, records, HtmlStore())
+        await extractor.run(urls)
+
+    fetched = {}
+    while not records.empty():
+        _, record = records.get_nowait()
+        fetched[document_guid(record["source_url"])] = record
+    return fetched, extractor.failed
+
+
+def diff_records(stored, fetched, discovered):
+    """stored: the corpus store; records are read one at a time, by GUID."""
+    changes = []
+    for guid, new in fetched.items():
+        old = stored.get(guid)
+        new_hash = content_hash(new)
+        old_hash = content_hash(old) if old else None
+        if old_hash != new_hash:
+            changes.append({"change": "changed" if old else "added", "guid": guid,
+                            "old": old, "new": new, "old_hash": old_hash, "new_hash": new_hash})
+    for guid in list(stored.entries):
+        if guid not in discovered:
+            old = stored.get(guid)
+            changes.append({"change": "removed", "guid": guid,
+                            "old": old, "new": None, "old_hash": content_hash(old), "new_hash": None})
+    return changes
+
+
+def plan_vectors(changes, strategy):
+    """
+    Chunk-level delta for each change: only chunks whose text or metadata
+    differ are re-upserted, and old chunk ids that disappeared are deleted.
+    """
+    upserts, deletes = [], []
+    for change in changes:
+        old_chunks = {}
+        if change["old"] and change["old"].get("content_markdown"):
+            for chunk in chunk_record(change["old"], strategy=strategy):
+                old_chunks[chunk["id"]] = (embedding_text(chunk), vector_metadata(change["old"], chunk))
+
+        new_ids = set()
+        change["chunks_upserted"] = 0
+        if change["new"]:
+            for chunk in chunk_record(change["new"], strategy=strategy):
+                new_ids.add(chunk["id"])
+                text, metadata = embedding_text(chunk), vector_metadata(change["new"], chunk)
+                if old_chunks.get(chunk["id"]) != (text, metadata):
+                    upserts.append((chunk["id"], text, metadata))
+                    change["chunks_upserted"] += 1
+
+        stale = [vid for vid in old_chunks if vid not in new_ids]
+        deletes.extend(stale)
+        change["chunks_deleted"] = len(stale)
+    return upserts, deletes
+
+
+def apply_vectors(backend, upserts, deletes, use_cache):
+    if backend == "local":
+        index = LocalVectorIndex(LOCAL_INDEX_DIR)
+        model = index.model
+    else:
+        from langchain_pinecone import PineconeVectorStore
+        from langchain_core.documents import Document
+        model = GOOGLE_MODEL
+
+    embeddings = get_embeddings(model)
+    if use_cache:
+        # Unchanged subsections of an amended section are cache hits, not API calls
+        embeddings = CachedEmbeddings(embeddings, model, EmbeddingCache(EMBEDDING_CACHE_FILE))
+    if backend == "pinecone":
+        vectorstore = PineconeVectorStore(index_name=INDEX_NAME, embedding=embeddings)
+
+    for start in range(0, len(upserts), BATCH_SIZE):
+        batch = upserts[start:start + BATCH_SIZE]
+        with span("refresh.upsert", chunks=len(batch)):
+            if backend == "local":
+                vectors = embeddings.embed_documents([text for _, text, _ in batch])
+                index.upsert(vectors=[
+                    {"id": vid, "values": values, "metadata": {**metadata, "text": text}}
+                    for (vid, text, metadata), values in zip(batch, vectors)
+                ])
+            else:
+                vectorstore.add_documents(
+                    [Document(page_content=text, metadata=metadata) for _, text, metadata in batch],
+                    ids=[vid for vid, _, _ in batch]
+                )
+        print(f"   👉 {start + len(batch)}/{len(upserts)} chunks upserted...")
+
+    for start in range(0, len(deletes), BATCH_SIZE):
+        batch = deletes[start:start + BATCH_SIZE]
+        if backend == "local":
+            index.delete(batch)
+        else:
+            vectorstore.delete(ids=batch)
+    if deletes:
+        print(f"   🗑️  {len(deletes)} stale chunks deleted.")
+
+    if use_cache:
+        print(f"💾 Embedding cache hit rate: {embeddings.cache.hit_rate():.1%} ({embeddings.api_calls} API calls)")
+
+
+def write_changelog(changes, detected_at):
+    with open(CHANGELOG_FILE, "a", encoding="utf-8") as f:
+        for change in changes:
+            record = change["new"] or change["old"]
+            f.write(json.dumps({
+                "detected_at": detected_at,
+                "change": change["change"],
+                "guid": change["guid"],
+                "url": record["source_url"],
+                "citation": record.get("citation"),
+                "old_hash": change["old_hash"],
+                "new_hash": change["new_hash"],
+                "chunks_upserted": change.get("chunks_upserted", 0),
+                "chunks_deleted": change.get("chunks_deleted", 0)
+            }) + "\n")
+
+
+def rewrite_dataset(stored, changes):
+    # Updated records keep their original position; added ones go at the end
+    by_guid = {change["guid"]: change["new"] for change in changes}
+    tmp_path = DATA_FILE + ".refresh.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        for record in stored:  # Streamed a block at a time
+            guid = document_guid(record["source_url"])
+            if guid in by_guid:
+                record = by_guid.pop(guid)
+                if record is None:
+                    continue  # Removed
+            f.write(json.dumps(record) + "\n")
+        for record in by_guid.values():
+            if record is not None:
+                f.write(json.dumps(record) + "\n")
+    os.replace(tmp_path, DATA_FILE)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-fetch sections and apply only the changes to the index.")
+    parser.add_argument("--backend", choices=["pinecone", "local"], default="pinecone")
+    parser.add_argument("--chunking", choices=STRATEGIES, default=DEFAULT_STRATEGY,
+                        help="Must match the chunking the index was built with")
+    parser.add_argument("--urls", default=URLS_FILE, help="Discovered section URLs (JSONL with section_url)")
+    parser.add_argument("--limit", type=int, default=None, help="Only re-fetch the first N sections")
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY)
+    parser.add_argument("--max-concurrency", type=int, default=MAX_CONCURRENCY)
+    parser.add_argument("--rate", type=float, default=RATE, help="Requests per second per host")
+    parser.add_argument("--no-cache", action="store_true",
+                        help=f"Re-embed changed chunks instead of reusing vectors from {EMBEDDING_CACHE_FILE}")
+    parser.add_argument("--dry-run", action="store_true", help="Report changes without touching the index or data")
+    parser.add_argument("--allow-mass-delete", action="store_true",
+                        help=f"Apply even if more than {MAX_REMOVED_FRACTION:.0%} of sections look removed")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.urls):
+        print(f"❌ Error: {args.urls} not found. Run discovery first.")
+        return
+    if not args.dry_run and args.backend == "local" and not LocalVectorIndex.exists(LOCAL_INDEX_DIR):
+        print(f"❌ Error: no local index at {LOCAL_INDEX_DIR}. Build one with reset_db.py --backend local first.")
+        return
+
+    detected_at = datetime.utcnow().isoformat()
+    stored = open_records(DATA_FILE)
+    discovered = load_urls(args.urls)
+    urls = list(discovered.values())[:args.limit]
+
+    print(f"🚀 Refreshing {len(urls)} sections ({len(stored)} stored, backend: {args.backend})...")
+    started = time.perf_counter()
+    fetched, failed = asyncio.run(fetch_sections(urls, args.concurrency, args.max_concurrency, args.rate))
+    print(f"📥 Fetched {len(fetched)} sections in {time.perf_counter() - started:.0f}s ({failed} failed, left unchanged)")
+
+    changes = diff_records(stored, fetched, discovered)
+    counts = {kind: sum(c["change"] == kind for c in changes) for kind in ("added", "changed", "removed")}
+    print(f"📝 {counts['added']} added, {counts['changed']} changed, {counts['removed']} removed")
+    for change in changes:
+        record = change["new"] or change["old"]
+        print(f"   {change['change']:>8}: {record.get('citation')} ({record['source_url']})")
+
+    upserts, deletes = plan_vectors(changes, args.chunking)
+    print(f"🧮 Delta: {len(upserts)} chunks to upsert, {len(deletes)} to delete")
+    if args.dry_run or not changes:
+        print("✅ Nothing written." if args.dry_run else "✅ Index is up to date.")
+        return
+
+    if stored and counts["removed"] > MAX_REMOVED_FRACTION * len(stored) and not args.allow_mass_delete:
+        print(f"❌ {counts['removed']} removals is more than {MAX_REMOVED_FRACTION:.0%} of the corpus; "
+              f"check {args.urls} or pass --allow-mass-delete.")
+        return
+
+    # Index first: if it fails, the dataset still holds the old records and
+    # the next run detects (and re-applies) the same changes
+    apply_vectors(args.backend, upserts, deletes, use_cache=not args.no_cache)
+    write_changelog(changes, detected_at)
+    rewrite_dataset(stored, changes)
+    print(f"📜 Changelog appended to {CHANGELOG_FILE}")
+
+    # Added and amended sections are now extracted and indexed under their discovered URL
+    state = StateStore()
+    refreshed = [discovered.get(c["guid"], c["new"]["source_url"]) for c in changes if c["new"]]
+    state.mark(EXTRACT, refreshed)
+    state.mark(index_stage(args.backend, args.chunking), refreshed)
+    # Removed sections are neither extracted nor indexed any more; if one comes back, it is new again.
+    # Matched by GUID: the stages may hold the discovered URL rather than the record's source_url
+    removed = {c["guid"] for c in changes if not c["new"]}
+    if removed:
+        for stage in (EXTRACT, index_stage(args.backend, args.chunking)):
+            state.forget(stage, [key for key in state.keys(stage, None) if document_guid(key) in removed])
+    state.close()
+
+    if os.path.exists(ANSWER_CACHE_FILE):
+        dropped = AnswerCache(ANSWER_CACHE_FILE).invalidate(c["guid"] for c in changes)
+        print(f"🧹 {dropped} cached answers cited a changed section and were dropped")
+
+    # The dataset was rewritten, so this rebuilds the store from it
+    stored.close()
+    print(f"📦 Corpus store: {CorpusStore().sync(DATA_FILE)} records re-ingested")
+
+    if KeywordIndex.exists(KEYWORD_INDEX_DIR):
+        print("🔎 Rebuilding keyword index...")
+        build_keyword_index(DATA_FILE, KEYWORD_INDEX_DIR, strategy=args.chunking)
+
+    print("✅ Refresh Complete!")
+
+
+if __name__ == "__main__":
+    main()
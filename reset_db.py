@@ -1,92 +1,182 @@
 import os
-import json
 import time
+import argparse
+from collections import deque
 from dotenv import load_dotenv
-from pinecone import Pinecone, ServerlessSpec
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
-from langchain_pinecone import PineconeVectorStore
-from langchain_core.documents import Document 
+from langchain_core.documents import Document
+from common.jsonl_reader import JsonlReader
+from common.rate_limit import get_limiter
+from common.state_store import StateStore, index_stage
+from common.tracing import span
+from indexer.chunking import DEFAULT_STRATEGY, STRATEGIES, chunk_record, embedding_text, vector_metadata
+from indexer.embedders import GOOGLE_MODEL, MODEL_DIMENSIONS, get_embeddings
+from indexer.embedding_cache import EMBEDDING_CACHE_FILE, CachedEmbeddings, EmbeddingCache
+from indexer.local_index import LOCAL_INDEX_DIR, QUANTIZATIONS, LocalVectorIndex
+
+parser = argparse.ArgumentParser(description="Drop and rebuild the vector index from data/extracted_data.jsonl.")
+parser.add_argument("--backend", choices=["pinecone", "local"], default="pinecone",
+                    help="pinecone (default) or a local memory-mapped index under data/local_index")
+parser.add_argument("--dtype", choices=["float32", "float16"], default="float32",
+                    help="Storage type for the local index")
+parser.add_argument("--quantization", choices=QUANTIZATIONS, default="none",
+                    help="Local index: int8 or binary codes for the first-pass scan, rescored with full precision")
+parser.add_argument("--chunking", choices=STRATEGIES, default=DEFAULT_STRATEGY,
+                    help="structure (default): split on (a)/(1)/(A) and History blocks; section: one vector per section")
+parser.add_argument("--no-cache", action="store_true",
+                    help=f"Re-embed everything instead of reusing vectors from {EMBEDDING_CACHE_FILE}")
+args = parser.parse_args()
 
 # 1. Load Secrets
 load_dotenv(override=True)
 INDEX_NAME = "ccr-regulations"
 PINECONE_KEY = os.getenv("PINECONE_API_KEY")
+DIMENSION = MODEL_DIMENSIONS[GOOGLE_MODEL]
 
-print("🚀 Starting Database Reset (Upgrade to 768 dimensions)...")
+print(f"🚀 Starting Database Reset (Upgrade to {DIMENSION} dimensions, backend: {args.backend})...")
 
-# 2. Connect to Pinecone
-pc = Pinecone(api_key=PINECONE_KEY)
+if args.backend == "pinecone":
+    from pinecone import Pinecone, ServerlessSpec
+    from langchain_pinecone import PineconeVectorStore
 
-# 3. DELETE the Old Index
-if INDEX_NAME in [i.name for i in pc.list_indexes()]:
-    print(f"🗑️  Deleting old index '{INDEX_NAME}'...")
-    pc.delete_index(INDEX_NAME)
-    print("⏳ Waiting 15 seconds for deletion to finish...")
-    time.sleep(15) 
-else:
-    print("ℹ️  Index did not exist. Creating fresh.")
+    # 2. Connect to Pinecone
+    pc = Pinecone(api_key=PINECONE_KEY)
 
-# 4. CREATE the New Index
-print("🏗️  Creating new index with dimension=768...")
-try:
-    pc.create_index(
-        name=INDEX_NAME,
-        dimension=768, 
-        metric="cosine",
-        spec=ServerlessSpec(cloud="aws", region="us-east-1") 
+    # 3. DELETE the Old Index
+    if INDEX_NAME in [i.name for i in pc.list_indexes()]:
+        print(f"🗑️  Deleting old index '{INDEX_NAME}'...")
+        pc.delete_index(INDEX_NAME)
+        print("⏳ Waiting 15 seconds for deletion to finish...")
+        time.sleep(15)
+    else:
+        print("ℹ️  Index did not exist. Creating fresh.")
+
+    # 4. CREATE the New Index
+    print(f"🏗️  Creating new index with dimension={DIMENSION}...")
+    try:
+        pc.create_index(
+            name=INDEX_NAME,
+            dimension=DIMENSION,
+            metric="cosine",
+            spec=ServerlessSpec(cloud="aws", region="us-east-1")
+        )
+        print("⏳ Waiting 10 seconds for initialization...")
+        time.sleep(10)
+    except Exception as e:
+        print(f"⚠️ Index creation notice: {e}")
+else:
+    # 2-4. Local index: nothing to wait for, just recreate the files
+    if LocalVectorIndex.exists(LOCAL_INDEX_DIR):
+        print(f"🗑️  Deleting old local index '{LOCAL_INDEX_DIR}'...")
+    local_index = LocalVectorIndex.create(
+        LOCAL_INDEX_DIR, dimension=DIMENSION, model=GOOGLE_MODEL, dtype=args.dtype,
+        quantization=args.quantization, overwrite=True
     )
-    print("⏳ Waiting 10 seconds for initialization...")
-    time.sleep(10)
-except Exception as e:
-    print(f"⚠️ Index creation notice: {e}")
 
-# 5. Load ALL Data
-print("📂 Loading data from file...")
+# The old index is gone, so is everything the state store recorded as indexed in it
+state = StateStore()
+state.reset(index_stage(args.backend, "*"))
+
+def iter_documents(reader):
+    for entry in reader:
+        for chunk in chunk_record(entry, strategy=args.chunking):
+            yield Document(
+                id=chunk["id"],
+                page_content=embedding_text(chunk),
+                metadata=vector_metadata(entry, chunk)
+            )
+
+REQUEUE_ROUNDS = 3  # Passes over batches that still failed after the limiter's own retries
+
+def upload_batch(batch, uploaded):
+    # Embedding calls are paced and retried by the shared quota limiter; an
+    # error here means the retries ran out, so the batch is re-queued
+    with span("index.batch", chunks=len(batch)) as s:
+        try:
+            if args.backend == "pinecone":
+                PineconeVectorStore.from_documents(
+                    batch,
+                    embeddings,
+                    ids=[doc.id for doc in batch],
+                    index_name=INDEX_NAME
+                )
+            else:
+                vectors = embeddings.embed_documents([doc.page_content for doc in batch])
+                local_index.upsert(vectors=[
+                    {"id": doc.id, "values": values, "metadata": {**doc.metadata, "text": doc.page_content}}
+                    for doc, values in zip(batch, vectors)
+                ])
+            print(f"   👉 Progress: {uploaded + len(batch)} chunks uploaded ({reader.records} documents read)...")
+            return True
+        except Exception as e:
+            s.set(error=type(e).__name__)
+            print(f"   ❌ Error on batch {uploaded}: {e} (re-queued)")
+            return False
+
+# 5. Stream Data (records are read, chunked and uploaded one batch at a time)
+print("📂 Streaming data from file...")
 try:
-    with open("data/extracted_data.jsonl", "r", encoding="utf-8") as f:
-        all_data = [json.loads(line) for line in f]
-    
-    # LIMIT REMOVED: Now using len(all_data)
-    total_docs = len(all_data)
-    print(f"✅ Loaded {total_docs} documents. Preparing to upload...")
-
-    documents = []
-    for entry in all_data:
-        doc = Document(
-            page_content=entry['content_markdown'],
-            metadata={
-                "source": entry.get('source_url', ''),
-                "citation": entry.get('citation', ''),
-                "heading": entry.get('section_heading', '')
-            }
-        )
-        documents.append(doc)
+    reader = JsonlReader("data/extracted_data.jsonl", required_keys=("source_url", "content_markdown"))
 
     # 6. Upload in Batches (with Progress Bar)
-    embeddings = GoogleGenerativeAIEmbeddings(model="models/text-embedding-004")
-    
+    # Unchanged texts are served from the local cache, only new/edited ones hit the API
+    embeddings = get_embeddings(GOOGLE_MODEL)
+    if not args.no_cache:
+        embeddings = CachedEmbeddings(embeddings, GOOGLE_MODEL, EmbeddingCache(EMBEDDING_CACHE_FILE))
+
     BATCH_SIZE = 100
-    print(f"⚡ Uploading in batches of {BATCH_SIZE}...")
+    print(f"⚡ Uploading in batches of {BATCH_SIZE} ({args.chunking} chunking)...")
 
-    for i in range(0, total_docs, BATCH_SIZE):
-        batch = documents[i : i + BATCH_SIZE]
-        
-        try:
-            PineconeVectorStore.from_documents(
-                batch,
-                embeddings,
-                index_name=INDEX_NAME
-            )
-            print(f"   👉 Progress: {min(i + BATCH_SIZE, total_docs)} / {total_docs} docs uploaded...")
-        except Exception as e:
-            print(f"   ❌ Error on batch {i}: {e}")
-            # Optional: wait a bit if rate limit hits
-            time.sleep(5)
+    batch = []
+    uploaded = 0
+    failed = deque()
+    seen_urls = set()
+    for doc in iter_documents(reader):
+        batch.append(doc)
+        seen_urls.add(doc.metadata["source"])
+        if len(batch) >= BATCH_SIZE:
+            if upload_batch(batch, uploaded):
+                uploaded += len(batch)
+            else:
+                failed.append(batch)
+            batch = []
+    if batch:
+        if upload_batch(batch, uploaded):
+            uploaded += len(batch)
+        else:
+            failed.append(batch)
+
+    # 7. Retry failed batches (chunk ids are stable, so re-uploading is idempotent)
+    for round_number in range(1, REQUEUE_ROUNDS + 1):
+        if not failed:
+            break
+        print(f"🔁 Retrying {len(failed)} failed batches (round {round_number}/{REQUEUE_ROUNDS})...")
+        for _ in range(len(failed)):
+            batch = failed.popleft()
+            if upload_batch(batch, uploaded):
+                uploaded += len(batch)
+            else:
+                failed.append(batch)
+
+    # A section counts as indexed once none of its chunks is in a failed batch
+    failed_urls = {doc.metadata["source"] for b in failed for doc in b}
+    stage = index_stage(args.backend, args.chunking)
+    state.mark(stage, [url for url in seen_urls if url not in failed_urls])
+    state.mark(stage, failed_urls, "failed", error="upload failed")
+    state.close()
+
+    print(f"\n📑 Input: {reader.summary()}")
+    if not args.no_cache:
+        print(f"💾 Embedding cache hit rate: {embeddings.cache.hit_rate():.1%} ({embeddings.api_calls} API calls)")
+    print(f"⏱️  Quota: {get_limiter('embedding').summary()}")
+    if failed:
+        missing = sum(len(b) for b in failed)
+        print(f"\n⚠️ {uploaded} chunks uploaded, {missing} still failing after {REQUEUE_ROUNDS} retry rounds.")
+        print("👉 Re-run later; cached embeddings make the second pass cheap.")
+    else:
+        print("\n✅ SUCCESS! All documents uploaded.")
+        print("👉 Now run: python agent/rag_agent.py")
+        if args.backend == "local":
+            print("   (with VECTOR_BACKEND=local in your .env)")
 
-    print("\n✅ SUCCESS! All documents uploaded.")
-    print("👉 Now run: python agent/rag_agent.py")
-    
 except FileNotFoundError:
     print("❌ Error: Could not find 'data/extracted_data.jsonl'.")
-except KeyError as e:
-    print(f"❌ Error: Your data is missing a key: {e}")
\ No newline at end of file
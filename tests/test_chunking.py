@@ -0,0 +1,82 @@
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from indexer.chunking import MAX_CHUNK_CHARS, chunk_record, next_marker, parent_id, split_paragraphs, top_level_marker
+
+
+def section(*paragraphs):
+    return "\n\n".join(paragraphs)
+
+
+def labels(text, max_chars=MAX_CHUNK_CHARS):
+    return [label for label, _ in split_paragraphs(text, max_chars)]
+
+
+def test_top_level_subsections_start_chunks():
+    text = section("Preamble " + "p" * 250, "(a) First " + "a" * 250, "(b) Second " + "b" * 250)
+    assert labels(text) == ["", "(a)", "(b)"]
+
+
+def test_history_block_is_its_own_chunk_and_footer_is_dropped():
+    text = section("(a) Rule " + "a" * 250, "History", "1. New section filed 1-1-2000.",
+                   "Note: Authority cited: Section 1.", "End of Document")
+    pieces = split_paragraphs(text)
+    assert [label for label, _ in pieces] == ["(a)", "history"]
+    assert "Authority cited" in pieces[1][1]
+    assert "End of Document" not in pieces[1][1]
+
+
+def test_roman_numerals_under_capital_items_stay_nested():
+    text = section("(a) Lead " + "a" * 250, "(1) One", "(A) Item", "(i) first numeral", "(ii) second numeral",
+                   "(v) fifth numeral", "(b) Next " + "b" * 250)
+    pieces = split_paragraphs(text)
+    assert [label for label, _ in pieces] == ["(a)", "(b)"]
+    assert "(v) fifth numeral" in pieces[0][1]
+
+
+def test_i_after_h_is_a_subsection():
+    letters = [f"({c}) Subsection {c} " + c * 250 for c in "abcdefghij"]
+    assert labels(section(*letters)) == [f"({c})" for c in "abcdefghij"]
+
+
+def test_roman_numeral_after_digits_is_nested():
+    text = section("(b) Lead " + "b" * 250, "(1) one", "(2) two", "(i) numeral under (2)", "(c) Next " + "c" * 250)
+    assert labels(text) == ["(b)", "(c)"]
+
+
+def test_nested_split_repeats_the_lead_in():
+    lead = "(a) The following apply:"
+    text = section(lead, *[f"({n}) " + "n" * 400 for n in range(1, 6)])
+    pieces = split_paragraphs(text)
+    assert len(pieces) > 1
+    assert all(label == "(a)" for label, _ in pieces)
+    assert all(piece.startswith(lead) for _, piece in pieces)
+    assert all(len(piece) <= MAX_CHUNK_CHARS for _, piece in pieces)
+
+
+def test_long_paragraph_is_cut_on_whitespace():
+    text = "(a) " + " ".join(["word"] * 1000)
+    pieces = split_paragraphs(text, max_chars=500)
+    assert all(len(piece) <= 500 for _, piece in pieces)
+    assert " ".join(piece for _, piece in pieces).split() == text.split()
+
+
+def test_marker_sequence():
+    assert next_marker("") == "(a)"
+    assert next_marker("(h)") == "(i)"
+    assert next_marker("(z)") == "(aa)"
+    assert next_marker("(aa)") == "(bb)"
+    assert top_level_marker("(x) text", "(w)") == "(x)"
+    assert top_level_marker("(x) text", "(c)") is None
+    assert top_level_marker("(i) text", "(h)", last_marker="(B)") is None
+    assert top_level_marker("(c) text", "(b)") == "(c)"
+
+
+def test_chunk_ids_are_stable_and_carry_the_parent():
+    record = {"source_url": "https://example.test/doc", "citation": "1 CCR § 1",
+              "content_markdown": section("(a) " + "a" * 250, "(b) " + "b" * 250)}
+    chunks = chunk_record(record)
+    assert [c["id"] for c in chunks] == ["https://example.test/doc#chunk-0", "https://example.test/doc#chunk-1"]
+    assert {parent_id(c["id"]) for c in chunks} == {record["source_url"]}
+    assert chunk_record(record, strategy="section")[0]["id"] == record["source_url"]
@@ -0,0 +1,98 @@
+import json
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.corpus_store import BLOCKS_FILE, INDEX_FILE, CorpusStore
+from crawler.html_store import document_guid
+
+
+def record(n, text="text"):
+    return {"source_url": f"https://example.test/Document/{n}", "citation": f"1 CCR § {n}",
+            "content_markdown": text}
+
+
+def write_lines(path, records, mode="w"):
+    with open(path, mode, encoding="utf-8") as f:
+        for r in records:
+            f.write(json.dumps(r) + "\n")
+
+
+def test_lookup_by_guid_url_and_citation(tmp_path):
+    store = CorpusStore(str(tmp_path / "corpus"))
+    assert store.append([record(n) for n in range(100)]) == 100
+    url = record(42)["source_url"]
+    assert store.get(url) == store.get(document_guid(url)) == store.get("1 CCR § 42") == record(42)
+    assert store.get("1 CCR § 999") is None
+
+    # A newer version replaces the old one, for lookups and iteration alike
+    store.append([record(42, "amended")])
+    assert store.get(url)["content_markdown"] == "amended"
+    assert len(list(store)) == len(store) == 100
+    store.close()
+
+
+def test_a_crashed_append_is_ignored_and_then_truncated(tmp_path):
+    path = str(tmp_path / "corpus")
+    store = CorpusStore(path)
+    store.append([record(n) for n in range(40)])
+    store.close()
+    committed = {name: os.path.getsize(os.path.join(path, name)) for name in (BLOCKS_FILE, INDEX_FILE)}
+
+    # A crash after writing the data but before the manifest moved over it
+    with open(os.path.join(path, BLOCKS_FILE), "ab") as f:
+        f.write(b"\x00half a block")
+    with open(os.path.join(path, INDEX_FILE), "ab") as f:
+        f.write(json.dumps({"guid": "ghost", "url": "https://example.test/ghost", "citation": "",
+                            "offset": committed[BLOCKS_FILE], "length": 13, "slot": 0}).encode() + b"\n{torn")
+
+    reopened = CorpusStore(path)
+    assert len(reopened) == 40 and "ghost" not in reopened
+    assert reopened.get(record(39)["source_url"]) == record(39)
+
+    reopened.append([record(40)])
+    assert os.path.getsize(os.path.join(path, INDEX_FILE)) > committed[INDEX_FILE]
+    reopened.close()
+    again = CorpusStore(path)
+    assert len(again) == 41 and "ghost" not in again
+    assert [r["source_url"] for r in again] == [record(n)["source_url"] for n in range(41)]
+    again.close()
+
+
+def test_sync_ingests_only_appended_lines(tmp_path):
+    source = str(tmp_path / "extracted.jsonl")
+    write_lines(source, [record(n) for n in range(10)])
+    store = CorpusStore(str(tmp_path / "corpus"))
+    assert store.sync(source) == 10
+    assert store.sync(source) == 0
+
+    write_lines(source, [record(n) for n in range(10, 15)], mode="a")
+    assert store.sync(source) == 5
+    assert len(store) == 15
+    store.close()
+
+    # A fresh process resumes from the manifest's offset
+    reopened = CorpusStore(str(tmp_path / "corpus"))
+    write_lines(source, [record(15)], mode="a")
+    assert reopened.sync(source) == 1
+    reopened.close()
+
+
+def test_replaced_source_rebuilds_the_store(tmp_path):
+    source = str(tmp_path / "extracted.jsonl")
+    write_lines(source, [record(n) for n in range(10)])
+    store = CorpusStore(str(tmp_path / "corpus"))
+    store.sync(source)
+
+    # Rewritten in place of the old file (--reparse, refresh.py): sections 0-2 gone, 3 changed
+    replacement = str(tmp_path / "extracted.jsonl.tmp")
+    write_lines(replacement, [record(3, "reparsed")] + [record(n) for n in range(4, 12)])
+    os.replace(replacement, source)
+
+    assert store.sync(source) == 9
+    assert len(store) == 9
+    assert store.get(record(0)["source_url"]) is None
+    assert store.get(record(3)["source_url"])["content_markdown"] == "reparsed"
+    assert not os.path.exists(str(tmp_path / "corpus.old"))
+    assert not os.path.exists(str(tmp_path / "corpus.tmp"))
+    store.close()
@@ -0,0 +1,90 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from indexer.local_index import LocalVectorIndex, hamming, quantize
+
+DIMENSION = 64
+ROWS = 2000
+
+
+@pytest.fixture
+def vectors():
+    rng = np.random.default_rng(7)
+    return rng.standard_normal((ROWS, DIMENSION)).astype(np.float32)
+
+
+def build(path, vectors, quantization):
+    index = LocalVectorIndex.create(str(path), dimension=DIMENSION, model="test", quantization=quantization)
+    index.upsert([{"id": f"v{i}", "values": v, "metadata": {"part": i % 4}} for i, v in enumerate(vectors)])
+    return LocalVectorIndex(str(path))
+
+
+def exact_top(vectors, query, k):
+    unit = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    scores = unit @ (query / np.linalg.norm(query))
+    best = np.argsort(-scores)[:k]
+    return [int(r) for r in best], scores[best]
+
+
+@pytest.mark.parametrize("quantization", ["int8", "binary"])
+def test_quantized_search_rescores_with_exact_scores(tmp_path, vectors, quantization):
+    index = build(tmp_path / "index", vectors, quantization)
+    rng = np.random.default_rng(11)
+    for _ in range(10):
+        # A query close to a known row: that row must come back first with its exact cosine
+        target = int(rng.integers(ROWS))
+        query = vectors[target] + 0.05 * rng.standard_normal(DIMENSION).astype(np.float32)
+        results = index.search(query, top_k=5)[0]
+        rows, expected = exact_top(vectors, query, 5)
+        assert results[0][0] == target == rows[0]
+        assert results[0][1] == pytest.approx(float(expected[0]), abs=1e-5)
+        # Scores are full-precision and best first, not code-space approximations
+        scores = [score for _, score in results]
+        assert scores == sorted(scores, reverse=True)
+        assert len(results) == 5 and index.oversample * 5 < ROWS
+
+
+def test_int8_recall_matches_exact_search(tmp_path, vectors):
+    index = build(tmp_path / "index", vectors, "int8")
+    rng = np.random.default_rng(3)
+    queries = rng.standard_normal((20, DIMENSION)).astype(np.float32)
+    hits = 0
+    for query, results in zip(queries, index.search(queries, top_k=10)):
+        rows, _ = exact_top(vectors, query, 10)
+        hits += len(set(rows) & {row for row, _ in results})
+    assert hits / (20 * 10) >= 0.95
+
+
+def test_exact_flag_and_requantize(tmp_path, vectors):
+    index = build(tmp_path / "index", vectors, "none")
+    query = vectors[42]
+    plain = index.search(query, top_k=3)[0]
+    index.quantize("binary")
+    index = LocalVectorIndex(str(tmp_path / "index"))
+    assert index.quantization == "binary"
+    assert index.search(query, top_k=3, exact=True)[0] == plain
+    assert index.search(query, top_k=3)[0][0] == plain[0]
+
+
+def test_quantized_search_skips_deleted_rows_and_honours_filters(tmp_path, vectors):
+    index = build(tmp_path / "index", vectors, "int8")
+    query = vectors[100]
+    assert index.search(query, top_k=1)[0][0][0] == 100
+    index.delete(["v100"])
+    assert all(row != 100 for row, _ in index.search(query, top_k=5)[0])
+
+    matches = index.query(vectors[101], top_k=5, filter={"part": {"$eq": 1}})
+    assert matches[0]["id"] == "v101"
+    assert all(match["metadata"]["part"] == 1 for match in matches)
+
+
+def test_hamming_counts_differing_bits():
+    a = np.array([[1.0, -1.0] * 32], dtype=np.float32)
+    b = np.array([[1.0, 1.0] * 32, [1.0, -1.0] * 32], dtype=np.float32)
+    query_bits, _ = quantize(a, "binary")
+    codes, _ = quantize(b, "binary")
+    assert hamming(query_bits, codes).tolist() == [[32, 0]]
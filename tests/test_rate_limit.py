@@ -0,0 +1,124 @@
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common import rate_limit
+from common.rate_limit import (BASE_DELAY, MAX_DELAY, MAX_RETRIES, MIN_SCALE, RECOVERY_FACTOR, QuotaLimiter,
+                               is_rate_limit, is_retryable, retry_after)
+
+
+class Response:
+    def __init__(self, headers):
+        self.headers = headers
+
+
+class HttpError(Exception):
+    def __init__(self, message, headers=None):
+        super().__init__(message)
+        self.response = Response(headers or {})
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """Records sleeps instead of taking them; jitter always picks the upper bound."""
+    slept = []
+    monkeypatch.setattr(rate_limit.time, "sleep", slept.append)
+    monkeypatch.setattr(rate_limit.random, "uniform", lambda low, high: high)
+    return slept
+
+
+def flaky(errors, result="ok"):
+    calls = []
+
+    def fn(*args, **kwargs):
+        calls.append((args, kwargs))
+        if len(calls) <= len(errors):
+            raise errors[len(calls) - 1]
+        return result
+    return fn, calls
+
+
+def test_retry_after_hints():
+    assert retry_after(Exception("429 RESOURCE_EXHAUSTED. Please retry in 19.5s.")) == 19.5
+    assert retry_after(Exception("429 ... 'retryDelay': '7s'")) == 7.0
+    assert retry_after(HttpError("429 Too Many Requests", {"Retry-After": "3"})) == 3.0
+    # A header that isn't a number falls back to the message
+    assert retry_after(HttpError("429, retry after 4 seconds", {"Retry-After": "soon"})) == 4.0
+    assert retry_after(Exception("429 Too Many Requests")) is None
+
+
+def test_error_classification():
+    assert is_rate_limit(Exception("429 RESOURCE_EXHAUSTED"))
+    assert not is_rate_limit(Exception("503 UNAVAILABLE"))
+    assert is_retryable(Exception("503 UNAVAILABLE"))
+    assert is_retryable(TimeoutError())
+    assert not is_retryable(ValueError("400 INVALID_ARGUMENT"))
+
+
+def test_backoff_doubles_up_to_the_cap(sleeps):
+    limiter = QuotaLimiter("test", rpm=60)
+    error = Exception("503 UNAVAILABLE")
+    delays = [limiter.backoff(error, attempt) for attempt in range(MAX_RETRIES)]
+    assert delays == [min(MAX_DELAY, BASE_DELAY * 2 ** attempt) for attempt in range(MAX_RETRIES)]
+    with pytest.raises(Exception, match="503"):
+        limiter.backoff(error, MAX_RETRIES)
+    # Transient errors retry without shrinking the quota
+    assert limiter.scale == 1.0 and limiter.rate_limited == 0
+
+
+def test_rate_limit_shrinks_the_quota_and_pauses_callers(sleeps):
+    limiter = QuotaLimiter("test", rpm=60)
+    delay = limiter.backoff(Exception("429 RESOURCE_EXHAUSTED. Please retry in 5s."), 0)
+    assert delay == 5 + BASE_DELAY
+    assert limiter.scale == 0.5
+    # Every caller now waits out the pause, whatever tokens the bucket had
+    assert limiter.acquire() >= delay - 0.5
+    for attempt in range(10):
+        limiter.backoff(Exception("429"), 0)
+    assert limiter.scale == MIN_SCALE
+    assert limiter.rate_limited == 11
+
+
+def test_successes_restore_the_quota(sleeps):
+    limiter = QuotaLimiter("test", rpm=60)
+    limiter.backoff(Exception("429"), 0)
+    for _ in range(10):
+        limiter.record_success()
+    assert limiter.scale == pytest.approx(0.5 * RECOVERY_FACTOR ** 10)
+    for _ in range(10):
+        limiter.record_success()
+    assert limiter.scale == 1.0
+
+
+def test_call_retries_rate_limits_then_returns(sleeps):
+    limiter = QuotaLimiter("test", rpm=6000)
+    fn, calls = flaky([Exception("429 Too Many Requests"), Exception("503 UNAVAILABLE")])
+    assert limiter.call(fn, "prompt", tokens=10, temperature=0) == "ok"
+    assert calls == [(("prompt",), {"temperature": 0})] * 3
+    assert limiter.retries == 2 and limiter.rate_limited == 1
+    assert BASE_DELAY in sleeps and BASE_DELAY * 2 in sleeps
+
+
+def test_call_raises_non_retryable_errors_at_once(sleeps):
+    limiter = QuotaLimiter("test", rpm=6000)
+    fn, calls = flaky([ValueError("400 INVALID_ARGUMENT")])
+    with pytest.raises(ValueError):
+        limiter.call(fn)
+    assert len(calls) == 1 and limiter.retries == 0
+
+
+def test_call_gives_up_after_max_retries(sleeps):
+    limiter = QuotaLimiter("test", rpm=6000)
+    fn, calls = flaky([Exception("503 UNAVAILABLE")] * (MAX_RETRIES + 1))
+    with pytest.raises(Exception, match="503"):
+        limiter.call(fn)
+    assert len(calls) == MAX_RETRIES + 1
+
+
+def test_reservations_beyond_the_burst_wait_their_turn(sleeps):
+    limiter = QuotaLimiter("test", rpm=60)  # One request a second, a burst of two
+    waits = [limiter.acquire() for _ in range(4)]
+    assert waits[:2] == [0, 0]
+    assert waits[2] == pytest.approx(1.0, abs=0.1) and waits[3] == pytest.approx(2.0, abs=0.1)
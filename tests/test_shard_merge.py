@@ -0,0 +1,86 @@
+import json
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from crawler.shard_extract import merge_shards, shard_file
+
+
+def record(n, text="text", retrieved_at="2024-01-01T00:00:00"):
+    return {"source_url": f"https://example.test/Document/{n}", "content_markdown": text, "retrieved_at": retrieved_at}
+
+
+def write_lines(path, records, tail=""):
+    with open(path, "w", encoding="utf-8") as f:
+        for r in records:
+            f.write(json.dumps(r) + "\n")
+        f.write(tail)
+
+
+def read(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def test_newest_copy_of_each_url_wins(tmp_path):
+    shards, output = tmp_path / "shards", tmp_path / "out.jsonl"
+    shards.mkdir()
+    write_lines(shard_file(0, shards), [record(1, "old", "2024-01-01"), record(2)])
+    write_lines(shard_file(1, shards), [record(1, "new", "2024-02-01"), record(3)])
+
+    assert merge_shards(str(output), str(shards)) == 3
+    merged = {r["source_url"]: r["content_markdown"] for r in read(output)}
+    assert merged == {record(1)["source_url"]: "new", record(2)["source_url"]: "text",
+                      record(3)["source_url"]: "text"}
+    assert os.listdir(shards) == []
+
+
+def test_ties_go_to_the_later_shard_line(tmp_path):
+    shards, output = tmp_path / "shards", tmp_path / "out.jsonl"
+    shards.mkdir()
+    write_lines(shard_file(0, shards), [record(1, "first")])
+    write_lines(shard_file(1, shards), [record(1, "second"), record(1, "third")])
+
+    assert merge_shards(str(output), str(shards)) == 1
+    assert [r["content_markdown"] for r in read(output)] == ["third"]
+
+
+def test_records_the_output_already_holds_are_skipped(tmp_path):
+    shards, output = tmp_path / "shards", tmp_path / "out.jsonl"
+    shards.mkdir()
+    write_lines(output, [record(1), record(2, "before")])
+    write_lines(shard_file(0, shards), [record(1), record(2, "after"), record(3)])
+
+    # Same URL and text: skipped; same URL, new text: appended
+    assert merge_shards(str(output), str(shards)) == 2
+    assert [r["content_markdown"] for r in read(output)] == ["text", "before", "after", "text"]
+
+
+def test_merging_again_after_a_crash_adds_nothing(tmp_path):
+    shards, output = tmp_path / "shards", tmp_path / "out.jsonl"
+    shards.mkdir()
+    records = [record(n) for n in range(5)]
+    write_lines(shard_file(0, shards), records)
+    merge_shards(str(output), str(shards))
+
+    # A coordinator killed after appending but before deleting the shards
+    write_lines(shard_file(0, shards), records)
+    assert merge_shards(str(output), str(shards)) == 0
+    assert len(read(output)) == 5
+
+
+def test_torn_last_line_does_not_swallow_the_first_merged_record(tmp_path):
+    shards, output = tmp_path / "shards", tmp_path / "out.jsonl"
+    shards.mkdir()
+    write_lines(output, [record(1)], tail='{"source_url": "https://exa')
+    write_lines(shard_file(0, shards), [record(2)])
+
+    assert merge_shards(str(output), str(shards)) == 1
+    with open(output, "r", encoding="utf-8") as f:
+        lines = f.read().splitlines()
+    assert json.loads(lines[-1]) == record(2)
+
+
+def test_no_shards_is_a_no_op(tmp_path):
+    assert merge_shards(str(tmp_path / "out.jsonl"), str(tmp_path)) == 0
+    assert not (tmp_path / "out.jsonl").exists()
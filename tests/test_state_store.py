@@ -0,0 +1,101 @@
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.state_store import EXTRACT, StateStore
+
+KEYS = [f"https://example.test/Document/{n}" for n in range(10)]
+
+
+@pytest.fixture
+def state(tmp_path):
+    store = StateStore(str(tmp_path / "state.sqlite"), migrate=False)
+    store.add(EXTRACT, KEYS)
+    yield store
+    store.close()
+
+
+def test_claims_are_disjoint(state):
+    first = state.claim(EXTRACT, worker="host:1:1", limit=4)
+    second = state.claim(EXTRACT, worker="host:2:1", limit=4)
+    third = state.claim(EXTRACT, worker="host:3:1", limit=4)
+    assert len(first) == len(second) == 4 and len(third) == 2
+    assert set(first) | set(second) | set(third) == set(KEYS)
+    assert not set(first) & set(second)
+    assert state.claim(EXTRACT, worker="host:4:1", limit=4) == []
+    assert state.counts(EXTRACT)[EXTRACT] == {"claimed": 10}
+
+
+def test_renew_returns_only_the_keys_still_held(state):
+    mine = state.claim(EXTRACT, worker="host:1:1", limit=3)
+    theirs = state.claim(EXTRACT, worker="host:2:1", limit=3)
+    state.mark(EXTRACT, mine[:1])
+    assert state.renew(EXTRACT, mine + theirs, worker="host:1:1") == mine[1:]
+
+
+def test_expired_lease_is_claimable_again(state):
+    stale = state.claim(EXTRACT, worker="host:1:1", limit=10, lease=-1)
+    # The dead worker's keys go to the next claim and the old owner loses them
+    assert sorted(state.claim(EXTRACT, worker="host:2:1", limit=10)) == sorted(stale)
+    assert state.renew(EXTRACT, stale, worker="host:1:1") == []
+
+
+def test_max_attempts_stops_reclaiming(state):
+    for attempt in range(2):
+        assert len(state.claim(EXTRACT, worker=f"host:{attempt}:1", limit=10, lease=-1, max_attempts=2)) == 10
+    assert state.claim(EXTRACT, worker="host:9:1", limit=10, max_attempts=2) == []
+    assert state.history(KEYS[0])[0][2] == 2
+
+
+def test_release_by_owner_prefix(state):
+    dead = state.claim(EXTRACT, worker="host:1:7", limit=3) + state.claim(EXTRACT, worker="host:1:8", limit=3)
+    alive = state.claim(EXTRACT, worker="host:12:1", limit=3)
+    # "host:1:" must not match "host:12:"
+    assert state.release(EXTRACT, "host:1:") == 6
+    assert state.keys(EXTRACT, "pending") == set(dead) | (set(KEYS) - set(dead) - set(alive))
+    assert state.keys(EXTRACT, "claimed") == set(alive)
+    assert state.history(dead[0])[0][2] == 1  # The attempt stays counted
+
+
+def test_mark_drops_the_claim(state):
+    claimed = state.claim(EXTRACT, worker="host:1:1", limit=2)
+    state.mark(EXTRACT, claimed[:1])
+    state.mark(EXTRACT, claimed[1:], status="failed", error="timeout")
+    assert state.status(EXTRACT, claimed[0]) == "done"
+    assert state.status(EXTRACT, claimed[1]) == "failed"
+    assert state.release(EXTRACT, "host:1:") == 0
+    assert state.renew(EXTRACT, claimed, worker="host:1:1") == []
+
+
+def test_retry_failed_honours_max_attempts(state):
+    once = state.claim(EXTRACT, worker="host:1:1", limit=2)
+    state.mark(EXTRACT, once, status="failed")
+    state.claim(EXTRACT, worker="host:1:1", limit=8)  # The other eight, no failures yet
+    assert state.retry_failed(EXTRACT, max_attempts=1) == 0
+    assert state.retry_failed(EXTRACT, max_attempts=2) == 2
+    assert state.keys(EXTRACT, "pending") == set(once)
+
+    state.mark(EXTRACT, once, status="failed")
+    assert state.retry_failed(EXTRACT) == 2
+    assert state.history(once[0])[0][2] == 0
+
+
+def test_forget_removes_only_the_given_keys(state):
+    other = "index:local:paragraph"
+    state.mark(other, KEYS[:2])
+    assert state.forget(EXTRACT, KEYS[:2] + ["https://example.test/unknown"]) == 2
+    assert state.keys(EXTRACT, None) == set(KEYS[2:])
+    assert state.keys(other) == set(KEYS[:2])
+
+
+def test_buffered_writes_survive_reopening(tmp_path):
+    path = str(tmp_path / "state.sqlite")
+    store = StateStore(path, migrate=False)
+    store.add(EXTRACT, KEYS[:3])
+    store.mark(EXTRACT, KEYS[:1])
+    store.close()
+    reopened = StateStore(path, migrate=False)
+    assert reopened.counts(EXTRACT)[EXTRACT] == {"done": 1, "pending": 2}
+    reopened.close()